@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Opt-in (QUERY_INSTRUMENTATION below), removes itself otherwise
+    'scheduler.instrumentation.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'PythonProject.urls'
@@ -75,11 +78,65 @@ WSGI_APPLICATION = 'PythonProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Profile picked from the environment:
+# - SQLite (default, small installs): WAL journal so readers never block the
+#   writer, writers take the lock when their transaction starts (IMMEDIATE) and
+#   wait up to DB_TIMEOUT seconds for it instead of failing with "database is locked"
+# - PostgreSQL (DB_ENGINE=postgresql, needs psycopg): DB_NAME, DB_USER, DB_PASSWORD,
+#   DB_HOST, DB_PORT; double bookings are also refused by exclusion constraints
+#   (migration 0008). DB_POOL=1 uses a psycopg connection pool (psycopg[pool])
+# Connections are kept DB_CONN_MAX_AGE seconds and checked before being reused
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'fstt_scheduler'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # The pool keeps the connections: persistent connections must be off
+        DATABASES['default']['OPTIONS'] = {'pool': True}
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            },
+        }
     }
+
+
+# Cache shared by the web and worker processes (timetable grids, week index).
+# File based so that invalidations done by run_generation_worker reach the web server
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'fstt_scheduler_cache'),
+    },
+    # Timetable edit revision (scheduler/week_index.py), that exports, feeds and
+    # dashboard caches are keyed on: a few keys of its own that are never
+    # culled or expired with the default cache
+    'revisions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'fstt_scheduler_revisions'),
+        'TIMEOUT': None,
+    },
 }
 
 
@@ -135,4 +192,27 @@ LOGOUT_ON_GET = True
 MEDIA_URL = '/media/'
 
 # Path where media is stored on your computer
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Generated Excel/PDF exports, reused while the published timetable is unchanged
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fstt_scheduler_exports')
+# Processes pre-rendering every teacher/group/filière PDF after a generation job (0: off)
+PDF_PRERENDER_WORKERS = 4
+# Threads hashing the passwords of imported teachers/students (0: one per CPU)
+IMPORT_HASH_WORKERS = 0
+
+# SQL instrumentation: query count / SQL time / duplicates per URL name,
+# visible on /instrumentation/queries/. Enable with QUERY_INSTRUMENTATION=1
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION') == '1'
+# Raise instead of logging a warning when a view goes over budget (for tests)
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE') == '1'
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGETS = {
+    'admin_dashboard': 15,
+    'teacher_dashboard': 10,
+    'student_dashboard': 10,
+    'teacher_timetable': 8,
+    'student_timetable': 8,
+    'timetable': 8,
+    'approve_reservations': 6,
+}
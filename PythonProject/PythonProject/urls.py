@@ -40,6 +40,7 @@ urlpatterns = [
     path('teachers/', views.teacher_list, name='teacher_list'),
     path('timetable/', views.timetable_view, name='timetable'),
     path('teachers/add/', views.add_teacher, name='add_teacher'),
+    path('import/', views.import_data, name='import_data'),
 
    # Connect the Scheduler app URLs
     path('scheduler/', include('scheduler.urls')),
@@ -54,7 +55,11 @@ urlpatterns = [
     path('timetable/teacher/', views.teacher_timetable, name='teacher_timetable'),
     
     path('reservations/process/<int:req_id>/<str:action>/', views.process_request, name='process_request'),
+    path('reservations/approve-all/', views.approve_all_reservations, name='approve_all_reservations'),
     path('generate_timetable/', views.generate_timetable, name='generate_timetable'),
+    path('generate_timetable/status/<int:job_id>/', views.generation_status, name='generation_status'),
+    path('generate_timetable/cancel/<int:job_id>/', views.cancel_generation, name='cancel_generation'),
+    path('instrumentation/queries/', views.query_stats, name='query_stats'),
     #---Adjii's additions for generate schedule--
     path('export/csv/', views.export_timetable_csv, name='export_timetable_csv'),
     path('timetable/print/', views.student_timetable, name='student_timetable'),
@@ -68,6 +73,8 @@ urlpatterns = [
     
     # to import the timetables
     path('export/excel/', views.export_excel, name='export_excel'),
+    path('export/pdf/', views.export_pdf, name='export_pdf'),
+    path('calendar/<str:kind>/<int:entity_id>/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
     
 
 ]
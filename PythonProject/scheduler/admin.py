@@ -1,9 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     User, Level, Filiere, StudentGroup, Room, Course, 
-    ScheduledSession, ReservationRequest, TeacherUnavailability
+    ScheduledSession, ReservationRequest, TeacherUnavailability, GenerationJob,
+    TimetableVersion, AcademicTerm, ArchivedSession, ArchivedReservation,
+    ArchivedUnavailability, TimetableEntry
 )
+from . import entries, grid, week_index
+from .approvals import approve_pending
 
 # ============= USER ADMIN =============
 class CustomUserAdmin(UserAdmin):
@@ -49,29 +53,143 @@ class CourseAdmin(admin.ModelAdmin):
     list_filter = ['session_type', 'filiere__level', 'filiere']
     search_fields = ['name', 'code']
 
+    def get_queryset(self, request):
+        # Head count annotated in SQL (no per-row StudentGroup query)
+        return super().get_queryset(request).with_student_count().select_related(
+            'filiere__level', 'group__filiere', 'teacher'
+        )
+
+    @admin.display(description='Student count', ordering='annotated_student_count')
+    def student_count(self, obj):
+        return obj.student_count
+
 
 @admin.register(ScheduledSession)
 class ScheduledSessionAdmin(admin.ModelAdmin):
     list_display = ['course', 'room', 'day', 'start_hour', 'end_hour']
     list_filter = ['day', 'course__filiere']
+    # str(course) reads the group and filière: joined once, not queried per row
+    list_select_related = ['course__group__filiere', 'course__filiere', 'room']
+
+
+@admin.register(TimetableEntry)
+class TimetableEntryAdmin(admin.ModelAdmin):
+    """The published timetable as users see it, read-only (one table, no join)"""
+    list_display = ['course_name', 'session_type', 'teacher_name', 'room_name', 'filiere_code', 'group_name',
+                    'day', 'start_hour', 'end_hour']
+    list_filter = ['kind', 'day', 'session_type', 'filiere_code']
+    search_fields = ['course_name', 'teacher_name', 'room_name']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(ReservationRequest)
 class ReservationRequestAdmin(admin.ModelAdmin):
-    list_display = ['teacher', 'room', 'day', 'start_hour', 'status', 'created_at']
+    list_display = ['teacher', 'room', 'day', 'start_hour', 'status', 'decision_note', 'created_at']
     list_filter = ['status', 'day']
     actions = ['approve_requests', 'reject_requests']
     
     def approve_requests(self, request, queryset):
-        queryset.update(status='APPROVED')
-    approve_requests.short_description = "Approve selected requests"
+        # Conflict-checked: requests clashing with the timetable or each other are rejected
+        decisions = approve_pending(list(queryset.values_list('id', flat=True)))
+        rejected = [d for d in decisions if not d.approved]
+        self.message_user(request, f"{len(decisions) - len(rejected)} approved, {len(rejected)} rejected.")
+        for decision in rejected:
+            r = decision.reservation
+            self.message_user(
+                request, f"#{r.id} {r.room.name} {r.day} {r.start_hour}h-{r.end_hour}h: {decision.reason}",
+                level=messages.WARNING,
+            )
+    approve_requests.short_description = "Approve selected requests (conflict-checked)"
     
     def reject_requests(self, request, queryset):
-        queryset.update(status='REJECTED')
+        self.set_status(queryset, 'REJECTED')
     reject_requests.short_description = "Reject selected requests"
 
+    @staticmethod
+    def set_status(queryset, status):
+        # update() sends no signal: refresh the entries, drop the cached teacher grids and week index here
+        rows = list(queryset.values_list('id', 'teacher_id'))
+        queryset.update(status=status)
+        entries.refresh_reservations(id__in=[reservation_id for reservation_id, _ in rows])
+        for teacher_id in {teacher_id for _, teacher_id in rows}:
+            grid.invalidate('teacher', teacher_id)
+        week_index.invalidate()
+
 
 @admin.register(TeacherUnavailability)
 class TeacherUnavailabilityAdmin(admin.ModelAdmin):
     list_display = ['teacher', 'day', 'start_hour', 'end_hour']
-    list_filter = ['day', 'teacher']
\ No newline at end of file
+    list_filter = ['day', 'teacher']
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'progress_done', 'progress_total', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['status']
+
+
+@admin.register(TimetableVersion)
+class TimetableVersionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'label', 'is_published', 'created_at', 'published_at', 'stats']
+    list_filter = ['is_published']
+    actions = ['publish_version']
+
+    def publish_version(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one version to publish.", level='error')
+            return
+        version = queryset.first()
+        version.publish()
+        self.message_user(request, f"{version} is now published.")
+    publish_version.short_description = "Publish (roll back to) selected version"
+
+
+# ============= ACADEMIC TERMS =============
+@admin.register(AcademicTerm)
+class AcademicTermAdmin(admin.ModelAdmin):
+    list_display = ['name', 'start_date', 'end_date', 'is_active', 'archived_at']
+    list_filter = ['is_active']
+    readonly_fields = ['is_active', 'archived_at']
+    actions = ['activate_term']
+
+    def activate_term(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one term to activate.", level='error')
+            return
+        term = queryset.first()
+        try:
+            term.activate()
+        except ValueError as e:
+            self.message_user(request, str(e), level='error')
+            return
+        self.message_user(request, f"{term.name} is now the active term.")
+    activate_term.short_description = "Activate selected term (and publish its latest timetable)"
+
+
+@admin.register(ArchivedSession)
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ['course_name', 'session_type', 'teacher_name', 'filiere_code', 'group_name', 'room_name', 'day', 'start_hour', 'end_hour']
+    list_filter = ['term', 'session_type', 'day']
+    search_fields = ['course_name', 'teacher_name', 'room_name']
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(admin.ModelAdmin):
+    list_display = ['teacher_name', 'room_name', 'day', 'start_hour', 'end_hour', 'status', 'created_at']
+    list_filter = ['term', 'status']
+    search_fields = ['teacher_name', 'room_name']
+
+
+@admin.register(ArchivedUnavailability)
+class ArchivedUnavailabilityAdmin(admin.ModelAdmin):
+    list_display = ['teacher_name', 'day', 'start_hour', 'end_hour']
+    list_filter = ['term', 'day']
+    search_fields = ['teacher_name']
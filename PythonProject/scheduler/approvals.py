@@ -0,0 +1,105 @@
+"""
+Batch approval of room reservation requests.
+
+All pending requests and the current occupancy (published sessions and
+approved reservations, per room and per teacher) are loaded once, as
+hour bitmasks like the occupancy matrix. Requests are then taken first
+come, first served: each one is approved if it conflicts neither with
+the timetable nor with a request approved before it in the batch, so the
+approved set is maximal. Everything is written in one transaction, with
+the reason of each rejection stored on the request.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import IntegrityError, transaction
+
+from . import entries, grid, week_index
+from .models import ReservationRequest, ScheduledSession
+from .occupancy import range_mask
+
+
+Decision = namedtuple('Decision', ['reservation', 'approved', 'reason'])
+
+
+def _masks(rows):
+    masks = defaultdict(int)
+    for key, day, start, end in rows:
+        masks[key] |= range_mask(day, start, end)
+    return masks
+
+
+def _conflict(reservation, mask, busy):
+    """Why the reservation can't be approved, None if it can"""
+    if not mask:
+        return "Créneau invalide."
+    if busy['room_sessions'][reservation.room_id] & mask:
+        return f"La salle {reservation.room.name} a cours à ce créneau."
+    if busy['room_reservations'][reservation.room_id] & mask:
+        return f"La salle {reservation.room.name} est déjà réservée à ce créneau."
+    if busy['teacher_sessions'][reservation.teacher_id] & mask:
+        return "L'enseignant a cours à ce créneau."
+    if busy['teacher_reservations'][reservation.teacher_id] & mask:
+        return "L'enseignant a déjà une réservation à ce créneau."
+    return None
+
+
+def approve_pending(reservation_ids=None):
+    """
+    Approve the pending requests (all, or only reservation_ids) that fit,
+    reject the others. Returns one Decision per request, oldest first.
+    """
+    try:
+        return _approve_pending(reservation_ids)
+    except IntegrityError:
+        # PostgreSQL exclusion constraint: a concurrent batch approved an overlapping
+        # request first. Its approvals are committed now, so the retry rejects ours
+        return _approve_pending(reservation_ids)
+
+
+@transaction.atomic
+def _approve_pending(reservation_ids):
+    pending = ReservationRequest.objects.select_for_update().filter(status='PENDING')
+    if reservation_ids is not None:
+        pending = pending.filter(id__in=reservation_ids)
+    pending = list(pending.select_related('room').order_by('created_at', 'id'))
+    if not pending:
+        return []
+
+    sessions = list(ScheduledSession.objects.values_list(
+        'room_id', 'course__teacher_id', 'day', 'start_hour', 'end_hour'
+    ))
+    approved = list(ReservationRequest.objects.filter(status='APPROVED').values_list(
+        'room_id', 'teacher_id', 'day', 'start_hour', 'end_hour'
+    ))
+    busy = {
+        'room_sessions': _masks((room, day, start, end) for room, _, day, start, end in sessions),
+        'teacher_sessions': _masks((teacher, day, start, end) for _, teacher, day, start, end in sessions),
+        'room_reservations': _masks((room, day, start, end) for room, _, day, start, end in approved),
+        'teacher_reservations': _masks((teacher, day, start, end) for _, teacher, day, start, end in approved),
+    }
+
+    decisions = []
+    for reservation in pending:
+        mask = range_mask(reservation.day, reservation.start_hour, reservation.end_hour)
+        reason = _conflict(reservation, mask, busy)
+        if reason is None:
+            # Later requests of the batch must not overlap this one
+            busy['room_reservations'][reservation.room_id] |= mask
+            busy['teacher_reservations'][reservation.teacher_id] |= mask
+        reservation.status = 'APPROVED' if reason is None else 'REJECTED'
+        reservation.decision_note = reason or ''
+        decisions.append(Decision(reservation, reason is None, reason))
+
+    ReservationRequest.objects.bulk_update(pending, ['status', 'decision_note'], batch_size=500)
+    entries.refresh_reservations(id__in=[r.id for r in pending])
+
+    # bulk_update() sends no signal (entries refreshed above): drop the cached teacher grids and week index once committed
+    teacher_ids = {d.reservation.teacher_id for d in decisions}
+    transaction.on_commit(lambda: _invalidate(teacher_ids))
+    return decisions
+
+
+def _invalidate(teacher_ids):
+    for teacher_id in teacher_ids:
+        grid.invalidate('teacher', teacher_id)
+    week_index.invalidate()
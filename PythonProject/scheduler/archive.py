@@ -0,0 +1,111 @@
+"""
+Archiving of closed academic terms.
+
+The live session, reservation and unavailability tables only keep the
+terms still in use, so the timetable, approval and export queries never
+read past semesters. archive_term() copies the last timetable of a term,
+its reservation requests and its teacher unavailabilities to the archive
+tables, flattened to names, then deletes the live rows and timetable
+versions of the term, in one transaction.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    AcademicTerm, ArchivedReservation, ArchivedSession, ArchivedUnavailability, ReservationRequest,
+    ScheduledSession, TeacherUnavailability, TimetableVersion
+)
+
+
+ARCHIVE_BATCH_SIZE = 2000
+
+
+def _full_name(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def closed_terms():
+    """Terms that are over (end date passed, not active) and not archived yet"""
+    return AcademicTerm.objects.filter(
+        is_active=False, archived_at__isnull=True, end_date__lt=timezone.localdate()
+    )
+
+
+def _archive_sessions(term, version):
+    rows = ScheduledSession.all_versions.filter(term=term, version=version).values_list(
+        'course__name', 'course__session_type', 'course__teacher__first_name', 'course__teacher__last_name',
+        'course__teacher__username', 'course__filiere__code', 'course__group__name', 'room__name',
+        'day', 'start_hour', 'end_hour',
+    )
+    archived = ArchivedSession.objects.bulk_create((
+        ArchivedSession(
+            term=term, course_name=name, session_type=session_type,
+            teacher_name=_full_name(first_name, last_name, username),
+            filiere_code=filiere_code, group_name=group_name or '', room_name=room,
+            day=day, start_hour=start, end_hour=end,
+        )
+        for (name, session_type, first_name, last_name, username, filiere_code, group_name, room,
+             day, start, end) in rows.iterator(chunk_size=ARCHIVE_BATCH_SIZE)
+    ), batch_size=ARCHIVE_BATCH_SIZE)
+    return len(archived)
+
+
+def _archive_reservations(term):
+    rows = ReservationRequest.all_terms.filter(term=term).values_list(
+        'teacher__first_name', 'teacher__last_name', 'teacher__username', 'room__name',
+        'day', 'start_hour', 'end_hour', 'status', 'reason', 'created_at',
+    )
+    archived = ArchivedReservation.objects.bulk_create((
+        ArchivedReservation(
+            term=term, teacher_name=_full_name(first_name, last_name, username), room_name=room,
+            day=day, start_hour=start, end_hour=end, status=status, reason=reason, created_at=created_at,
+        )
+        for (first_name, last_name, username, room, day, start, end, status, reason, created_at)
+        in rows.iterator(chunk_size=ARCHIVE_BATCH_SIZE)
+    ), batch_size=ARCHIVE_BATCH_SIZE)
+    return len(archived)
+
+
+def _archive_unavailabilities(term):
+    rows = TeacherUnavailability.all_terms.filter(term=term).values_list(
+        'teacher__first_name', 'teacher__last_name', 'teacher__username', 'day', 'start_hour', 'end_hour',
+    )
+    archived = ArchivedUnavailability.objects.bulk_create((
+        ArchivedUnavailability(
+            term=term, teacher_name=_full_name(first_name, last_name, username),
+            day=day, start_hour=start, end_hour=end,
+        )
+        for (first_name, last_name, username, day, start, end) in rows.iterator(chunk_size=ARCHIVE_BATCH_SIZE)
+    ), batch_size=ARCHIVE_BATCH_SIZE)
+    return len(archived)
+
+
+@transaction.atomic
+def archive_term(term):
+    """
+    Move a term that is not active to the archive tables.
+    Returns the number of (sessions, reservations, unavailabilities) archived.
+    """
+    if term.is_active:
+        raise ValueError(f"{term} is the active term.")
+    if term.archived_at:
+        raise ValueError(f"{term} is already archived.")
+
+    version_ids = list(
+        TimetableVersion.objects.filter(sessions__term=term).order_by('-created_at')
+        .values_list('id', flat=True).distinct()
+    )
+    # The latest version is the timetable the term ended with
+    sessions = _archive_sessions(term, version_ids[0]) if version_ids else 0
+    reservations = _archive_reservations(term)
+    unavailabilities = _archive_unavailabilities(term)
+
+    # Sessions go with their versions (nothing to invalidate, see signals.py)
+    TimetableVersion.objects.filter(id__in=version_ids, is_published=False).delete()
+    ScheduledSession.all_versions.filter(term=term).delete()
+    ReservationRequest.all_terms.filter(term=term).delete()
+    TeacherUnavailability.all_terms.filter(term=term).delete()
+
+    term.archived_at = timezone.now()
+    term.save(update_fields=['archived_at'])
+    return sessions, reservations, unavailabilities
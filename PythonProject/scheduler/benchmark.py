@@ -0,0 +1,191 @@
+"""
+Scheduler benchmark helpers: a synthetic university generator and a
+runner that measures every generation mode (wall time, SQL queries,
+peak Python memory, placement rate). Used by the benchmark_scheduler command.
+"""
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from .models import (
+    AcademicTerm, Level, Filiere, StudentGroup, Room, Course, User,
+    ScheduledSession, ReservationRequest, TeacherUnavailability, TimetableVersion
+)
+from .utils import TimetableAlgorithm
+
+
+# Shape of ONE FSTT (scale 1): 6 Licence + 5 Master filières, 23 rooms
+LICENCE_FILIERES = 6
+MASTER_FILIERES = 5
+LICENCE_MODULES = 6
+MASTER_MODULES = 5
+AMPHIS = 4
+CLASSROOMS = 19
+
+
+@transaction.atomic
+def build_synthetic_university(scale=1, seed=0):
+    """
+    Fill the (empty, throwaway) database with `scale` times the FSTT:
+    filières, groups, teachers, courses (CM + TD/TP), rooms,
+    teacher unavailabilities and approved reservations.
+    Returns a dict with the row counts.
+    """
+    rng = random.Random(seed)
+    days = [day for day, _, _ in TimetableAlgorithm().timeslots[::4]]
+
+    for code in ('L', 'M'):
+        Level.objects.get_or_create(code=code)
+
+    # 1. Filières and groups
+    filieres = []
+    for i in range(max(1, round(LICENCE_FILIERES * scale))):
+        filieres.append(Filiere(code=f"L{i:04d}", name=f"Licence {i}", level_id='L'))
+    for i in range(max(1, round(MASTER_FILIERES * scale))):
+        filieres.append(Filiere(code=f"M{i:04d}", name=f"Master {i}", level_id='M'))
+    filieres = Filiere.objects.bulk_create(filieres)
+
+    groups = []
+    for filiere in filieres:
+        if filiere.level_id == 'L':
+            sizes = [rng.randint(28, 35) for _ in range(rng.choice([2, 3]))]
+        else:
+            sizes = [rng.randint(17, 22) for _ in range(2)]
+        for n, size in enumerate(sizes, start=1):
+            groups.append(StudentGroup(filiere=filiere, name=f"G{n}", capacity=size))
+    groups = StudentGroup.objects.bulk_create(groups)
+    groups_by_filiere = {}
+    for group in groups:
+        groups_by_filiere.setdefault(group.filiere_id, []).append(group)
+
+    # 2. Rooms (a third of the classrooms are computer labs)
+    rooms = []
+    for i in range(max(1, round(AMPHIS * scale))):
+        rooms.append(Room(name=f"Amphi {i}", capacity=150, building=f"Bloc A{i % 3}", equipment='Projector'))
+    for i in range(max(1, round(CLASSROOMS * scale))):
+        equipment = 'Projector, Computers' if i % 3 == 0 else 'Projector'
+        rooms.append(Room(name=f"Salle {i}", capacity=40, building=f"Bloc B{i % 5}", equipment=equipment))
+    rooms = Room.objects.bulk_create(rooms)
+
+    # 3. Teachers and courses (one teacher per module, like setup_fstt)
+    password = make_password(None)
+    teachers = []
+    modules = []
+    for filiere in filieres:
+        count = LICENCE_MODULES if filiere.level_id == 'L' else MASTER_MODULES
+        for m in range(count):
+            teachers.append(User(username=f"bench_{filiere.code}_{m}", role='T', password=password))
+            modules.append((filiere, m))
+    teachers = User.objects.bulk_create(teachers)
+
+    courses = []
+    for teacher, (filiere, m) in zip(teachers, modules):
+        name = f"Module {m} {filiere.code}"
+        courses.append(Course(name=f"{name} (CM)", teacher=teacher, filiere=filiere, session_type='CM'))
+        if m < 3:
+            # Third module is a lab (TP) that needs computers
+            session_type, equipment = ('TP', 'Computers') if m == 2 else ('TD', '')
+            for group in groups_by_filiere.get(filiere.id, []):
+                courses.append(Course(
+                    name=f"{name} ({session_type})", teacher=teacher, filiere=filiere, group=group,
+                    session_type=session_type, equipment_needed=equipment
+                ))
+    Course.objects.bulk_create(courses)
+
+    # 4. Unavailabilities (10% of the teachers) and approved reservations
+    term = AcademicTerm.current_or_create()
+    unavailabilities = [
+        TeacherUnavailability(term=term, teacher=teacher, day=rng.choice(days), start_hour=8, end_hour=12)
+        for teacher in rng.sample(teachers, max(1, len(teachers) // 10))
+    ]
+    TeacherUnavailability.objects.bulk_create(unavailabilities)
+
+    reservations = []
+    for _ in range(max(1, round(2 * scale))):
+        start = rng.choice([8, 10, 14, 16])
+        reservations.append(ReservationRequest(
+            term=term, teacher=rng.choice(teachers), room=rng.choice(rooms), day=rng.choice(days),
+            start_hour=start, end_hour=start + 2, reason='Benchmark', status='APPROVED'
+        ))
+    ReservationRequest.objects.bulk_create(reservations)
+
+    return {
+        'filieres': len(filieres),
+        'groups': len(groups),
+        'teachers': len(teachers),
+        'rooms': len(rooms),
+        'courses': len(courses),
+        'unavailabilities': len(unavailabilities),
+        'reservations': len(reservations),
+    }
+
+
+def clear_university():
+    """Empty the throwaway database between two scales"""
+    TimetableVersion.objects.all().delete()
+    ScheduledSession.all_versions.all().delete()
+    ReservationRequest.all_terms.all().delete()
+    TeacherUnavailability.all_terms.all().delete()
+    AcademicTerm.objects.all().delete()
+    Course.objects.all().delete()
+    User.objects.filter(role='T').delete()
+    Room.objects.all().delete()
+    StudentGroup.objects.all().delete()
+    Filiere.objects.all().delete()
+
+
+class QueryCounter:
+    """execute_wrapper counting SQL queries (no 9000-query cap like connection.queries)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _generate(mode, algo, **options):
+    if mode == 'db':
+        return algo.generate_timetable(mode='db')
+    if mode == 'incremental':
+        return algo.reschedule_incremental()['unscheduled']
+    return algo.generate_timetable(solver=mode, **options)
+
+
+def run_mode(mode, measure_memory=True, **options):
+    """
+    Run one generation mode and measure it.
+    mode: 'db' (query per check), 'incremental', or any solver name.
+    tracemalloc slows allocation-heavy code a lot, so peak memory is measured
+    in a second run rather than during the timed one.
+    """
+    algo = TimetableAlgorithm()
+    total = Course.objects.count()
+
+    queries = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        unscheduled = _generate(mode, algo, **options)
+    wall_time = time.perf_counter() - started
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        _generate(mode, algo, **options)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    placed = total - len(unscheduled)
+    return {
+        'mode': mode,
+        'wall_time': round(wall_time, 4),
+        'queries': queries.count,
+        'peak_memory_kb': round(peak / 1024) if peak is not None else None,
+        'courses': total,
+        'placed': placed,
+        'placement_rate': round(placed / total, 4) if total else 1.0,
+    }
@@ -0,0 +1,273 @@
+"""
+In-memory timetable engine.
+
+Everything the generator needs (courses, rooms, approved reservations,
+teacher unavailabilities) is loaded ONCE into plain Python data, and all
+conflict checks are done on integer bitsets over the timeslot list:
+bit i of a mask is set when timeslot i is busy.
+"""
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+
+
+# Plain data records (picklable, no ORM objects)
+CourseData = namedtuple('CourseData', [
+    'id', 'name', 'teacher_id', 'filiere_id', 'group_id', 'session_type', 'student_count', 'equipment',
+])
+RoomData = namedtuple('RoomData', ['id', 'name', 'capacity', 'equipment', 'building'])
+Placement = namedtuple('Placement', ['course_id', 'room_id', 'slot'])
+
+
+def iter_bits(mask):
+    """Yield the indexes of the set bits of mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def parse_equipment(text):
+    """'Projector, Computers' -> {'projector', 'computers'}"""
+    return {item.strip().lower() for item in (text or '').split(',') if item.strip()}
+
+
+def equipment_satisfies(available, needed):
+    """True if the comma-separated `available` equipment covers `needed`"""
+    return parse_equipment(needed) <= parse_equipment(available)
+
+
+# ============= ROOM INDEX =============
+
+class RoomIndex:
+    """
+    Rooms sorted by capacity, with their equipment parsed into bitmasks
+    (one bit per equipment item), so that a best-fit lookup is a bisect
+    on capacity plus a mask test.
+    """
+
+    def __init__(self, rooms):
+        self.rooms = sorted(rooms, key=lambda r: (r.capacity, r.id))
+        self.capacities = [r.capacity for r in self.rooms]
+        self._bits = {}
+        self.room_masks = [self.mask(r.equipment) for r in self.rooms]
+        self._candidates = {}
+
+    def mask(self, equipment):
+        """Bitmask of an equipment string (unknown items get a new bit no room has)"""
+        mask = 0
+        for item in parse_equipment(equipment):
+            if item not in self._bits:
+                self._bits[item] = 1 << len(self._bits)
+            mask |= self._bits[item]
+        return mask
+
+    def candidates(self, min_capacity, equipment=''):
+        """Rooms with enough seats and all the equipment, smallest first (cached)"""
+        required = self.mask(equipment)
+        key = (min_capacity, required)
+        if key not in self._candidates:
+            start = bisect_left(self.capacities, min_capacity)
+            self._candidates[key] = [
+                room for room, mask in zip(self.rooms[start:], self.room_masks[start:])
+                if mask & required == required
+            ]
+        return self._candidates[key]
+
+    def best_fit(self, min_capacity, equipment='', slot=None, busy=None):
+        """Smallest suitable room, free at `slot` according to busy (room_id -> slot mask)"""
+        for room in self.candidates(min_capacity, equipment):
+            if slot is None or busy is None or not (busy.get(room.id, 0) >> slot) & 1:
+                return room
+        return None
+
+    def fits(self, room, min_capacity, equipment=''):
+        required = self.mask(equipment)
+        position = bisect_left(self.capacities, room.capacity)
+        mask = self.room_masks[self.rooms.index(room, position)]
+        return room.capacity >= min_capacity and mask & required == required
+
+
+# ============= PROBLEM SNAPSHOT =============
+
+class ProblemSnapshot:
+    """Plain-data copy of everything needed to build a timetable"""
+
+    def __init__(self, timeslots, courses, rooms, room_blocked=None, teacher_blocked=None, filiere_groups=None):
+        self.timeslots = list(timeslots)
+        self.courses = list(courses)
+        self.room_index = RoomIndex(rooms)
+        self.rooms = self.room_index.rooms  # sorted by capacity (smallest first)
+        self.room_blocked = dict(room_blocked or {})  # room_id -> mask (approved reservations)
+        self.teacher_blocked = dict(teacher_blocked or {})  # teacher_id -> mask (unavailabilities)
+        self.filiere_groups = dict(filiere_groups or {})  # filiere_id -> [group ids]
+        self.all_slots = (1 << len(self.timeslots)) - 1
+
+        self.courses_by_id = {c.id: c for c in self.courses}
+        self.rooms_by_id = {r.id: r for r in self.rooms}
+
+        # day -> [(slot index, start, end)] for fast overlap lookups
+        self._day_slots = defaultdict(list)
+        for i, (day, start, end) in enumerate(self.timeslots):
+            self._day_slots[day].append((i, start, end))
+
+    def slot_mask(self, day, start, end):
+        """Mask of the timeslots overlapping day/start/end"""
+        mask = 0
+        for i, slot_start, slot_end in self._day_slots.get(day, ()):
+            if slot_start < end and slot_end > start:
+                mask |= 1 << i
+        return mask
+
+    def slot_index(self, day, start, end):
+        """Index of the exact timeslot, or None"""
+        for i, slot_start, slot_end in self._day_slots.get(day, ()):
+            if slot_start == start and slot_end == end:
+                return i
+        return None
+
+    def rooms_for(self, course):
+        """Rooms big enough and equipped for the course, smallest first"""
+        return self.room_index.candidates(course.student_count, course.equipment)
+
+    def room_fits(self, room, course):
+        return self.room_index.fits(room, course.student_count, course.equipment)
+
+    @classmethod
+    def load(cls, timeslots, blocked=True):
+        """
+        Build a snapshot from the database with a fixed number of queries.
+        blocked=False skips the approved reservations and unavailabilities
+        (scoring an existing timetable does not need them).
+        """
+        # Imported here so worker processes can unpickle snapshots without Django set up
+        from .models import Course, Room, StudentGroup, ReservationRequest, TeacherUnavailability
+
+        # Same priority as the original algorithm: Master first, then by name.
+        # Head counts come from the SQL annotation (no per-course query)
+        rows = Course.objects.with_student_count().order_by('-filiere__level', 'name').values_list(
+            'id', 'name', 'teacher_id', 'filiere_id', 'group_id', 'session_type', 'annotated_student_count',
+            'equipment_needed',
+        )
+        courses = [CourseData(*row) for row in rows]
+
+        rooms = [
+            RoomData(*row) for row in Room.objects.values_list(
+                'id', 'name', 'capacity', 'equipment', 'building'
+            )
+        ]
+
+        filiere_groups = defaultdict(list)
+        for group_id, filiere_id in StudentGroup.objects.values_list('id', 'filiere_id'):
+            filiere_groups[filiere_id].append(group_id)
+
+        snapshot = cls(timeslots, courses, rooms, filiere_groups=filiere_groups)
+        if not blocked:
+            return snapshot
+
+        reservations = ReservationRequest.objects.filter(status='APPROVED').values_list(
+            'room_id', 'day', 'start_hour', 'end_hour'
+        )
+        for room_id, day, start, end in reservations:
+            mask = snapshot.slot_mask(day, start, end)
+            snapshot.room_blocked[room_id] = snapshot.room_blocked.get(room_id, 0) | mask
+
+        unavailabilities = TeacherUnavailability.objects.values_list('teacher_id', 'day', 'start_hour', 'end_hour')
+        for teacher_id, day, start, end in unavailabilities:
+            mask = snapshot.slot_mask(day, start, end)
+            snapshot.teacher_blocked[teacher_id] = snapshot.teacher_blocked.get(teacher_id, 0) | mask
+
+        return snapshot
+
+
+# ============= OCCUPANCY BITMAPS =============
+
+class Occupancy:
+    """Occupancy per room, teacher, filière and group as timeslot bitsets"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.room = defaultdict(int, snapshot.room_blocked)
+        self.teacher = defaultdict(int, snapshot.teacher_blocked)
+        self.group = defaultdict(int)
+        self.filiere = defaultdict(int)     # any session of the filière
+        self.filiere_cm = defaultdict(int)  # sessions for the whole filière (no group)
+        # Several TD groups of one filière can share a slot, so count them
+        self._filiere_count = Counter()
+
+    def course_busy(self, course):
+        """Mask of the slots where the course cannot go (teacher, filière, group)"""
+        busy = self.teacher[course.teacher_id]
+        if course.session_type == 'CM':
+            busy |= self.filiere[course.filiere_id]
+        if course.group_id:
+            busy |= self.group[course.group_id] | self.filiere_cm[course.filiere_id]
+        return busy
+
+    def free_slots(self, course):
+        return self.snapshot.all_slots & ~self.course_busy(course)
+
+    def room_free(self, room_id, slot):
+        return not (self.room[room_id] >> slot) & 1
+
+    def place(self, course, room_id, slot):
+        bit = 1 << slot
+        self.room[room_id] |= bit
+        self.teacher[course.teacher_id] |= bit
+        self.filiere[course.filiere_id] |= bit
+        self._filiere_count[(course.filiere_id, slot)] += 1
+        if course.group_id:
+            self.group[course.group_id] |= bit
+        else:
+            self.filiere_cm[course.filiere_id] |= bit
+
+    def remove(self, course, room_id, slot):
+        bit = 1 << slot
+        self.room[room_id] &= ~bit
+        self.teacher[course.teacher_id] &= ~bit
+        self._filiere_count[(course.filiere_id, slot)] -= 1
+        if not self._filiere_count[(course.filiere_id, slot)]:
+            self.filiere[course.filiere_id] &= ~bit
+        if course.group_id:
+            self.group[course.group_id] &= ~bit
+        else:
+            self.filiere_cm[course.filiere_id] &= ~bit
+        # Blocked slots (reservations / unavailabilities) always stay busy
+        self.room[room_id] |= self.snapshot.room_blocked.get(room_id, 0) & bit
+        self.teacher[course.teacher_id] |= self.snapshot.teacher_blocked.get(course.teacher_id, 0) & bit
+
+
+# ============= GREEDY PLACEMENT =============
+
+def greedy_place(snapshot, courses=None, occupancy=None, progress=None):
+    """
+    First-fit placement: for each course take the first free timeslot,
+    then the smallest free room big enough and with the needed equipment.
+    progress(done, total) is called after every course (it may raise to cancel).
+    Returns (placements, unscheduled courses).
+    """
+    occupancy = occupancy or Occupancy(snapshot)
+    courses = snapshot.courses if courses is None else courses
+
+    placements = []
+    unscheduled = []
+
+    for done, course in enumerate(courses):
+        if progress:
+            progress(done, len(courses))
+        placement = None
+
+        for slot in iter_bits(occupancy.free_slots(course)):
+            room = snapshot.room_index.best_fit(
+                course.student_count, course.equipment, slot, occupancy.room
+            )
+            if room:
+                placement = Placement(course.id, room.id, slot)
+                break
+
+        if placement:
+            occupancy.place(course, placement.room_id, placement.slot)
+            placements.append(placement)
+        else:
+            unscheduled.append(course)
+
+    return placements, unscheduled
@@ -0,0 +1,86 @@
+"""
+Maintenance of the timetable entry read table (models.TimetableEntry).
+
+rebuild() rewrites the whole table in one transaction; it runs when another
+version is published or another term activated (see signals.py), inside
+the transaction that does it, so readers never see a mix of two timetables.
+Edits only refresh the rows they touch with refresh_sessions() and
+refresh_reservations(): the signal handlers call them for single saves,
+bulk writes (which send no signal) call them themselves. Deleting a session
+or reservation deletes its entry (on_delete=CASCADE).
+"""
+from django.db import transaction
+
+from .models import ReservationRequest, ScheduledSession, TimetableEntry
+
+
+ENTRY_BATCH_SIZE = 2000
+
+
+def _full_name(first_name, last_name, username):
+    # Same as User.get_full_name() or username, without loading the user
+    return f"{first_name} {last_name}".strip() or username
+
+
+def _session_entries(sessions):
+    rows = sessions.values_list(
+        'id', 'course_id', 'course__name', 'course__session_type',
+        'course__teacher_id', 'course__teacher__first_name', 'course__teacher__last_name', 'course__teacher__username',
+        'course__filiere_id', 'course__filiere__code', 'course__group_id', 'course__group__name',
+        'room_id', 'room__name', 'day', 'start_hour', 'end_hour',
+    )
+    for (session_id, course_id, name, session_type, teacher_id, first_name, last_name, username,
+         filiere_id, filiere_code, group_id, group_name, room_id, room, day, start, end) in rows.iterator(
+            chunk_size=ENTRY_BATCH_SIZE):
+        yield TimetableEntry(
+            kind='session', session_id=session_id, course_id=course_id, course_name=name,
+            session_type=session_type, teacher_id=teacher_id,
+            teacher_name=_full_name(first_name, last_name, username),
+            filiere_id=filiere_id, filiere_code=filiere_code, group_id=group_id, group_name=group_name or '',
+            room_id=room_id, room_name=room, day=day, start_hour=start, end_hour=end,
+        )
+
+
+def _reservation_entries(reservations):
+    rows = reservations.filter(status='APPROVED').values_list(
+        'id', 'reason', 'teacher_id', 'teacher__first_name', 'teacher__last_name', 'teacher__username',
+        'room_id', 'room__name', 'day', 'start_hour', 'end_hour',
+    )
+    for (reservation_id, reason, teacher_id, first_name, last_name, username,
+         room_id, room, day, start, end) in rows.iterator(chunk_size=ENTRY_BATCH_SIZE):
+        yield TimetableEntry(
+            kind='reservation', reservation_id=reservation_id, course_name=reason, session_type='RES',
+            teacher_id=teacher_id, teacher_name=_full_name(first_name, last_name, username),
+            room_id=room_id, room_name=room, day=day, start_hour=start, end_hour=end,
+        )
+
+
+def _insert(entries):
+    TimetableEntry.objects.bulk_create(entries, batch_size=ENTRY_BATCH_SIZE)
+
+
+@transaction.atomic
+def rebuild():
+    """Rewrite every entry from the published sessions and approved reservations"""
+    TimetableEntry.objects.all().delete()
+    _insert(_session_entries(ScheduledSession.objects.all()))
+    _insert(_reservation_entries(ReservationRequest.objects.all()))
+
+
+@transaction.atomic
+def refresh_sessions(**lookups):
+    """
+    Rewrite the entries of the sessions matching `lookups` (e.g. pk=..., course_id=...,
+    room_id=...). Sessions that are not published (any more) lose their entry.
+    """
+    matching = ScheduledSession.all_versions.filter(**lookups).values('id')
+    TimetableEntry.objects.filter(session__in=matching).delete()
+    _insert(_session_entries(ScheduledSession.objects.filter(**lookups)))
+
+
+@transaction.atomic
+def refresh_reservations(**lookups):
+    """Same as refresh_sessions() for reservations: only approved ones of the active term keep an entry"""
+    matching = ReservationRequest.all_terms.filter(**lookups).values('id')
+    TimetableEntry.objects.filter(reservation__in=matching).delete()
+    _insert(_reservation_entries(ReservationRequest.objects.filter(**lookups)))
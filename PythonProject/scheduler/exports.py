@@ -0,0 +1,250 @@
+"""
+Timetable exports.
+
+Rows are read from the TimetableEntry table (no join) with values_list()
+and iterator(), never as model instances, so a whole-faculty export streams
+in constant memory: the first bytes are sent before the last sessions are
+read from the database.
+
+Excel files use openpyxl write-only sheets and are kept on disk
+(settings.EXPORT_CACHE_DIR) until the published timetable changes.
+"""
+import csv
+import glob
+import os
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.db.models.functions import Length
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+
+from . import week_index
+from .models import DAYS, TimetableEntry, TimetableVersion
+
+
+# Rows fetched from the database at a time while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+SESSION_TYPES = dict(TimetableEntry.SESSION_TYPE_CHOICES)
+
+CSV_HEADER = ['Course Name', 'Type', 'Teacher', 'Group/Filière', 'Room', 'Day', 'Start Time', 'End Time']
+
+
+# ============= SCOPING =============
+
+def _selected(filiere_id):
+    return filiere_id not in (None, '', 'None')
+
+
+def scoped_sessions(user, filiere_id=None):
+    """
+    Entries of the published sessions a user may export: everything for an
+    admin, their own courses for a teacher (both optionally limited to one
+    filière), their group's sessions and their filière's CMs for a student.
+    """
+    queryset = TimetableEntry.objects.filter(kind='session')
+    if user.role == 'T':
+        queryset = queryset.filter(teacher_id=user.id)
+    elif user.role != 'A':
+        group = user.student_group
+        if not group:
+            return queryset.none()
+        return queryset.filter(Q(group_id=group.id) | Q(filiere_id=group.filiere_id, group_id__isnull=True))
+
+    if _selected(filiere_id):
+        queryset = queryset.filter(filiere_id=filiere_id)
+    return queryset
+
+
+def scoped_reservations(user, filiere_id=None):
+    """Entries of the approved reservations shown with the sessions (not tied to a filière)"""
+    queryset = TimetableEntry.objects.filter(kind='reservation')
+    if _selected(filiere_id) or user.role not in ('A', 'T'):
+        return queryset.none()
+    if user.role == 'T':
+        queryset = queryset.filter(teacher_id=user.id)
+    return queryset
+
+
+# ============= ROWS =============
+
+def session_values(queryset):
+    """
+    (name, session_type, teacher, group_name, filiere_code, room, day, start, end)
+    per entry, streamed from the database
+    """
+    rows = queryset.values_list(
+        'course_name', 'session_type', 'teacher_name', 'group_name', 'filiere_code',
+        'room_name', 'day', 'start_hour', 'end_hour',
+    )
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def timetable_rows(user, filiere_id=None):
+    """One list per session, then per approved reservation, in CSV_HEADER order"""
+    sessions = session_values(scoped_sessions(user, filiere_id))
+    for name, session_type, teacher, group_name, filiere_code, room, day, start, end in sessions:
+        yield [
+            name,
+            SESSION_TYPES.get(session_type, session_type),
+            teacher,
+            f"{filiere_code} - {group_name}" if group_name else filiere_code,
+            room, day, f"{start}:00", f"{end}:00",
+        ]
+
+    for reason, _, teacher, _, _, room, day, start, end in session_values(scoped_reservations(user, filiere_id)):
+        yield [reason, 'Reservation', teacher, '', room, day, f"{start}:00", f"{end}:00"]
+
+
+# ============= CSV =============
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, header=CSV_HEADER):
+    """Encode rows one at a time (a BOM first so Excel reads the accents as UTF-8)"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff'
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+# ============= EXCEL =============
+
+EXCEL_HEADER = ["Cours", "Type", "Enseignant", "Salle", "Jour", "Heure début", "Heure fin", "Groupe/Filière"]
+EXCEL_MAX_WIDTH = 30
+
+# Background of the data rows, per session type
+SESSION_FILLS = {'CM': "E2EFDA", 'TD': "FFF2CC", 'TP': "DDEBF7"}
+
+
+def _add_styles(workbook):
+    """
+    Register the few styles used by the export once per workbook: cells then
+    only reference a style by name instead of each getting its own Font/PatternFill.
+    """
+    workbook.add_named_style(NamedStyle('title', font=Font(bold=True, size=16, color="366092")))
+    workbook.add_named_style(NamedStyle('section', font=Font(bold=True, size=14)))
+    workbook.add_named_style(NamedStyle(
+        'header', font=Font(bold=True), alignment=Alignment(horizontal='center'),
+        fill=PatternFill(start_color="5B9BD5", end_color="5B9BD5", fill_type="solid"),
+    ))
+    workbook.add_named_style(NamedStyle('row'))
+    for session_type, color in SESSION_FILLS.items():
+        workbook.add_named_style(NamedStyle(
+            f"row_{session_type}", fill=PatternFill(start_color=color, end_color=color, fill_type="solid")
+        ))
+
+
+def _column_widths(sessions):
+    """
+    Width of each column, from the longest value of each column computed by
+    the database. Write-only sheets need the widths before the first row.
+    """
+    longest = sessions.aggregate(
+        course_length=Max(Length('course_name')),
+        teacher_length=Max(Length('teacher_name')),
+        room_length=Max(Length('room_name')),
+        group_length=Max(Length('group_name')),
+        filiere_length=Max(Length('filiere_code')),
+    )
+    data = [
+        longest['course_length'],
+        max(len(label) for label in SESSION_TYPES.values()),
+        longest['teacher_length'],
+        longest['room_length'],
+        max(len(day) for day in DAYS),
+        len("18:00"),
+        len("18:00"),
+        max(len("Groupe: ") + (longest['group_length'] or 0), len("Filière: ") + (longest['filiere_length'] or 0)),
+    ]
+    return [min(max(len(header), width or 0) + 2, EXCEL_MAX_WIDTH) for header, width in zip(EXCEL_HEADER, data)]
+
+
+def _styled(sheet, value, style):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style
+    return cell
+
+
+def _write_sheet(workbook, title, sessions, info):
+    """One sheet: title, info lines, then one row per session (streamed)"""
+    sheet = workbook.create_sheet(title)
+    for index, width in enumerate(_column_widths(sessions), start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+
+    sheet.append([_styled(sheet, "EMPLOI DU TEMPS UNIVERSITAIRE", 'title')])
+    for line in info:
+        sheet.append([line])
+    sheet.append([])
+    sheet.append([_styled(sheet, "LISTE DES SÉANCES", 'section')])
+    sheet.append([_styled(sheet, header, 'header') for header in EXCEL_HEADER])
+
+    for name, session_type, teacher, group_name, filiere_code, room, day, start, end in session_values(sessions):
+        style = f"row_{session_type}" if session_type in SESSION_FILLS else 'row'
+        group_info = f"Groupe: {group_name}" if group_name else f"Filière: {filiere_code}"
+        values = [
+            name, SESSION_TYPES.get(session_type, session_type), teacher, room, day,
+            f"{start}:00", f"{end}:00", group_info,
+        ]
+        sheet.append([_styled(sheet, value, style) for value in values])
+
+
+def write_timetable_workbook(path, sheets):
+    """
+    Save a write-only workbook to `path`. `sheets` is a list of
+    (title, session entries from scoped_sessions(), info lines); rows are never all in memory.
+    """
+    workbook = Workbook(write_only=True)
+    _add_styles(workbook)
+    generated = f"Généré le: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+    for title, sessions, info in sheets:
+        _write_sheet(workbook, title, sessions, [generated, *info])
+    workbook.save(path)
+
+
+# ============= CACHED ARTIFACTS =============
+
+def cached_export(scope, extension, build):
+    """
+    Path of the export `scope` (e.g. 'teacher-4') of the published timetable,
+    built with build(path) only if the timetable changed since the last build.
+    Files are keyed by published version and in-place edit revision
+    (week_index.revision()); older files of the same scope are removed.
+    """
+    version_id = TimetableVersion.current_id()
+    directory = settings.EXPORT_CACHE_DIR
+    path = os.path.join(directory, f"{scope}-v{version_id}-{week_index.revision()}.{extension}")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    for old in glob.glob(os.path.join(directory, f"{glob.escape(scope)}-v*.{extension}")):
+        if old == path:
+            # Just built by another process
+            continue
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+    # Build next to the final file and rename, so a concurrent download never sees half a file
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        build(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return path
@@ -1,6 +1,9 @@
 from django import forms
 from .models import TeacherUnavailability
 from .models import ReservationRequest, Course, ScheduledSession,  User, Course, Room
+from .models import DAYS
+from .imports import IMPORTERS
+from .occupancy import CLOSE_HOUR, OPEN_HOUR
 
 # --- Your Friend's Code (Leave this alone) ---
 class ReservationForm(forms.ModelForm):
@@ -73,9 +76,20 @@ class TeacherForm(forms.ModelForm):
     
 
 class RoomSearchForm(forms.Form):
-    day = forms.ChoiceField(choices=[('Monday', 'Monday'), ('Tuesday', 'Tuesday'), ...]) # Add all days
-    start_hour = forms.IntegerField(min_value=8, max_value=18)
-    end_hour = forms.IntegerField(min_value=9, max_value=19)
+    """Free-room search: a day and hour range, or a duration for the first free slot"""
+    day = forms.ChoiceField(choices=[('', 'Any day')] + [(day, day) for day in DAYS], required=False)
+    start_hour = forms.IntegerField(min_value=OPEN_HOUR, max_value=CLOSE_HOUR - 1, required=False)
+    end_hour = forms.IntegerField(min_value=OPEN_HOUR + 1, max_value=CLOSE_HOUR, required=False)
+    duration = forms.IntegerField(min_value=1, max_value=CLOSE_HOUR - OPEN_HOUR, required=False)
+    min_capacity = forms.IntegerField(min_value=0, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_hour, end_hour = cleaned_data.get('start_hour'), cleaned_data.get('end_hour')
+        if start_hour is not None and end_hour is not None and end_hour <= start_hour:
+            raise forms.ValidationError("The end time must be after the start time.")
+        return cleaned_data
+
     # Make sure ScheduledSession is imported at the top of the file!
 from .models import ScheduledSession 
 
@@ -113,11 +127,11 @@ class TeacherUnavailabilityForm(forms.ModelForm):
         fields = ['day', 'start_hour', 'end_hour']
         widgets = {
             'day': forms.Select(choices=[
-                ('Lundi', 'Monday'),
-                ('Mardi', 'Tuesday'),
-                ('Mercredi', 'Wednesday'),
-                ('Jeudi', 'Thursday'),
-                ('Vendredi', 'Friday'),
+                ('Monday', 'Monday'),
+                ('Tuesday', 'Tuesday'),
+                ('Wednesday', 'Wednesday'),
+                ('Thursday', 'Thursday'),
+                ('Friday', 'Friday'),
             ], attrs={'class': 'form-select'}),
             'start_hour': forms.Select(choices=[(h, f'{h}:00') for h in range(8, 19)], attrs={'class': 'form-select'}),
             'end_hour': forms.Select(choices=[(h, f'{h}:00') for h in range(8, 19)], attrs={'class': 'form-select'}),
@@ -137,4 +151,27 @@ class ProfileForm(forms.ModelForm):
             'email': forms.EmailInput(attrs={'class': 'form-control'}),
             # File Input Styling
             'profile_picture': forms.FileInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+
+class ImportForm(forms.Form):
+    kind = forms.ChoiceField(choices=[(name, name.capitalize()) for name in IMPORTERS], widget=forms.Select(attrs={'class': 'form-select'}))
+    file = forms.FileField(
+        help_text='CSV or Excel (.xlsx) file, with a header row',
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+    default_password = forms.CharField(
+        required=False, help_text='For new teachers/students without a password column',
+        widget=forms.PasswordInput(attrs={'class': 'form-control'}),
+    )
+    dry_run = forms.BooleanField(
+        required=False, initial=True, label='Dry run (check only, write nothing)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Only .csv and .xlsx files can be imported.")
+        return file
+
@@ -0,0 +1,154 @@
+"""
+Weekly timetable grid shared by the teacher, student and admin timetable pages.
+
+A grid is plain data (dicts, lists, strings, ints) so it can be cached:
+- 'entries': one dict per session / approved reservation, sorted by day and hour,
+- 'rows': one row per hour, each with one slot per day
+  ({'type': 'session', 'session': entry, 'rowspan': n}, {'type': 'skipped'} or {'type': 'empty'}).
+
+Entries are read from the TimetableEntry table (one indexed scan, no join).
+Grids are cached per entity (teacher, group, filière) and published timetable
+version. Publishing a new version changes the keys; in-place edits are
+invalidated by the signal handlers in signals.py.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import DAYS, Course, StudentGroup, TimetableEntry, TimetableVersion
+
+
+HOURS = range(8, 19)
+
+# The data only changes when an admin edits or regenerates the timetable
+GRID_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Key used for the admin view of every filière at once
+ALL = 'all'
+
+
+def _cache_key(kind, entity_id, version_id):
+    return f"grid:{kind}:{entity_id}:{version_id}"
+
+
+# ============= BUILDING =============
+
+ENTRY_FIELDS = [
+    'kind', 'course_id', 'course_name', 'session_type', 'teacher_id', 'teacher_name',
+    'filiere_id', 'filiere_code', 'group_id', 'group_name', 'room_name', 'day', 'start_hour', 'end_hour',
+]
+
+SESSION_TYPES = dict(TimetableEntry.SESSION_TYPE_CHOICES)
+
+
+def entry_dicts(entries):
+    """
+    One dict per TimetableEntry of the queryset, by day and hour, read with
+    values(). Sessions come before reservations starting at the same time,
+    so a reservation wins a cell it shares with a session (see build_grid),
+    then by id of the session / reservation.
+    """
+    ordered = entries.order_by('day', 'start_hour', '-kind', 'session_id', 'reservation_id')
+    for entry in ordered.values(*ENTRY_FIELDS):
+        entry['session_type_display'] = SESSION_TYPES.get(entry['session_type'], entry['session_type'])
+        entry['group_name'] = entry['group_name'] or None
+        if entry['kind'] == 'reservation':
+            # Approved reservations are shown like sessions (the reason is the title)
+            entry['filiere_code'] = 'PERSO'
+        entry['duration'] = entry['end_hour'] - entry['start_hour']
+        yield entry
+
+
+def build_grid(entries, days=DAYS, hours=HOURS):
+    """
+    Rowspan grid: a session spanning several hours hides the cells below it.
+    A session ending after the last hour only spans the rows left.
+    """
+    # Later entries win when two start in the same cell (like the original pages)
+    entry_map = {(e['day'], e['start_hour']): e for e in entries}
+    last_hour = hours[-1]
+
+    rows = []
+    skip_slots = set()
+    for h in hours:
+        row = {'hour': h, 'slots': []}
+        for d in days:
+            if (d, h) in skip_slots:
+                row['slots'].append({'type': 'skipped'})
+                continue
+
+            entry = entry_map.get((d, h))
+            if entry:
+                rowspan = min(entry['end_hour'] - entry['start_hour'], last_hour - h + 1)
+                for i in range(1, rowspan):
+                    skip_slots.add((d, h + i))
+                row['slots'].append({'type': 'session', 'session': entry, 'rowspan': rowspan})
+            else:
+                row['slots'].append({'type': 'empty'})
+        rows.append(row)
+    return rows
+
+
+def _entries(kind, entity_id):
+    entries = TimetableEntry.objects.all()
+    if kind == 'teacher':
+        entries = entries.filter(teacher_id=entity_id)
+    elif kind == 'group':
+        filiere_id = StudentGroup.objects.filter(pk=entity_id).values_list('filiere_id', flat=True).first()
+        entries = entries.filter(kind='session').filter(
+            Q(group_id=entity_id) | Q(filiere_id=filiere_id, group_id__isnull=True)
+        )
+    elif entity_id == ALL:
+        entries = entries.filter(kind='session')
+    else:
+        # Reservations have no filière
+        entries = entries.filter(filiere_id=entity_id)
+    return list(entry_dicts(entries))
+
+
+def get_grid(kind, entity_id):
+    """
+    Cached grid of a 'teacher' (user id), 'group' (StudentGroup id) or
+    'filiere' (Filiere id, or ALL) for the published version:
+    {'version': id, 'days': [...], 'rows': [...], 'entries': [...]}.
+    """
+    version_id = TimetableVersion.current_id()
+    key = _cache_key(kind, entity_id, version_id)
+    grid = cache.get(key)
+    if grid is None:
+        entries = _entries(kind, entity_id)
+        grid = {'version': version_id, 'days': DAYS, 'rows': build_grid(entries), 'entries': entries}
+        cache.set(key, grid, GRID_CACHE_TIMEOUT)
+    return grid
+
+
+# ============= INVALIDATION =============
+
+def invalidate(kind, entity_id, version_id=None):
+    if version_id is None:
+        version_id = TimetableVersion.current_id()
+    cache.delete(_cache_key(kind, entity_id, version_id))
+
+
+def invalidate_course(teacher_id, filiere_id, group_id, version_id=None):
+    """Drop the grids that show the sessions of one course"""
+    if version_id is None:
+        version_id = TimetableVersion.current_id()
+    keys = [
+        _cache_key('teacher', teacher_id, version_id),
+        _cache_key('filiere', filiere_id, version_id),
+        _cache_key('filiere', ALL, version_id),
+    ]
+    if group_id:
+        group_ids = [group_id]
+    else:
+        # A CM is shown to every group of the filière
+        group_ids = StudentGroup.objects.filter(filiere_id=filiere_id).values_list('id', flat=True)
+    keys += [_cache_key('group', g, version_id) for g in group_ids]
+    cache.delete_many(keys)
+
+
+def invalidate_courses(course_ids, version_id=None):
+    """Same as invalidate_course for many courses (bulk writes do not send signals)"""
+    rows = Course.objects.filter(id__in=set(course_ids)).values_list('teacher_id', 'filiere_id', 'group_id')
+    for teacher_id, filiere_id, group_id in set(rows):
+        invalidate_course(teacher_id, filiere_id, group_id, version_id)
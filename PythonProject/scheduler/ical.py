@@ -0,0 +1,150 @@
+"""
+iCalendar (.ics) feeds of a teacher's or a group's week, for calendar
+clients (Google Calendar, Outlook, phones) to subscribe to.
+
+Each session or approved reservation is a weekly recurring event. Calendar
+clients cannot log in, so the feed URL carries a signed token instead.
+The ETag and Last-Modified headers come from the published version and
+the in-place edit revision: clients polling an unchanged timetable get a
+304 without the feed being built, and built feeds are cached.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.signing import Signer
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from . import week_index
+from .grid import DAYS
+from .models import TimetableVersion
+
+
+KINDS = ('teacher', 'group')
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+_signer = Signer(salt='scheduler.ical')
+
+
+# ============= ACCESS =============
+
+def feed_token(kind, entity_id):
+    return _signer.signature(f"{kind}:{entity_id}")
+
+
+def valid_token(kind, entity_id, token):
+    return kind in KINDS and constant_time_compare(token, feed_token(kind, entity_id))
+
+
+def feed_url(request, kind, entity_id):
+    """Absolute URL to paste in a calendar client"""
+    path = reverse('calendar_feed', args=[kind, entity_id, feed_token(kind, entity_id)])
+    return request.build_absolute_uri(path)
+
+
+# ============= CONDITIONAL GET =============
+
+def _published(request):
+    """(id, published_at) of the published version, (None, None) if there is none; once per request"""
+    if not hasattr(request, '_published_version'):
+        request._published_version = (
+            TimetableVersion.objects.filter(is_published=True).values_list('id', 'published_at').first()
+            or (None, None)
+        )
+    return request._published_version
+
+
+def feed_etag(request, kind, entity_id, token):
+    if not valid_token(kind, entity_id, token):
+        return None
+    version_id, _ = _published(request)
+    return f"{kind}-{entity_id}-v{version_id}-{week_index.revision()}"
+
+
+def feed_last_modified(request, kind, entity_id, token):
+    if not valid_token(kind, entity_id, token):
+        return None
+    _, published_at = _published(request)
+    dates = [d for d in (published_at, week_index.revised_at()) if d]
+    return max(dates) if dates else None
+
+
+# ============= FEED =============
+
+def _escape(text):
+    """TEXT value escaping (RFC 5545 3.3.11)"""
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Lines longer than 75 octets continue on the next line after a space"""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        # Never cut a multi-byte character
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode('utf-8'))
+        data = data[size:]
+    return '\r\n '.join(parts)
+
+
+def _event(entry, week_start, uid, stamp):
+    date = week_start + timedelta(days=DAYS.index(entry['day']))
+    start = datetime.combine(date, time(entry['start_hour']))
+    end = datetime.combine(date, time(entry['end_hour']))
+    details = [entry['session_type_display'], entry['teacher_name']]
+    if entry['kind'] == 'session':
+        details.append(f"{entry['filiere_code']} - {entry['group_name']}" if entry['group_name'] else entry['filiere_code'])
+    return [
+        'BEGIN:VEVENT',
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        # Floating local times: the hours are the faculty's, wherever the reader is
+        f"DTSTART:{start:%Y%m%dT%H%M%S}",
+        f"DTEND:{end:%Y%m%dT%H%M%S}",
+        'RRULE:FREQ=WEEKLY',
+        f"SUMMARY:{_escape(entry['course_name'])}",
+        f"LOCATION:{_escape(entry['room_name'])}",
+        f"DESCRIPTION:{_escape(' - '.join(details))}",
+        'END:VEVENT',
+    ]
+
+
+def build_feed(kind, entity_id, version_id, published_at):
+    """The VCALENDAR text (CRLF line endings); events repeat weekly from the week of publication"""
+    published_at = published_at or timezone.now()
+    local = timezone.localtime(published_at).date()
+    week_start = local - timedelta(days=local.weekday())
+    stamp = published_at.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//FSTT//Scheduler//FR',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{_escape('Emploi du temps')}",
+    ]
+    entries = week_index.get_week_index(version_id).week(kind, entity_id)
+    for n, entry in enumerate(e for e in entries if e['day'] in DAYS):
+        uid = f"{kind}-{entity_id}-v{version_id}-{n}@fstt-scheduler"
+        lines += _event(entry, week_start, uid, stamp)
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def get_feed(request, kind, entity_id):
+    """Cached feed of the published timetable"""
+    version_id, published_at = _published(request)
+    key = f"ics:{kind}:{entity_id}:{version_id}:{week_index.revision()}"
+    feed = cache.get(key)
+    if feed is None:
+        feed = build_feed(kind, entity_id, version_id, published_at)
+        cache.set(key, feed, FEED_CACHE_TIMEOUT)
+    return feed
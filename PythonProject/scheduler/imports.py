@@ -0,0 +1,422 @@
+"""
+Bulk import of rooms, student groups, teachers, students and courses from
+CSV or Excel (.xlsx) files, for the import_data command and the admin
+upload page.
+
+Rows are streamed in chunks of IMPORT_CHUNK_SIZE and checked against
+lookup maps loaded once per file (filière code -> id, (filière, group
+name) -> id, username -> id, ...), never with a query per row. Each chunk
+is written with bulk_create / bulk_update, all in one transaction that is
+rolled back if any row is invalid: a file is imported entirely or not at
+all. A dry run does every check and reports what would be written.
+
+Existing rows (same room name, username, group, course) are updated;
+passwords of existing users are left alone. New users' passwords are
+hashed in a thread pool (PBKDF2 runs in C without holding the GIL), each
+with its own salt, even when many users get the same default password.
+"""
+import csv
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from openpyxl import load_workbook
+
+from . import entries, grid, stats, week_index
+from .models import Course, Filiere, Room, StudentGroup, User
+
+
+IMPORT_CHUNK_SIZE = 1000
+
+
+class RowError(Exception):
+    pass
+
+
+class ImportReport:
+    """What an import did (or would do, for a dry run)"""
+
+    def __init__(self, kind, dry_run):
+        self.kind = kind
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (line number, message)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def committed(self):
+        return self.ok and not self.dry_run
+
+
+# ============= READING =============
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel stores every number as a float
+    return str(value).strip()
+
+
+def read_rows(file, filename):
+    """
+    (columns, rows) of a .csv or .xlsx file: the lower-cased header and an
+    iterator of (line number, {column: text}), blank lines skipped.
+    CSV files may use ',', ';' or tabs and be UTF-8 with or without BOM.
+    """
+    if filename.lower().endswith('.xlsx'):
+        sheet = load_workbook(file, read_only=True, data_only=True).active
+        values = sheet.iter_rows(values_only=True)
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        values = csv.reader(text, dialect)
+
+    header = next(values, None) or []
+    columns = [_cell_text(c).lower() for c in header]
+
+    def rows():
+        for number, line in enumerate(values, start=2):
+            cells = [_cell_text(v) for v in line]
+            if any(cells):
+                yield number, {c: v for c, v in zip(columns, cells) if c}
+
+    return columns, rows()
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _int(row, column, default=None):
+    value = row.get(column, '')
+    if not value:
+        if default is None:
+            raise RowError(f"{column} is required")
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RowError(f"{column}: '{value}' is not a number")
+
+
+# ============= IMPORTERS =============
+
+class Importer:
+    """
+    One kind of row. load() fills the lookup maps, key() identifies the row
+    (to update an existing one), build() returns the unsaved instance.
+    """
+    name = None
+    model = None
+    columns = []
+    required = []
+    update_fields = []
+
+    def __init__(self, default_password=''):
+        self.default_password = default_password
+        self.existing = {}  # key -> id
+
+    def load(self):
+        pass
+
+    def key(self, row):
+        raise NotImplementedError
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def validate(self, chunk, report, seen):
+        """(to create, to update) for the valid rows of the chunk; errors go to the report"""
+        creates, updates = [], []
+        for number, row in chunk:
+            report.rows += 1
+            missing = [c for c in self.required if not row.get(c)]
+            if missing:
+                report.errors.append((number, f"Missing {', '.join(missing)}"))
+                continue
+            try:
+                key = self.key(row)
+                if key in seen:
+                    raise RowError(f"Same {self.name[:-1]} as line {seen[key]}")
+                seen[key] = number
+                instance = self.build(row)
+            except RowError as e:
+                report.errors.append((number, str(e)))
+                continue
+            instance.pk = self.existing.get(key)
+            (updates if instance.pk else creates).append(instance)
+        return creates, updates
+
+    def write(self, creates, updates):
+        self.model.objects.bulk_create(creates, batch_size=IMPORT_CHUNK_SIZE)
+        if updates:
+            self.model.objects.bulk_update(updates, self.update_fields, batch_size=IMPORT_CHUNK_SIZE)
+
+    def invalidate(self):
+        """Bulk writes send no signal: drop what the signal handlers would"""
+        stats.invalidate()
+
+
+class RoomImporter(Importer):
+    name = 'rooms'
+    model = Room
+    columns = ['name', 'capacity', 'building', 'equipment']
+    required = ['name', 'capacity']
+    update_fields = ['capacity', 'building', 'equipment']
+
+    def load(self):
+        self.existing = dict(Room.objects.values_list('name', 'id'))
+
+    def key(self, row):
+        return row['name']
+
+    def build(self, row):
+        return Room(
+            name=row['name'], capacity=_int(row, 'capacity'),
+            building=row.get('building', ''), equipment=row.get('equipment', ''),
+        )
+
+    def invalidate(self):
+        super().invalidate()
+        week_index.invalidate()  # the occupancy matrix keeps the room list
+
+
+class _FiliereLookupMixin:
+    def load_filieres(self):
+        self.filieres = dict(Filiere.objects.values_list('code', 'id'))
+        self.groups = {
+            (filiere_id, name): group_id
+            for group_id, filiere_id, name in StudentGroup.objects.values_list('id', 'filiere_id', 'name')
+        }
+
+    def filiere_id(self, row):
+        try:
+            return self.filieres[row['filiere']]
+        except KeyError:
+            raise RowError(f"Unknown filière '{row['filiere']}'")
+
+    def group_id(self, row, filiere_id):
+        try:
+            return self.groups[(filiere_id, row['group'])]
+        except KeyError:
+            raise RowError(f"Unknown group '{row['group']}' in {row['filiere']}")
+
+
+class GroupImporter(_FiliereLookupMixin, Importer):
+    name = 'groups'
+    model = StudentGroup
+    columns = ['filiere', 'group', 'capacity']
+    required = ['filiere', 'group']
+    update_fields = ['capacity']
+
+    def load(self):
+        self.load_filieres()
+        self.existing = self.groups
+
+    def key(self, row):
+        if row['group'] not in dict(StudentGroup.GROUP_CHOICES):
+            raise RowError(f"Unknown group name '{row['group']}' (expected {', '.join(dict(StudentGroup.GROUP_CHOICES))})")
+        return (self.filiere_id(row), row['group'])
+
+    def build(self, row):
+        return StudentGroup(filiere_id=self.filiere_id(row), name=row['group'], capacity=_int(row, 'capacity', 30))
+
+
+class _UserImporter(Importer):
+    model = User
+    role = None
+    update_fields = ['first_name', 'last_name', 'email']
+
+    def load(self):
+        self.roles = {}
+        for user_id, username, role in User.objects.values_list('id', 'username', 'role'):
+            self.existing[username] = user_id
+            self.roles[username] = role
+
+    def key(self, row):
+        username = row['username']
+        role = self.roles.get(username, self.role)
+        if role != self.role:
+            raise RowError(f"'{username}' is already used by a {dict(User.ROLE_CHOICES).get(role, role)} account")
+        return username
+
+    def build(self, row):
+        user = User(
+            username=row['username'], role=self.role, first_name=row.get('first_name', ''),
+            last_name=row.get('last_name', ''), email=row.get('email', ''),
+        )
+        if row['username'] not in self.existing:
+            user.password = row.get('password') or self.default_password
+            if not user.password:
+                raise RowError("password is required (no default password given)")
+        return user
+
+    def write(self, creates, updates):
+        # Hashing is the slow part: in parallel, one salt per user (never reuse a hash)
+        if creates:
+            with ThreadPoolExecutor(max_workers=settings.IMPORT_HASH_WORKERS or os.cpu_count()) as pool:
+                hashes = pool.map(make_password, [user.password for user in creates])
+                for user, hashed in zip(creates, hashes):
+                    user.password = hashed
+        super().write(creates, updates)
+
+
+class TeacherImporter(_UserImporter):
+    name = 'teachers'
+    role = 'T'
+    columns = ['username', 'first_name', 'last_name', 'email', 'password']
+    required = ['username']
+
+    def load(self):
+        super().load()
+        self.updated_ids = []
+
+    def write(self, creates, updates):
+        super().write(creates, updates)
+        if updates:
+            # Names shown in the timetable entries
+            ids = [teacher.pk for teacher in updates]
+            entries.refresh_sessions(course__teacher_id__in=ids)
+            entries.refresh_reservations(teacher_id__in=ids)
+            self.updated_ids += ids
+
+    def invalidate(self):
+        super().invalidate()
+        if self.updated_ids:
+            for teacher_id in self.updated_ids:
+                grid.invalidate('teacher', teacher_id)
+            grid.invalidate_courses(Course.objects.filter(teacher_id__in=self.updated_ids).values_list('id', flat=True))
+            week_index.invalidate()
+
+
+class StudentImporter(_FiliereLookupMixin, _UserImporter):
+    name = 'students'
+    role = 'S'
+    columns = ['username', 'first_name', 'last_name', 'email', 'password', 'filiere', 'group']
+    required = ['username', 'filiere', 'group']
+    update_fields = _UserImporter.update_fields + ['student_group']
+
+    def load(self):
+        super().load()
+        self.load_filieres()
+
+    def build(self, row):
+        group_id = self.group_id(row, self.filiere_id(row))
+        student = super().build(row)
+        student.student_group_id = group_id
+        return student
+
+
+class CourseImporter(_FiliereLookupMixin, Importer):
+    name = 'courses'
+    model = Course
+    columns = ['name', 'code', 'teacher', 'filiere', 'group', 'session_type', 'credits', 'equipment_needed', 'description']
+    required = ['name', 'teacher', 'filiere']
+    update_fields = ['code', 'teacher', 'credits', 'equipment_needed', 'description']
+
+    def load(self):
+        self.load_filieres()
+        self.teachers = dict(User.objects.filter(role='T').values_list('username', 'id'))
+        self.old_teachers = {}
+        for course_id, teacher_id, filiere_id, group_id, session_type, name in Course.objects.values_list(
+            'id', 'teacher_id', 'filiere_id', 'group_id', 'session_type', 'name'
+        ):
+            self.existing[(filiere_id, group_id, session_type, name)] = course_id
+            self.old_teachers[course_id] = teacher_id
+        self.updated_ids = []
+
+    def _session_type(self, row):
+        session_type = (row.get('session_type') or ('TD' if row.get('group') else 'CM')).upper()
+        if session_type not in dict(Course.SESSION_TYPE_CHOICES):
+            raise RowError(f"Unknown session type '{session_type}' (expected CM, TD or TP)")
+        return session_type
+
+    def key(self, row):
+        filiere_id = self.filiere_id(row)
+        group_id = self.group_id(row, filiere_id) if row.get('group') else None
+        return (filiere_id, group_id, self._session_type(row), row['name'])
+
+    def build(self, row):
+        filiere_id, group_id, session_type, name = self.key(row)
+        try:
+            teacher_id = self.teachers[row['teacher']]
+        except KeyError:
+            raise RowError(f"Unknown teacher '{row['teacher']}'")
+        return Course(
+            name=name, code=row.get('code', ''), teacher_id=teacher_id, filiere_id=filiere_id,
+            group_id=group_id, session_type=session_type, credits=_int(row, 'credits', 3),
+            equipment_needed=row.get('equipment_needed', ''), description=row.get('description', ''),
+        )
+
+    def write(self, creates, updates):
+        super().write(creates, updates)
+        if updates:
+            ids = [course.pk for course in updates]
+            entries.refresh_sessions(course_id__in=ids)
+            self.updated_ids += ids
+
+    def invalidate(self):
+        super().invalidate()
+        if self.updated_ids:
+            # A course may have changed teacher: drop the grids of the old one too
+            for course_id in self.updated_ids:
+                grid.invalidate('teacher', self.old_teachers[course_id])
+            grid.invalidate_courses(self.updated_ids)
+            week_index.invalidate()
+
+
+IMPORTERS = {
+    importer.name: importer
+    for importer in (RoomImporter, GroupImporter, TeacherImporter, StudentImporter, CourseImporter)
+}
+
+
+# ============= RUNNING =============
+
+def run_import(kind, file, filename, dry_run=False, default_password=''):
+    """Import one file of `kind` (see IMPORTERS); returns the ImportReport"""
+    try:
+        importer = IMPORTERS[kind](default_password=default_password)
+    except KeyError:
+        raise ValueError(f"Unknown import '{kind}'. Choices: {', '.join(IMPORTERS)}")
+    report = ImportReport(kind, dry_run)
+
+    columns, rows = read_rows(file, filename)
+    missing = [c for c in importer.required if c not in columns]
+    if missing:
+        report.errors.append((1, f"Missing column(s): {', '.join(missing)}"))
+        return report
+
+    with transaction.atomic():
+        importer.load()
+        seen = {}
+        for chunk in chunks(rows, IMPORT_CHUNK_SIZE):
+            creates, updates = importer.validate(chunk, report, seen)
+            report.created += len(creates)
+            report.updated += len(updates)
+            # Keep checking the rest of the file after an error, without writing
+            if report.ok and not dry_run:
+                importer.write(creates, updates)
+        if not report.committed:
+            transaction.set_rollback(True)
+
+    if report.committed:
+        importer.invalidate()
+    return report
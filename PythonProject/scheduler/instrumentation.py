@@ -0,0 +1,158 @@
+"""
+Opt-in SQL instrumentation (settings.QUERY_INSTRUMENTATION = True).
+
+QueryBudgetMiddleware records, per URL name: query count, total SQL time,
+duplicated queries (same SQL fingerprint run several times in one request,
+the usual sign of an N+1) and the time spent building the response.
+A request above its budget (settings.QUERY_BUDGETS, else QUERY_BUDGET_DEFAULT)
+logs a warning, or raises QueryBudgetExceeded when QUERY_BUDGET_RAISE is set
+(use it in tests so a regression fails the test).
+
+Aggregates live in the memory of the process and are shown on the admin
+'query_stats' page. Queries run while a streaming response is consumed are
+not counted.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+# Duplicated fingerprints kept per URL name on the stats page
+TOP_DUPLICATES = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so N+1 queries look identical"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', '(...)', sql)
+    return ' '.join(sql.split())
+
+
+class QueryRecorder:
+    """connection.execute_wrapper collecting count, time and fingerprints"""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: n for sql, n in self.fingerprints.items() if n > 1}
+
+
+# ============= AGGREGATES =============
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def record(url_name, recorder, render_time, budget):
+    with _lock:
+        stats = _stats.setdefault(url_name, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'sql_time': 0.0,
+            'render_time': 0.0,
+            'max_render_time': 0.0,
+            'over_budget': 0,
+            'budget': budget,
+            'duplicates': Counter(),
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['max_queries'] = max(stats['max_queries'], recorder.count)
+        stats['sql_time'] += recorder.sql_time
+        stats['render_time'] += render_time
+        stats['max_render_time'] = max(stats['max_render_time'], render_time)
+        stats['over_budget'] += recorder.count > budget
+        stats['duplicates'].update(recorder.duplicates)
+
+
+def get_stats():
+    """One row per URL name, worst average query count first"""
+    rows = []
+    with _lock:
+        for url_name, stats in _stats.items():
+            requests = stats['requests']
+            rows.append({
+                'url_name': url_name,
+                'requests': requests,
+                'budget': stats['budget'],
+                'avg_queries': round(stats['queries'] / requests, 1),
+                'max_queries': stats['max_queries'],
+                'avg_sql_ms': round(1000 * stats['sql_time'] / requests, 1),
+                'avg_render_ms': round(1000 * stats['render_time'] / requests, 1),
+                'max_render_ms': round(1000 * stats['max_render_time'], 1),
+                'over_budget': stats['over_budget'],
+                'duplicates': stats['duplicates'].most_common(TOP_DUPLICATES),
+            })
+    return sorted(rows, key=lambda r: -r['avg_queries'])
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+# ============= MIDDLEWARE =============
+
+def get_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', 50))
+
+
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        render_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        url_name = match.view_name if match else request.path
+        budget = get_budget(url_name)
+        record(url_name, recorder, render_time, budget)
+
+        if recorder.count > budget:
+            duplicates = sorted(recorder.duplicates.items(), key=lambda item: -item[1])
+            message = (
+                f"{url_name}: {recorder.count} queries (budget {budget}), "
+                f"{1000 * recorder.sql_time:.1f} ms SQL, {len(duplicates)} duplicated query(ies)"
+            )
+            for sql, n in duplicates[:TOP_DUPLICATES]:
+                message += f"\n  {n}x {sql}"
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
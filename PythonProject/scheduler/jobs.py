@@ -0,0 +1,123 @@
+"""
+Background timetable generation.
+
+The web tier only enqueues a GenerationJob row; the run_generation_worker
+management command picks jobs up one at a time, reports progress into the
+row and stops early when cancel_requested is set. No external broker needed.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GenerationJob
+from .pdf import prerender_all
+from .utils import TimetableAlgorithm
+
+
+logger = logging.getLogger(__name__)
+
+# Minimum delay between two progress writes (seconds)
+PROGRESS_INTERVAL = 0.5
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def enqueue_generation(user, **options):
+    """
+    Queue a generation unless one is already queued or running.
+    Returns (job, created).
+    """
+    with transaction.atomic():
+        active = GenerationJob.objects.select_for_update().filter(status__in=GenerationJob.ACTIVE_STATUSES).first()
+        if active:
+            return active, False
+        return GenerationJob.objects.create(requested_by=user, options=options), True
+
+
+def request_cancel(job):
+    """Queued jobs are cancelled at once; running ones stop at the next progress report"""
+    GenerationJob.objects.filter(pk=job.pk, status='QUEUED').update(
+        status='CANCELLED', cancel_requested=True, finished_at=timezone.now()
+    )
+    GenerationJob.objects.filter(pk=job.pk, status='RUNNING').update(cancel_requested=True)
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running (never two running jobs at once)"""
+    with transaction.atomic():
+        if GenerationJob.objects.filter(status='RUNNING').exists():
+            return None
+        job = GenerationJob.objects.select_for_update().filter(status='QUEUED').order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = 'RUNNING'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+        return job
+
+
+def fail_stale_jobs():
+    """Jobs left RUNNING by a worker that died can never finish"""
+    return GenerationJob.objects.filter(status='RUNNING').update(
+        status='FAILED', message='Worker stopped before the end of the job.', finished_at=timezone.now()
+    )
+
+
+def _progress_reporter(job):
+    last_write = [0.0]
+
+    def report(done, total):
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_INTERVAL and done < total:
+            return
+        last_write[0] = now
+        # One query: write progress only while the job is not cancelled
+        updated = GenerationJob.objects.filter(pk=job.pk, cancel_requested=False).update(
+            progress_done=done, progress_total=total
+        )
+        if not updated:
+            raise GenerationCancelled()
+
+    return report
+
+
+def run_job(job):
+    """Run one claimed job and store its outcome"""
+    options = dict(job.options)
+    algo = TimetableAlgorithm()
+    progress = _progress_reporter(job)
+
+    try:
+        if options.pop('mode', 'full') == 'incremental':
+            diff = algo.reschedule_incremental(progress=progress)
+            unscheduled = diff['unscheduled']
+            message = (
+                f"Mise à jour incrémentale : {diff['kept']} séance(s) conservée(s), "
+                f"{len(diff['removed'])} retirée(s), {len(diff['added'])} ajoutée(s)."
+            )
+        else:
+            unscheduled = algo.generate_timetable(progress=progress, **options)
+            message = "L'emploi du temps a été généré avec succès !"
+        if unscheduled:
+            message += f" Impossible de placer : {', '.join(unscheduled)}"
+        status = 'DONE'
+    except GenerationCancelled:
+        status, message = 'CANCELLED', "Génération annulée."
+    except Exception as e:
+        status, message = 'FAILED', f"Erreur : {e}"
+
+    GenerationJob.objects.filter(pk=job.pk).update(status=status, message=message, finished_at=timezone.now())
+    job.refresh_from_db()
+
+    if status == 'DONE' and getattr(settings, 'PDF_PRERENDER_WORKERS', 0):
+        # Render the PDFs now rather than during the download spike that follows publication
+        try:
+            prerender_all(settings.PDF_PRERENDER_WORKERS)
+        except Exception:
+            logger.exception("PDF pre-rendering failed after job #%s", job.pk)
+    return job
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduler.archive import archive_term, closed_terms
+from scheduler.models import AcademicTerm
+
+
+class Command(BaseCommand):
+    help = 'Moves closed academic terms (sessions, reservations, unavailabilities) to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', type=int, metavar='ID',
+                            help='Archive this term even if its end date has not passed')
+
+    def handle(self, *args, **options):
+        if options['term']:
+            try:
+                terms = [AcademicTerm.objects.get(pk=options['term'])]
+            except AcademicTerm.DoesNotExist:
+                raise CommandError(f"Term #{options['term']} does not exist.")
+        else:
+            terms = list(closed_terms())
+
+        if not terms:
+            self.stdout.write("Nothing to archive.")
+            return
+
+        for term in terms:
+            try:
+                sessions, reservations, unavailabilities = archive_term(term)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"📦 {term.name}: {sessions} session(s), {reservations} reservation(s) and "
+                f"{unavailabilities} unavailability(ies) archived."
+            ))
@@ -0,0 +1,126 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from scheduler.benchmark import build_synthetic_university, clear_university, run_mode
+from scheduler.solvers import SOLVERS
+
+
+MODES = ['db', *SOLVERS, 'incremental']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks timetable generation on synthetic universities (1x, 10x, 100x the FSTT) '
+        'in a throwaway test database, and saves the results as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help='Multiples of the FSTT')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=[*SOLVERS, 'incremental'],
+                            help="Modes to measure ('db' is the slow query-per-check mode, not run by default)")
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+        parser.add_argument('--time-limit', type=float, default=30, help='Solver time limit (seconds)')
+        parser.add_argument('--no-memory', action='store_true',
+                            help='Skip the second (tracemalloc) run that measures peak memory')
+        parser.add_argument('--output', default='benchmark_results.json',
+                            help='JSON file; each run is appended, tagged with the git commit')
+        parser.add_argument('--baseline', help='Results file of a previous run to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown against the baseline before warning (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        results = []
+        old_name = connection.settings_dict['NAME']
+
+        # Never touch the real data: everything happens in a test database
+        self.stdout.write("🧪 Creating a throwaway test database...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for scale in options['scales']:
+                clear_university()
+                counts = build_synthetic_university(scale, seed=options['seed'])
+                self.stdout.write(f"\n📊 Scale {scale:g}x: {counts}")
+
+                for mode in options['modes']:
+                    result = run_mode(mode, measure_memory=not options['no_memory'], time_limit=options['time_limit'])
+                    result.update(scale=scale, **counts)
+                    results.append(result)
+                    memory = result['peak_memory_kb']
+                    self.stdout.write(
+                        f"   {mode:<13} {result['wall_time']:>9.3f}s {result['queries']:>7} queries "
+                        f"{'-' if memory is None else memory:>8} KB  placed {result['placed']}/{result['courses']} "
+                        f"({result['placement_rate']:.1%})"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        run = {
+            'commit': self.git_commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'seed': options['seed'],
+            'results': results,
+        }
+        self.save_run(options['output'], run)
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Results saved to {options['output']}"))
+
+        if options['baseline']:
+            self.compare(run, self.load_runs(options['baseline'])[-1], options['tolerance'])
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def load_runs(path):
+        if not os.path.exists(path):
+            raise CommandError(f"No results file at {path}.")
+        with open(path) as f:
+            runs = json.load(f)
+        if not runs:
+            raise CommandError(f"{path} does not contain any run.")
+        return runs
+
+    def save_run(self, path, run):
+        runs = self.load_runs(path) if os.path.exists(path) else []
+        runs.append(run)
+        with open(path, 'w') as f:
+            json.dump(runs, f, indent=2)
+
+    def compare(self, run, baseline, tolerance):
+        """Warn about modes that got slower or place fewer courses than the baseline"""
+        self.stdout.write(f"\n🔍 Compared with {baseline['commit']} ({baseline['date']}):")
+        previous = {(r['scale'], r['mode']): r for r in baseline['results']}
+        regressions = 0
+
+        for result in run['results']:
+            old = previous.get((result['scale'], result['mode']))
+            if not old:
+                continue
+            line = (
+                f"   {result['scale']:g}x {result['mode']:<13} "
+                f"{old['wall_time']:.3f}s -> {result['wall_time']:.3f}s, "
+                f"placed {old['placement_rate']:.1%} -> {result['placement_rate']:.1%}"
+            )
+            slower = result['wall_time'] > old['wall_time'] * (1 + tolerance)
+            if slower or result['placement_rate'] < old['placement_rate']:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(f"{line}  ⚠️"))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"⚠️ {regressions} regression(s) against the baseline."))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ No regression against the baseline."))
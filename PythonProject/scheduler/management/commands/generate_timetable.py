@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduler.scoring import score_current_timetable
+from scheduler.solvers import SOLVERS
+from scheduler.utils import TimetableAlgorithm
+
+
+class Command(BaseCommand):
+    help = 'Generates the timetable with the chosen solver backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solver', default='greedy', choices=list(SOLVERS))
+        parser.add_argument('--incremental', action='store_true', help='Only re-place sessions invalidated by changes')
+        parser.add_argument('--time-limit', type=float, default=30, help='Search budget in seconds')
+        parser.add_argument('--max-backtracks', type=int, default=5000, help='Backtracking budget')
+        parser.add_argument('--optimise-seconds', type=float, default=0, help='Soft-constraint local search budget (0 = off)')
+        parser.add_argument('--workers', type=int, default=None, help='Multi-start: worker processes (default: all cores)')
+        parser.add_argument('--starts', type=int, default=None, help='Multi-start: number of randomized orderings')
+        parser.add_argument('--seed', type=int, default=0, help='Multi-start: random seed')
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            return self.handle_incremental()
+
+        self.stdout.write(f"🚀 Generating timetable with the '{options['solver']}' solver...")
+
+        try:
+            unscheduled = TimetableAlgorithm().generate_timetable(
+                solver=options['solver'],
+                optimise_seconds=options['optimise_seconds'],
+                time_limit=options['time_limit'],
+                max_backtracks=options['max_backtracks'],
+                workers=options['workers'],
+                starts=options['starts'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        quality = score_current_timetable(TimetableAlgorithm())
+        self.stdout.write(
+            f"   Seat utilisation {quality['seat_utilisation']}%, {quality['gap_hours']} gap hour(s), "
+            f"{quality['overloaded_days']} overloaded day(s), {quality['building_changes']} building change(s)."
+        )
+
+        if unscheduled:
+            self.stdout.write(self.style.WARNING(f"   ⚠️ {len(unscheduled)} course(s) not placed: {', '.join(unscheduled)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Every course was placed!"))
+
+    def handle_incremental(self):
+        self.stdout.write("🔁 Re-placing invalidated sessions only...")
+        diff = TimetableAlgorithm().reschedule_incremental()
+
+        for line in diff['removed']:
+            self.stdout.write(f"   - {line}")
+        for line in diff['added']:
+            self.stdout.write(f"   + {line}")
+        self.stdout.write(f"   {diff['kept']} session(s) kept, {len(diff['removed'])} removed, {len(diff['added'])} added.")
+
+        if diff['unscheduled']:
+            self.stdout.write(self.style.WARNING(f"   ⚠️ {len(diff['unscheduled'])} course(s) not placed: {', '.join(diff['unscheduled'])}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Timetable up to date!"))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduler.imports import IMPORTERS, run_import
+
+
+class Command(BaseCommand):
+    help = 'Imports rooms, groups, teachers, students or courses from a CSV or Excel (.xlsx) file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(IMPORTERS))
+        parser.add_argument('file', help='.csv or .xlsx file, with a header row')
+        parser.add_argument('--dry-run', action='store_true', help='Check every row and report, write nothing')
+        parser.add_argument('--default-password', default='',
+                            help='Password of the new users without a password column value')
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['kind']]
+        self.stdout.write(f"📥 Importing {importer.name} ({', '.join(importer.columns)})...")
+        started = time.perf_counter()
+        try:
+            with open(options['file'], 'rb') as file:
+                report = run_import(
+                    options['kind'], file, options['file'],
+                    dry_run=options['dry_run'], default_password=options['default_password'],
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for number, message in report.errors:
+            self.stdout.write(self.style.WARNING(f"   ⚠️ Line {number}: {message}"))
+        summary = f"{report.rows} row(s): {report.created} to create, {report.updated} to update"
+        elapsed = f"({time.perf_counter() - started:.1f}s)"
+        if not report.ok:
+            raise CommandError(f"{len(report.errors)} invalid row(s), nothing imported. {summary}.")
+        if report.dry_run:
+            self.stdout.write(self.style.SUCCESS(f"✅ Dry run, nothing written. {summary} {elapsed}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {report.created} {importer.name} created, {report.updated} updated {elapsed}"
+            ))
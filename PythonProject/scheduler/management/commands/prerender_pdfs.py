@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scheduler.pdf import prerender_all
+
+
+class Command(BaseCommand):
+    help = 'Pre-renders the PDF timetable of every teacher, group and filière of the published version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'PDF_PRERENDER_WORKERS', 0) or None,
+                            help='Worker processes (1: render in this process)')
+
+    def handle(self, *args, **options):
+        self.stdout.write("🖨️ Pre-rendering PDF timetables...")
+        started = time.perf_counter()
+        ready = prerender_all(options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {ready} PDF(s) ready in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scheduler.jobs import claim_next_job, fail_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued timetable generation jobs (one at a time)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the queued jobs then exit')
+        parser.add_argument('--poll', type=float, default=2, help='Seconds between two queue checks')
+
+    def handle(self, *args, **options):
+        stale = fail_stale_jobs()
+        if stale:
+            self.stdout.write(self.style.WARNING(f"   ⚠️ {stale} unfinished job(s) marked as failed."))
+
+        self.stdout.write("👷 Waiting for generation jobs...")
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+                continue
+
+            self.stdout.write(f"   Running job #{job.pk} {job.options}...")
+            job = run_job(job)
+            style = self.style.SUCCESS if job.status == 'DONE' else self.style.WARNING
+            self.stdout.write(style(f"   Job #{job.pk}: {job.get_status_display()} - {job.message}"))
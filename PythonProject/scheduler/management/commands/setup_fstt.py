@@ -11,7 +11,7 @@ class Command(BaseCommand):
         with transaction.atomic():
             # 1. CLEANUP ONLY COURSES/SESSIONS/ROOMS (Keep Groups & Filières safe)
             self.stdout.write("   Clearing old schedule data (Courses, Rooms, Sessions)...")
-            ScheduledSession.objects.all().delete()
+            ScheduledSession.all_versions.all().delete()
             Course.objects.all().delete()
             Room.objects.all().delete()
             # Remove old teachers to avoid duplicates
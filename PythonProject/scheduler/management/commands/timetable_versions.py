@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scheduler.models import TimetableVersion
+
+
+class Command(BaseCommand):
+    help = 'Lists, publishes (rollback) or compares timetable versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publish', type=int, metavar='ID', help='Publish this version (instant rollback)')
+        parser.add_argument('--diff', type=int, nargs=2, metavar=('A', 'B'), help='Compare two versions')
+
+    def get_timetable_version(self, version_id):
+        try:
+            return TimetableVersion.objects.get(pk=version_id)
+        except TimetableVersion.DoesNotExist:
+            raise CommandError(f"Version #{version_id} does not exist.")
+
+    def handle(self, *args, **options):
+        if options['publish']:
+            version = self.get_timetable_version(options['publish'])
+            version.publish()
+            self.stdout.write(self.style.SUCCESS(f"✅ {version} is now published."))
+            return
+
+        if options['diff']:
+            a, b = (self.get_timetable_version(v) for v in options['diff'])
+            only_a, only_b = a.diff(b)
+            for row in only_a:
+                self.stdout.write(f"   - #{a.pk}: {row}")
+            for row in only_b:
+                self.stdout.write(f"   + #{b.pk}: {row}")
+            self.stdout.write(f"   {len(only_a)} session(s) only in #{a.pk}, {len(only_b)} only in #{b.pk}.")
+            return
+
+        for version in TimetableVersion.objects.all():
+            flag = '*' if version.is_published else ' '
+            self.stdout.write(f" {flag} #{version.pk} {version.created_at:%d/%m/%Y %H:%M} {version.label} {version.stats}")
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def attach_existing_sessions(apps, schema_editor):
+    """Sessions generated before versioning become the first published version"""
+    ScheduledSession = apps.get_model('scheduler', 'ScheduledSession')
+    TimetableVersion = apps.get_model('scheduler', 'TimetableVersion')
+
+    if ScheduledSession.objects.exists():
+        version = TimetableVersion.objects.create(label='Initial', is_published=True)
+        ScheduledSession.objects.update(version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0003_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimetableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(blank=True, max_length=100)),
+                ('is_published', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('stats', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_published', True)), fields=('is_published',), name='single_published_version')],
+            },
+        ),
+        migrations.AddField(
+            model_name='scheduledsession',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='scheduler.timetableversion'),
+        ),
+        migrations.RunPython(attach_existing_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0004_timetableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservationrequest',
+            name='decision_note',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
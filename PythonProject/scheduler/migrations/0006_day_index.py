@@ -0,0 +1,78 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:37
+
+import scheduler.models
+from django.db import migrations, models
+
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+FRENCH_DAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
+MODELS = ['ScheduledSession', 'ReservationRequest', 'TeacherUnavailability']
+
+
+def day_names_to_index(apps, schema_editor):
+    """'Monday' / 'Lundi' (any case) -> '0', ready for the integer column"""
+    indexes = {}
+    for i, (english, french) in enumerate(zip(DAYS, FRENCH_DAYS)):
+        indexes[english.lower()] = indexes[french.lower()] = str(i)
+    for model_name in MODELS:
+        model = apps.get_model('scheduler', model_name)
+        for value in model._base_manager.values_list('day', flat=True).distinct():
+            index = indexes.get(value.strip().lower())
+            if index is None:
+                raise ValueError(f"{model_name}: unknown day {value!r}, fix it before migrating")
+            model._base_manager.filter(day=value).update(day=index)
+
+
+def day_index_to_names(apps, schema_editor):
+    for model_name in MODELS:
+        model = apps.get_model('scheduler', model_name)
+        for i, day in enumerate(DAYS):
+            model._base_manager.filter(day=str(i)).update(day=day)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0005_reservationrequest_decision_note'),
+    ]
+
+    operations = [
+        # Text columns hold '0'..'5' between the two steps; reversed, the
+        # columns are text again before the names are written back
+        migrations.RunPython(day_names_to_index, day_index_to_names),
+        migrations.AlterField(
+            model_name='reservationrequest',
+            name='day',
+            field=scheduler.models.DayField(),
+        ),
+        migrations.AlterField(
+            model_name='scheduledsession',
+            name='day',
+            field=scheduler.models.DayField(),
+        ),
+        migrations.AlterField(
+            model_name='teacherunavailability',
+            name='day',
+            field=scheduler.models.DayField(),
+        ),
+        migrations.AddIndex(
+            model_name='reservationrequest',
+            index=models.Index(fields=['room', 'day', 'start_hour'], name='reservation_room_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservationrequest',
+            index=models.Index(fields=['teacher', 'day'], name='reservation_teacher_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledsession',
+            index=models.Index(fields=['room', 'day', 'start_hour'], name='session_room_day_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledsession',
+            index=models.Index(fields=['day', 'start_hour'], name='session_day_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teacherunavailability',
+            index=models.Index(fields=['teacher', 'day'], name='unavailability_teacher_day_idx'),
+        ),
+    ]
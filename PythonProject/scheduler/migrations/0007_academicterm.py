@@ -0,0 +1,106 @@
+# Generated by Django 6.0.1 on 2026-10-18 03:05
+
+import django.db.models.deletion
+import scheduler.models
+from django.db import migrations, models
+
+
+def assign_current_term(apps, schema_editor):
+    """Existing rows all belong to one active term"""
+    AcademicTerm = apps.get_model('scheduler', 'AcademicTerm')
+    term = AcademicTerm.objects.create(name='Current term', is_active=True)
+    for model_name in ['ScheduledSession', 'ReservationRequest', 'TeacherUnavailability']:
+        apps.get_model('scheduler', model_name)._base_manager.update(term=term)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0006_day_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcademicTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-start_date', '-id'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_term')],
+            },
+        ),
+        migrations.AddField(
+            model_name='reservationrequest',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.AddField(
+            model_name='scheduledsession',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.AddField(
+            model_name='teacherunavailability',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.RunPython(assign_current_term, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reservationrequest',
+            name='term',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.AlterField(
+            model_name='scheduledsession',
+            name='term',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.AlterField(
+            model_name='teacherunavailability',
+            name='term',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.PROTECT, to='scheduler.academicterm'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('teacher_name', models.CharField(max_length=150)),
+                ('room_name', models.CharField(max_length=100)),
+                ('day', scheduler.models.DayField()),
+                ('start_hour', models.PositiveSmallIntegerField()),
+                ('end_hour', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('APPROVED', 'Approuvée'), ('REJECTED', 'Rejetée')], max_length=10)),
+                ('reason', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_reservations', to='scheduler.academicterm')),
+            ],
+            options={
+                'ordering': ['term', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_name', models.CharField(max_length=200)),
+                ('session_type', models.CharField(max_length=2)),
+                ('teacher_name', models.CharField(max_length=150)),
+                ('filiere_code', models.CharField(max_length=20)),
+                ('group_name', models.CharField(blank=True, max_length=10)),
+                ('room_name', models.CharField(max_length=100)),
+                ('day', scheduler.models.DayField()),
+                ('start_hour', models.PositiveSmallIntegerField()),
+                ('end_hour', models.PositiveSmallIntegerField()),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sessions', to='scheduler.academicterm')),
+            ],
+            options={
+                'ordering': ['term', 'day', 'start_hour'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-18 03:40
+
+from django.db import migrations
+
+
+# PostgreSQL only: GiST exclusion constraints on hour ranges (btree_gist for the = parts).
+# Sessions only clash within one timetable version, reservations when both are approved.
+CONSTRAINTS = [
+    ('scheduler_scheduledsession', 'session_room_no_overlap',
+     'version_id WITH =, room_id WITH =, day WITH =, int4range(start_hour, end_hour) WITH &&', None),
+    ('scheduler_reservationrequest', 'reservation_room_no_overlap',
+     'term_id WITH =, room_id WITH =, day WITH =, int4range(start_hour, end_hour) WITH &&', "status = 'APPROVED'"),
+    ('scheduler_reservationrequest', 'reservation_teacher_no_overlap',
+     'term_id WITH =, teacher_id WITH =, day WITH =, int4range(start_hour, end_hour) WITH &&', "status = 'APPROVED'"),
+]
+
+
+def add_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for table, name, elements, condition in CONSTRAINTS:
+        where = f' WHERE ({condition})' if condition else ''
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist ({elements}){where}')
+
+
+def remove_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, name, _, _ in CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0007_academicterm'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraints, remove_constraints),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:10
+
+import django.db.models.deletion
+import scheduler.models
+from django.db import migrations, models
+
+
+def _full_name(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def fill_entries(apps, schema_editor):
+    """Entries of the published sessions and approved reservations of the active term"""
+    ScheduledSession = apps.get_model('scheduler', 'ScheduledSession')
+    ReservationRequest = apps.get_model('scheduler', 'ReservationRequest')
+    TimetableEntry = apps.get_model('scheduler', 'TimetableEntry')
+
+    sessions = ScheduledSession.objects.filter(version__is_published=True, term__is_active=True).values_list(
+        'id', 'course_id', 'course__name', 'course__session_type',
+        'course__teacher_id', 'course__teacher__first_name', 'course__teacher__last_name', 'course__teacher__username',
+        'course__filiere_id', 'course__filiere__code', 'course__group_id', 'course__group__name',
+        'room_id', 'room__name', 'day', 'start_hour', 'end_hour',
+    )
+    TimetableEntry.objects.bulk_create((
+        TimetableEntry(
+            kind='session', session_id=session_id, course_id=course_id, course_name=name,
+            session_type=session_type, teacher_id=teacher_id,
+            teacher_name=_full_name(first_name, last_name, username),
+            filiere_id=filiere_id, filiere_code=filiere_code, group_id=group_id, group_name=group_name or '',
+            room_id=room_id, room_name=room, day=day, start_hour=start, end_hour=end,
+        )
+        for (session_id, course_id, name, session_type, teacher_id, first_name, last_name, username,
+             filiere_id, filiere_code, group_id, group_name, room_id, room, day, start, end) in sessions
+    ), batch_size=2000)
+
+    reservations = ReservationRequest.objects.filter(status='APPROVED', term__is_active=True).values_list(
+        'id', 'reason', 'teacher_id', 'teacher__first_name', 'teacher__last_name', 'teacher__username',
+        'room_id', 'room__name', 'day', 'start_hour', 'end_hour',
+    )
+    TimetableEntry.objects.bulk_create((
+        TimetableEntry(
+            kind='reservation', reservation_id=reservation_id, course_name=reason, session_type='RES',
+            teacher_id=teacher_id, teacher_name=_full_name(first_name, last_name, username),
+            room_id=room_id, room_name=room, day=day, start_hour=start, end_hour=end,
+        )
+        for (reservation_id, reason, teacher_id, first_name, last_name, username,
+             room_id, room, day, start, end) in reservations
+    ), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0008_overlap_exclusion_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimetableEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('session', 'Session'), ('reservation', 'Reservation')], max_length=11)),
+                ('course_id', models.IntegerField(null=True)),
+                ('teacher_id', models.IntegerField()),
+                ('filiere_id', models.IntegerField(null=True)),
+                ('group_id', models.IntegerField(null=True)),
+                ('room_id', models.IntegerField()),
+                ('course_name', models.TextField()),
+                ('session_type', models.CharField(choices=[('CM', 'Cours Magistral'), ('TD', 'Travaux Dirigés'), ('TP', 'Travaux Pratiques'), ('RES', 'Reservation')], max_length=3)),
+                ('teacher_name', models.CharField(max_length=255)),
+                ('filiere_code', models.CharField(blank=True, max_length=20)),
+                ('group_name', models.CharField(blank=True, max_length=10)),
+                ('room_name', models.CharField(max_length=100)),
+                ('day', scheduler.models.DayField()),
+                ('start_hour', models.PositiveSmallIntegerField()),
+                ('end_hour', models.PositiveSmallIntegerField()),
+                ('reservation', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entry', to='scheduler.reservationrequest')),
+                ('session', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entry', to='scheduler.scheduledsession')),
+            ],
+            options={
+                'verbose_name_plural': 'Timetable entries',
+                'ordering': ['day', 'start_hour'],
+                'indexes': [models.Index(fields=['teacher_id', 'day', 'start_hour'], name='entry_teacher_day_idx'), models.Index(fields=['group_id', 'day', 'start_hour'], name='entry_group_day_idx'), models.Index(fields=['filiere_id', 'day', 'start_hour'], name='entry_filiere_day_idx'), models.Index(fields=['day', 'start_hour'], name='entry_day_start_idx')],
+            },
+        ),
+        migrations.RunPython(fill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:30
+
+import django.db.models.deletion
+import scheduler.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0009_timetableentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUnavailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('teacher_name', models.CharField(max_length=150)),
+                ('day', scheduler.models.DayField()),
+                ('start_hour', models.PositiveSmallIntegerField()),
+                ('end_hour', models.PositiveSmallIntegerField()),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_unavailabilities', to='scheduler.academicterm')),
+            ],
+            options={
+                'ordering': ['term', 'teacher_name', 'day', 'start_hour'],
+            },
+        ),
+    ]
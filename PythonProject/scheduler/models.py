@@ -1,5 +1,60 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.utils.functional import cached_property
+
+
+# ============= DAYS =============
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+# French names, as older unavailability forms sent them
+DAY_ALIASES = {
+    'Lundi': 'Monday',
+    'Mardi': 'Tuesday',
+    'Mercredi': 'Wednesday',
+    'Jeudi': 'Thursday',
+    'Vendredi': 'Friday',
+    'Samedi': 'Saturday',
+}
+
+
+class DayField(models.PositiveSmallIntegerField):
+    """
+    Day of the week stored as its index in DAYS (0 = Monday), so overlap
+    queries compare and index small integers and order_by('day') follows
+    the week. Python code reads and writes the English day name.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', [(day, day) for day in DAYS])
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('choices', None)
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # Not IntegerField's range validators: the Python value is a name
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else DAYS[value]
+
+    def to_python(self, value):
+        if value is None or value in DAYS:
+            return value
+        if value in DAY_ALIASES:
+            return DAY_ALIASES[value]
+        if isinstance(value, int) and 0 <= value < len(DAYS):
+            return DAYS[value]
+        raise ValidationError(f"'{value}' is not a day of the week.", code='invalid')
+
+    def get_prep_value(self, value):
+        value = self.to_python(value)
+        return None if value is None else DAYS.index(value)
 
 # ============= USER MODEL =============
 class User(AbstractUser):
@@ -160,6 +215,19 @@ class Room(models.Model):
 
 
 # ============= COURSE MODEL =============
+class CourseQuerySet(models.QuerySet):
+    def with_student_count(self):
+        """Annotate the head count in SQL so Course.student_count never queries per row"""
+        filiere_total = StudentGroup.objects.filter(
+            filiere=OuterRef('filiere')
+        ).values('filiere').annotate(total=Sum('capacity')).values('total')
+
+        return self.annotate(annotated_student_count=Case(
+            When(group__isnull=False, then=F('group__capacity')),
+            default=Coalesce(Subquery(filiere_total), Value(0)),
+        ))
+
+
 class Course(models.Model):
     """Course can be CM (entire filière) or TD/TP (specific group)"""
     SESSION_TYPE_CHOICES = [
@@ -184,6 +252,8 @@ class Course(models.Model):
     equipment_needed = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
     credits = models.IntegerField(default=3)
+
+    objects = CourseQuerySet.as_manager()
     
     def __str__(self):
         if self.group:
@@ -193,6 +263,9 @@ class Course(models.Model):
     @property
     def student_count(self):
         """Calculate number of students for this course"""
+        # Precomputed by Course.objects.with_student_count()
+        if hasattr(self, 'annotated_student_count'):
+            return self.annotated_student_count
         if self.group:
             # TD/TP - specific group
             return self.group.capacity
@@ -213,19 +286,194 @@ class Course(models.Model):
         ordering = ['filiere', 'session_type', 'name']
 
 
+# ============= TIMETABLE VERSION =============
+class TimetableVersion(models.Model):
+    """
+    One generated timetable. Sessions are written into a new version and the
+    'published' flag is flipped atomically once they are all there, so readers
+    never see a half-written timetable. Older versions stay for rollback/comparison.
+    """
+    label = models.CharField(max_length=100, blank=True)
+    is_published = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    stats = models.JSONField(default=dict, blank=True)  # placed / unscheduled counts
+
+    # Unpublished versions kept for rollback / comparison
+    KEEP_VERSIONS = 10
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(is_published=True).first()
+
+    @classmethod
+    def current_or_create(cls, label='Manual'):
+        return cls.current() or cls.objects.create(label=label, is_published=True)
+
+    @classmethod
+    def prune(cls, keep=None):
+        """Delete the oldest unpublished versions (and their sessions)"""
+        keep = cls.KEEP_VERSIONS if keep is None else keep
+        # Versions of past terms stay until archive_terms moves them away
+        old_ids = list(
+            cls.objects.filter(is_published=False).exclude(sessions__term__is_active=False)
+            .values_list('id', flat=True)[keep:]
+        )
+        cls.objects.filter(id__in=old_ids).delete()
+
+    @classmethod
+    def current_id(cls):
+        return cls.objects.filter(is_published=True).values_list('id', flat=True).first()
+
+    def publish(self):
+        """Make this version the one everybody sees (single transaction)"""
+        from django.utils import timezone
+
+        with transaction.atomic():
+            TimetableVersion.objects.filter(is_published=True).exclude(pk=self.pk).update(is_published=False)
+            self.is_published = True
+            self.published_at = timezone.now()
+            self.save(update_fields=['is_published', 'published_at'])
+
+    def diff(self, other):
+        """Sessions only in self / only in other, as (course, room, day, start, end) tuples"""
+        def rows(version):
+            return set(ScheduledSession.all_versions.filter(version=version).values_list(
+                'course__name', 'room__name', 'day', 'start_hour', 'end_hour'
+            ))
+        mine, theirs = rows(self), rows(other)
+        return sorted(mine - theirs), sorted(theirs - mine)
+
+    def __str__(self):
+        flag = ' (published)' if self.is_published else ''
+        return f"Version #{self.pk} {self.label}{flag}"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_published'], condition=models.Q(is_published=True), name='single_published_version'
+            ),
+        ]
+
+
+# ============= ACADEMIC TERM =============
+class AcademicTerm(models.Model):
+    """
+    A semester. Sessions, reservations and unavailabilities belong to a term
+    and their default managers only return those of the active one; closed
+    terms are moved to the archive tables by the archive_terms command.
+    """
+    name = models.CharField(max_length=100)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(is_active=True).first()
+
+    @classmethod
+    def current_or_create(cls, name='Current term'):
+        return cls.current() or cls.objects.create(name=name, is_active=True)
+
+    @property
+    def is_closed(self):
+        from django.utils import timezone
+
+        return not self.is_active and self.end_date is not None and self.end_date < timezone.localdate()
+
+    def activate(self):
+        """Make this the term everybody sees, with its latest timetable version published"""
+        if self.archived_at:
+            raise ValueError(f"{self} is archived.")
+        with transaction.atomic():
+            AcademicTerm.objects.filter(is_active=True).exclude(pk=self.pk).update(is_active=False)
+            self.is_active = True
+            self.save(update_fields=['is_active'])
+            version = TimetableVersion.objects.filter(sessions__term=self).order_by('-created_at').first()
+            if version:
+                version.publish()
+            else:
+                # Nothing generated for this term yet: an empty timetable
+                TimetableVersion.objects.filter(is_published=True).update(is_published=False)
+
+    def __str__(self):
+        flag = ' (active)' if self.is_active else ''
+        return f"{self.name}{flag}"
+
+    class Meta:
+        ordering = ['-start_date', '-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'], condition=models.Q(is_active=True), name='single_active_term'
+            ),
+        ]
+
+
+class CurrentTermManager(models.Manager):
+    """Only the rows of the active academic term"""
+    def get_queryset(self):
+        return super().get_queryset().filter(term__is_active=True)
+
+
 # ============= SCHEDULED SESSION =============
+class PublishedSessionManager(models.Manager):
+    """Only the sessions of the published timetable version (of the active term)"""
+    def get_queryset(self):
+        return super().get_queryset().filter(version__is_published=True, term__is_active=True)
+
+
 class ScheduledSession(models.Model):
+    version = models.ForeignKey(TimetableVersion, null=True, blank=True, on_delete=models.CASCADE, related_name='sessions')
+    term = models.ForeignKey(AcademicTerm, blank=True, on_delete=models.PROTECT)  # blank: save() uses the active term
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
-    day = models.CharField(max_length=20)
+    day = DayField()
     start_hour = models.IntegerField()
     end_hour = models.IntegerField()
+
+    objects = PublishedSessionManager()
+    all_versions = models.Manager()
+
+    def save(self, *args, **kwargs):
+        # Sessions added by hand go into the published timetable
+        if self.version_id is None:
+            self.version = TimetableVersion.current_or_create()
+        if self.term_id is None:
+            self.term = AcademicTerm.current_or_create()
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # Readable errors for forms. Under concurrent writes, the PostgreSQL exclusion
+        # constraints (migration 0008) are what keeps a room from being double-booked
+        if None in (self.day, self.start_hour, self.end_hour):
+            return
+        if self.start_hour >= self.end_hour:
+            raise ValidationError("L'heure de fin doit être après l'heure de début.")
+        if self.version_id:
+            others = ScheduledSession.all_versions.filter(version_id=self.version_id)
+        else:
+            others = ScheduledSession.objects.all()
+        others = others.filter(
+            day=self.day, start_hour__lt=self.end_hour, end_hour__gt=self.start_hour
+        ).exclude(pk=self.pk)
+        if self.room_id and others.filter(room_id=self.room_id).exists():
+            raise ValidationError({'room': "La salle est déjà occupée à ce créneau."})
+        if self.course_id and others.filter(course__teacher_id=self.course.teacher_id).exists():
+            raise ValidationError({'course': "L'enseignant a déjà cours à ce créneau."})
     
     def __str__(self):
         return f"{self.course.name} - {self.day} ({self.start_hour}:00-{self.end_hour}:00)"
     
     class Meta:
         ordering = ['day', 'start_hour']
+        # Overlap lookups: day=..., start_hour__lt=end, end_hour__gt=start
+        indexes = [
+            models.Index(fields=['room', 'day', 'start_hour'], name='session_room_day_start_idx'),
+            models.Index(fields=['day', 'start_hour'], name='session_day_start_idx'),
+        ]
 
 
 # ============= RESERVATION REQUEST =============
@@ -236,31 +484,219 @@ class ReservationRequest(models.Model):
         ('REJECTED', 'Rejetée'),
     ]
     
+    term = models.ForeignKey(AcademicTerm, blank=True, on_delete=models.PROTECT)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'T'})
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
-    day = models.CharField(max_length=20)
+    day = DayField()
     start_hour = models.IntegerField()
     end_hour = models.IntegerField()
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Why the request was rejected (set by the batch approval)
+    decision_note = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CurrentTermManager()
+    all_terms = models.Manager()
+
+    def save(self, *args, **kwargs):
+        if self.term_id is None:
+            self.term = AcademicTerm.current_or_create()
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # Approved requests follow the rules of the PostgreSQL exclusion constraints (migration 0008)
+        if self.status != 'APPROVED' or None in (self.day, self.start_hour, self.end_hour):
+            return
+        if self.term_id:
+            others = ReservationRequest.all_terms.filter(term_id=self.term_id)
+        else:
+            others = ReservationRequest.objects.all()
+        others = others.filter(
+            status='APPROVED', day=self.day, start_hour__lt=self.end_hour, end_hour__gt=self.start_hour
+        ).exclude(pk=self.pk)
+        if self.room_id and others.filter(room_id=self.room_id).exists():
+            raise ValidationError({'room': "La salle est déjà réservée à ce créneau."})
+        if self.teacher_id and others.filter(teacher_id=self.teacher_id).exists():
+            raise ValidationError("L'enseignant a déjà une réservation à ce créneau.")
     
     def __str__(self):
         return f"Demande de {self.teacher.username} - {self.status}"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['room', 'day', 'start_hour'], name='reservation_room_day_idx'),
+            models.Index(fields=['teacher', 'day'], name='reservation_teacher_day_idx'),
+        ]
 
 
 # ============= TEACHER UNAVAILABILITY =============
 class TeacherUnavailability(models.Model):
+    term = models.ForeignKey(AcademicTerm, blank=True, on_delete=models.PROTECT)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'T'})
-    day = models.CharField(max_length=20)
+    day = DayField()
     start_hour = models.IntegerField()
     end_hour = models.IntegerField()
+
+    objects = CurrentTermManager()
+    all_terms = models.Manager()
+
+    def save(self, *args, **kwargs):
+        if self.term_id is None:
+            self.term = AcademicTerm.current_or_create()
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.teacher.username} busy on {self.day} {self.start_hour}h-{self.end_hour}h"
     
     class Meta:
-        ordering = ['teacher', 'day', 'start_hour']
\ No newline at end of file
+        ordering = ['teacher', 'day', 'start_hour']
+        indexes = [
+            models.Index(fields=['teacher', 'day'], name='unavailability_teacher_day_idx'),
+        ]
+
+# ============= ARCHIVES =============
+class ArchivedSession(models.Model):
+    """A session of an archived term, flattened to names (courses and rooms change over the years)"""
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE, related_name='archived_sessions')
+    course_name = models.CharField(max_length=200)
+    session_type = models.CharField(max_length=2)
+    teacher_name = models.CharField(max_length=150)
+    filiere_code = models.CharField(max_length=20)
+    group_name = models.CharField(max_length=10, blank=True)
+    room_name = models.CharField(max_length=100)
+    day = DayField()
+    start_hour = models.PositiveSmallIntegerField()
+    end_hour = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.course_name} - {self.day} ({self.start_hour}:00-{self.end_hour}:00)"
+
+    class Meta:
+        ordering = ['term', 'day', 'start_hour']
+
+
+class ArchivedReservation(models.Model):
+    """A reservation request of an archived term"""
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE, related_name='archived_reservations')
+    teacher_name = models.CharField(max_length=150)
+    room_name = models.CharField(max_length=100)
+    day = DayField()
+    start_hour = models.PositiveSmallIntegerField()
+    end_hour = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=10, choices=ReservationRequest.STATUS_CHOICES)
+    reason = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Demande de {self.teacher_name} - {self.status}"
+
+    class Meta:
+        ordering = ['term', '-created_at']
+
+
+class ArchivedUnavailability(models.Model):
+    """A teacher unavailability of an archived term"""
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE, related_name='archived_unavailabilities')
+    teacher_name = models.CharField(max_length=150)
+    day = DayField()
+    start_hour = models.PositiveSmallIntegerField()
+    end_hour = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.teacher_name} busy on {self.day} {self.start_hour}h-{self.end_hour}h"
+
+    class Meta:
+        ordering = ['term', 'teacher_name', 'day', 'start_hour']
+
+
+# ============= TIMETABLE ENTRIES =============
+class TimetableEntry(models.Model):
+    """
+    Read model of what everybody sees: one flat row per session of the
+    published timetable and per approved reservation of the active term,
+    with the names and codes the pages show. Timetable pages, exports,
+    feeds and the dashboard read this single table (no join). Written only
+    by scheduler.entries.
+    """
+    KIND_CHOICES = [
+        ('session', 'Session'),
+        ('reservation', 'Reservation'),
+    ]
+    SESSION_TYPE_CHOICES = Course.SESSION_TYPE_CHOICES + [('RES', 'Reservation')]
+
+    kind = models.CharField(max_length=11, choices=KIND_CHOICES)
+    # Deleting the source row deletes its entry
+    session = models.OneToOneField(ScheduledSession, null=True, on_delete=models.CASCADE, related_name='entry')
+    reservation = models.OneToOneField(ReservationRequest, null=True, on_delete=models.CASCADE, related_name='entry')
+
+    # Ids to filter on, plain columns (no foreign key, no join)
+    course_id = models.IntegerField(null=True)
+    teacher_id = models.IntegerField()
+    filiere_id = models.IntegerField(null=True)
+    group_id = models.IntegerField(null=True)
+    room_id = models.IntegerField()
+
+    course_name = models.TextField()  # the reason for a reservation
+    session_type = models.CharField(max_length=3, choices=SESSION_TYPE_CHOICES)
+    teacher_name = models.CharField(max_length=255)
+    filiere_code = models.CharField(max_length=20, blank=True)
+    group_name = models.CharField(max_length=10, blank=True)
+    room_name = models.CharField(max_length=100)
+    day = DayField()
+    start_hour = models.PositiveSmallIntegerField()
+    end_hour = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.course_name} - {self.day} ({self.start_hour}:00-{self.end_hour}:00)"
+
+    class Meta:
+        ordering = ['day', 'start_hour']
+        verbose_name_plural = "Timetable entries"
+        indexes = [
+            models.Index(fields=['teacher_id', 'day', 'start_hour'], name='entry_teacher_day_idx'),
+            models.Index(fields=['group_id', 'day', 'start_hour'], name='entry_group_day_idx'),
+            models.Index(fields=['filiere_id', 'day', 'start_hour'], name='entry_filiere_day_idx'),
+            models.Index(fields=['day', 'start_hour'], name='entry_day_start_idx'),
+        ]
+
+
+# ============= GENERATION JOB =============
+class GenerationJob(models.Model):
+    """Timetable generation queued by the web tier and run by the run_generation_worker command"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'En attente'),
+        ('RUNNING', 'En cours'),
+        ('DONE', 'Terminée'),
+        ('FAILED', 'Échouée'),
+        ('CANCELLED', 'Annulée'),
+    ]
+    ACTIVE_STATUSES = ['QUEUED', 'RUNNING']
+
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    options = models.JSONField(default=dict, blank=True)  # solver, mode, optimise_seconds
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return 0
+        return int(100 * self.progress_done / self.progress_total)
+
+    def __str__(self):
+        return f"Generation #{self.pk} - {self.status}"
+
+    class Meta:
+        ordering = ['-created_at']
@@ -0,0 +1,94 @@
+"""
+Room occupancy matrix: for every room, one integer whose bit
+day_index * 24 + hour is set when the room is taken during that hour
+(published sessions and approved reservations).
+
+Free-room searches, whole-range searches ("free all Tuesday afternoon")
+and "first available slot" lookups are then a few mask tests per room.
+Like the week index, the matrix lives in the process and is rebuilt
+(3 queries) when the published version changes or after an in-place
+edit of sessions or reservations (week_index.invalidate()).
+"""
+import threading
+
+from .grid import DAYS, HOURS
+from .models import ReservationRequest, Room, ScheduledSession, TimetableVersion
+from . import week_index
+
+
+# Bookable hours for "first available slot" searches
+OPEN_HOUR = HOURS[0]
+CLOSE_HOUR = HOURS[-1]
+
+
+def range_mask(day, start, end):
+    """Bits of the hours [start, end) of `day`"""
+    if day not in DAYS or end <= start:
+        return 0
+    offset = DAYS.index(day) * 24
+    return ((1 << (end - start)) - 1) << (offset + start)
+
+
+class RoomOccupancy:
+    """rooms (Room instances, by name) + busy mask per room id"""
+
+    def __init__(self, rooms, busy):
+        self.rooms = rooms
+        self.busy = busy
+
+    def free_rooms(self, slots, min_capacity=0):
+        """Rooms free during every (day, start, end) of `slots` with at least min_capacity seats"""
+        mask = 0
+        for day, start, end in slots:
+            mask |= range_mask(day, start, end)
+        return [
+            room for room in self.rooms
+            if room.capacity >= min_capacity and not self.busy.get(room.id, 0) & mask
+        ]
+
+    def first_available(self, duration, min_capacity=0, days=DAYS, after=None):
+        """
+        First (day, start, rooms) where at least one room with min_capacity
+        seats is free for `duration` hours, searching `days` in week order
+        from `after` = (day, hour) if given. None if the week is full.
+        """
+        rooms = [room for room in self.rooms if room.capacity >= min_capacity]
+        for day in days:
+            if after and DAYS.index(day) < DAYS.index(after[0]):
+                continue
+            first = max(OPEN_HOUR, after[1]) if after and day == after[0] else OPEN_HOUR
+            for start in range(first, CLOSE_HOUR - duration + 1):
+                mask = range_mask(day, start, start + duration)
+                free = [room for room in rooms if not self.busy.get(room.id, 0) & mask]
+                if free:
+                    return day, start, free
+        return None
+
+    @classmethod
+    def build(cls):
+        busy = {}
+        sessions = ScheduledSession.objects.values_list('room_id', 'day', 'start_hour', 'end_hour')
+        reservations = ReservationRequest.objects.filter(status='APPROVED').values_list(
+            'room_id', 'day', 'start_hour', 'end_hour'
+        )
+        for rows in (sessions, reservations):
+            for room_id, day, start, end in rows:
+                busy[room_id] = busy.get(room_id, 0) | range_mask(day, start, end)
+        return cls(list(Room.objects.all()), busy)
+
+
+# ============= PROCESS-WIDE INSTANCE =============
+
+_occupancy = None
+_token = None
+_lock = threading.Lock()
+
+
+def get_occupancy():
+    """The matrix of the published timetable, rebuilt if it changed since the last call"""
+    global _occupancy, _token
+    token = (TimetableVersion.current_id(), week_index.revision())
+    with _lock:
+        if _occupancy is None or token != _token:
+            _occupancy, _token = RoomOccupancy.build(), token
+        return _occupancy
@@ -0,0 +1,159 @@
+"""
+PDF timetables: the weekly grid of a teacher, a group or a filière
+(one page per filière for the whole faculty), drawn with ReportLab.
+
+PDFs are stored with the other exports (exports.cached_export) and keyed
+by published version, so a download is a file read once the PDF exists.
+prerender_all() builds every teacher's and group's PDF in a process pool
+right after a generation, before the "timetable published" traffic.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+import django
+from django.db import connections
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .exports import cached_export
+from .grid import ALL, get_grid
+from .models import Filiere, StudentGroup, User
+
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('teacher', 'group', 'filiere')
+
+SESSION_COLORS = {
+    'CM': colors.HexColor("#E2EFDA"),
+    'TD': colors.HexColor("#FFF2CC"),
+    'TP': colors.HexColor("#DDEBF7"),
+    'RES': colors.HexColor("#F8CBAD"),
+}
+
+_styles = getSampleStyleSheet()
+TITLE_STYLE = _styles['Title']
+CELL_STYLE = ParagraphStyle('cell', parent=_styles['Normal'], fontSize=7, leading=8.5)
+HEADER_STYLE = ParagraphStyle('header', parent=CELL_STYLE, fontName='Helvetica-Bold', alignment=1)
+
+
+# ============= RENDERING =============
+
+def _cell(entry, kind):
+    """Course, type and room, then whoever the reader is not: the group or the teacher"""
+    lines = [f"{entry['session_type_display']} - {entry['room_name']}"]
+    if kind != 'teacher':
+        lines.append(entry['teacher_name'])
+    if kind != 'group' and entry['kind'] == 'session':
+        lines.append(entry['group_name'] or entry['filiere_code'])
+    # Paragraph text is markup: names must be escaped
+    text = f"<b>{escape(entry['course_name'])}</b><br/>" + '<br/>'.join(escape(line) for line in lines)
+    return Paragraph(text, CELL_STYLE)
+
+
+def _grid_table(grid, kind):
+    """The grid as a Table: one column per day, one row per hour, sessions spanning their hours"""
+    data = [[''] + [Paragraph(day, HEADER_STYLE) for day in grid['days']]]
+    style = [
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#5B9BD5")),
+        ('BACKGROUND', (0, 1), (0, -1), colors.HexColor("#F2F2F2")),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ]
+
+    for r, row in enumerate(grid['rows'], start=1):
+        cells = [f"{row['hour']}:00"]
+        for c, slot in enumerate(row['slots'], start=1):
+            if slot['type'] == 'session':
+                entry = slot['session']
+                cells.append(_cell(entry, kind))
+                if slot['rowspan'] > 1:
+                    style.append(('SPAN', (c, r), (c, r + slot['rowspan'] - 1)))
+                color = SESSION_COLORS.get(entry['session_type'])
+                if color:
+                    style.append(('BACKGROUND', (c, r), (c, r + slot['rowspan'] - 1), color))
+            else:
+                cells.append('')
+        data.append(cells)
+
+    day_width = (landscape(A4)[0] - 3.5 * cm) / len(grid['days'])
+    table = Table(
+        data,
+        colWidths=[1.5 * cm] + [day_width] * len(grid['days']),
+        rowHeights=[0.7 * cm] + [1.2 * cm] * len(grid['rows']),
+    )
+    table.setStyle(TableStyle(style))
+    return table
+
+
+def render_pdf(path, kind, pages):
+    """Write one landscape page per (title, grid) to `path`"""
+    doc = SimpleDocTemplate(
+        path, pagesize=landscape(A4),
+        leftMargin=cm, rightMargin=cm, topMargin=cm, bottomMargin=cm,
+    )
+    story = []
+    for title, grid in pages:
+        if story:
+            story.append(PageBreak())
+        story += [Paragraph(escape(title), TITLE_STYLE), Spacer(1, 0.3 * cm), _grid_table(grid, kind)]
+    doc.build(story)
+
+
+def _pages(kind, entity_id):
+    if kind == 'teacher':
+        teacher = User.objects.get(pk=entity_id)
+        return [(f"Emploi du temps - {teacher.get_full_name() or teacher.username}", get_grid(kind, entity_id))]
+    if kind == 'group':
+        group = StudentGroup.objects.select_related('filiere').get(pk=entity_id)
+        return [(f"Emploi du temps - {group}", get_grid(kind, entity_id))]
+    if entity_id == ALL:
+        filieres = Filiere.objects.order_by('code')
+    else:
+        filieres = [Filiere.objects.get(pk=entity_id)]
+    return [(f"Emploi du temps - {f.name} ({f.code})", get_grid('filiere', f.id)) for f in filieres]
+
+
+def get_timetable_pdf(kind, entity_id):
+    """Path of the PDF of a 'teacher', 'group' or 'filiere' (id or ALL), rendered if missing"""
+    return cached_export(f"{kind}-{entity_id}", 'pdf', lambda path: render_pdf(path, kind, _pages(kind, entity_id)))
+
+
+# ============= BATCH PRE-RENDERING =============
+
+def _init_worker():
+    # Needed with the 'spawn' start method (macOS, Windows), a no-op after fork
+    django.setup()
+
+
+def _prerender(target):
+    kind, entity_id = target
+    try:
+        get_timetable_pdf(kind, entity_id)
+        return True
+    except Exception:
+        logger.exception("Could not pre-render the %s %s timetable PDF", kind, entity_id)
+        return False
+
+
+def prerender_all(workers=None):
+    """
+    Render the PDF of every teacher, group and filière of the published
+    timetable, in `workers` processes. Returns the number of PDFs ready.
+    """
+    targets = [('teacher', pk) for pk in User.objects.filter(role='T').values_list('id', flat=True)]
+    targets += [('group', pk) for pk in StudentGroup.objects.values_list('id', flat=True)]
+    targets += [('filiere', pk) for pk in Filiere.objects.values_list('id', flat=True)]
+
+    if workers == 1:
+        return sum(map(_prerender, targets))
+
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return sum(pool.map(_prerender, targets, chunksize=8))
@@ -0,0 +1,259 @@
+"""
+Timetable quality scoring (soft constraints) and local-search improvement.
+
+Hard conflicts are handled by the engine; this module measures how GOOD a
+conflict-free timetable is:
+- seat utilisation / wasted seats (18 Master students in a 150-seat amphi),
+- gap hours: idle timeslots between two sessions of the same day (teachers and groups),
+- overloaded days: groups with more than MAX_SESSIONS_PER_DAY sessions in a day,
+- building changes between consecutive sessions of a group.
+The penalty is kept up to date incrementally, so a move or swap is scored
+by recomputing only the teacher-days and group-days it touches.
+"""
+import random
+import time
+from collections import defaultdict
+
+from .engine import Occupancy, Placement, iter_bits
+
+
+MAX_SESSIONS_PER_DAY = 3
+
+# Penalty weights (lower total penalty = better timetable)
+WEIGHTS = {
+    'wasted_seats': 1,        # per empty seat in a used room
+    'gap_hours': 10,          # per idle hour between two sessions of a day
+    'overloaded_days': 40,    # per group-day above MAX_SESSIONS_PER_DAY
+    'building_changes': 15,   # per building change between consecutive sessions of a group
+}
+
+
+class TimetableScore:
+    """Soft-constraint score of a set of placements, updated incrementally"""
+
+    def __init__(self, snapshot, placements=()):
+        self.snapshot = snapshot
+
+        # day -> slot indexes of that day, in hour order (to find idle slots)
+        self._day_slots = defaultdict(list)
+        for slot, (day, start, end) in sorted(enumerate(snapshot.timeslots), key=lambda x: (x[1][0], x[1][1])):
+            self._day_slots[day].append(slot)
+
+        self.entity_days = defaultdict(dict)  # (kind, id, day) -> {slot: building}
+        self._contributions = {}               # (kind, id, day) -> (gap hours, overloaded, building changes)
+        self.totals = {'wasted_seats': 0, 'gap_hours': 0, 'overloaded_days': 0, 'building_changes': 0}
+        self.seats = 0
+        self.students = 0
+        self.sessions = 0
+
+        for placement in placements:
+            self.add(placement)
+
+    # ----- bookkeeping -----
+
+    def _entities(self, course):
+        """Teacher plus every student group attending the course"""
+        keys = [('teacher', course.teacher_id)]
+        if course.group_id:
+            keys.append(('group', course.group_id))
+        elif self.snapshot.filiere_groups.get(course.filiere_id):
+            keys.extend(('group', g) for g in self.snapshot.filiere_groups[course.filiere_id])
+        else:
+            keys.append(('filiere', course.filiere_id))
+        return keys
+
+    def _contribution(self, key):
+        slots = self.entity_days.get(key)
+        if not slots:
+            return 0, 0, 0
+
+        day_slots = self._day_slots[key[2]]
+        positions = sorted(day_slots.index(s) for s in slots)
+        gap_hours = 0
+        for position in range(positions[0] + 1, positions[-1]):
+            slot = day_slots[position]
+            if slot not in slots:
+                _, start, end = self.snapshot.timeslots[slot]
+                gap_hours += end - start
+
+        # Teachers are not counted for student-facing constraints
+        if key[0] == 'teacher':
+            return gap_hours, 0, 0
+
+        overloaded = 1 if len(slots) > MAX_SESSIONS_PER_DAY else 0
+        buildings = [slots[day_slots[p]] for p in positions]
+        changes = sum(1 for a, b in zip(buildings, buildings[1:]) if a != b)
+        return gap_hours, overloaded, changes
+
+    def _refresh(self, key):
+        old = self._contributions.get(key, (0, 0, 0))
+        new = self._contribution(key)
+        self.totals['gap_hours'] += new[0] - old[0]
+        self.totals['overloaded_days'] += new[1] - old[1]
+        self.totals['building_changes'] += new[2] - old[2]
+        self._contributions[key] = new
+
+    def _update(self, placement, sign):
+        course = self.snapshot.courses_by_id[placement.course_id]
+        room = self.snapshot.rooms_by_id[placement.room_id]
+        day = self.snapshot.timeslots[placement.slot][0]
+
+        self.sessions += sign
+        self.seats += sign * room.capacity
+        self.students += sign * course.student_count
+        self.totals['wasted_seats'] += sign * max(room.capacity - course.student_count, 0)
+
+        for kind, entity_id in self._entities(course):
+            key = (kind, entity_id, day)
+            if sign > 0:
+                self.entity_days[key][placement.slot] = room.building
+            else:
+                self.entity_days[key].pop(placement.slot, None)
+            self._refresh(key)
+
+    def add(self, placement):
+        self._update(placement, 1)
+
+    def remove(self, placement):
+        self._update(placement, -1)
+
+    # ----- results -----
+
+    def penalty(self):
+        return sum(WEIGHTS[name] * value for name, value in self.totals.items())
+
+    def summary(self):
+        """Plain dict for templates / JSON"""
+        # Daily load balance: sessions per day for every group (spread = busiest day - quietest day)
+        days = list(self._day_slots)
+        group_loads = defaultdict(lambda: dict.fromkeys(days, 0))
+        for (kind, entity_id, day), slots in self.entity_days.items():
+            if kind != 'teacher' and slots:
+                group_loads[(kind, entity_id)][day] = len(slots)
+        spreads = [max(loads.values()) - min(loads.values()) for loads in group_loads.values()]
+
+        return {
+            'sessions': self.sessions,
+            'seat_utilisation': round(100 * self.students / self.seats, 1) if self.seats else 0,
+            'wasted_seats': self.totals['wasted_seats'],
+            'gap_hours': self.totals['gap_hours'],
+            'overloaded_days': self.totals['overloaded_days'],
+            'building_changes': self.totals['building_changes'],
+            'max_sessions_per_day': max((max(loads.values()) for loads in group_loads.values()), default=0),
+            'daily_load_spread': round(sum(spreads) / len(spreads), 1) if spreads else 0,
+            'penalty': self.penalty(),
+        }
+
+
+def placements_from_sessions(snapshot, sessions):
+    """(course_id, room_id, day, start_hour, end_hour) rows -> on-grid placements"""
+    placements = []
+    for course_id, room_id, day, start, end in sessions:
+        slot = snapshot.slot_index(day, start, end)
+        if slot is not None and course_id in snapshot.courses_by_id and room_id in snapshot.rooms_by_id:
+            placements.append(Placement(course_id, room_id, slot))
+    return placements
+
+
+def score_current_timetable(algorithm, snapshot=None, sessions=None):
+    """
+    Score the published sessions. Callers that already loaded them pass the
+    snapshot (reservations and unavailabilities are not needed) and/or the
+    (course_id, room_id, day, start, end) rows.
+    """
+    from .models import ScheduledSession
+
+    if snapshot is None:
+        snapshot = algorithm.load_snapshot(blocked=False)
+    if sessions is None:
+        sessions = ScheduledSession.objects.values_list('course_id', 'room_id', 'day', 'start_hour', 'end_hour')
+    return TimetableScore(snapshot, placements_from_sessions(snapshot, sessions)).summary()
+
+
+# ============= LOCAL SEARCH =============
+
+PROGRESS_EVERY = 500
+
+def improve(snapshot, placements, time_limit=5, seed=0, max_iterations=None, progress=None):
+    """
+    Hill climbing on the soft-constraint penalty, run after greedy or a solver.
+    Neighbourhoods: move one session to another free slot/room, or swap the
+    timeslots of two sessions. Moves that do not make the penalty worse are kept.
+    Hard constraints are always respected (moves go through the occupancy bitsets).
+    progress(done, total) is called every PROGRESS_EVERY iterations (it may raise to cancel).
+    """
+    rng = random.Random(seed)
+    occupancy = Occupancy(snapshot)
+    for p in placements:
+        occupancy.place(snapshot.courses_by_id[p.course_id], p.room_id, p.slot)
+
+    score = TimetableScore(snapshot, placements)
+    current = {p.course_id: p for p in placements}
+    course_ids = sorted(current)
+    if not course_ids:
+        return list(placements), score
+
+    room_index = snapshot.room_index
+    deadline = time.monotonic() + time_limit
+    iterations = 0
+
+    def unplace(p):
+        occupancy.remove(snapshot.courses_by_id[p.course_id], p.room_id, p.slot)
+        score.remove(p)
+
+    def place(p):
+        occupancy.place(snapshot.courses_by_id[p.course_id], p.room_id, p.slot)
+        score.add(p)
+
+    while time.monotonic() < deadline and (max_iterations is None or iterations < max_iterations):
+        iterations += 1
+        if progress and iterations % PROGRESS_EVERY == 0:
+            progress(len(course_ids), len(course_ids))
+        before = score.penalty()
+        course = snapshot.courses_by_id[rng.choice(course_ids)]
+        old = current[course.id]
+
+        if rng.random() < 0.5:
+            # Move: another free slot (smallest suitable room) or a better-fitting room
+            unplace(old)
+            slot = rng.choice(list(iter_bits(occupancy.free_slots(course))) or [old.slot])
+            room = room_index.best_fit(course.student_count, course.equipment, slot, occupancy.room)
+            new = [Placement(course.id, room.id, slot)] if room else None
+            olds = [old]
+        else:
+            # Swap the timeslots of two sessions
+            other = snapshot.courses_by_id[rng.choice(course_ids)]
+            other_old = current[other.id]
+            if other.id == course.id or other_old.slot == old.slot:
+                continue
+            unplace(old)
+            unplace(other_old)
+            olds = [old, other_old]
+            new = None
+            if (occupancy.free_slots(course) >> other_old.slot) & 1:
+                room = room_index.best_fit(course.student_count, course.equipment, other_old.slot, occupancy.room)
+                if room:
+                    first = Placement(course.id, room.id, other_old.slot)
+                    place(first)
+                    other_room = None
+                    if (occupancy.free_slots(other) >> old.slot) & 1:
+                        other_room = room_index.best_fit(other.student_count, other.equipment, old.slot, occupancy.room)
+                    unplace(first)
+                    if other_room:
+                        new = [first, Placement(other.id, other_room.id, old.slot)]
+
+        if new:
+            for p in new:
+                place(p)
+            if score.penalty() <= before:
+                for p in new:
+                    current[p.course_id] = p
+                continue
+            for p in new:
+                unplace(p)
+
+        # Rejected or impossible: restore
+        for p in olds:
+            place(p)
+
+    return [current[cid] for cid in course_ids], score
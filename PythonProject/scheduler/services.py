@@ -1,10 +1,13 @@
+from .engine import equipment_satisfies
+
+
 def find_best_room(self, course, rooms, timeslot):
         suitable_rooms = []
 
         for room in rooms:
             if (
                 room.capacity >= course.students_count and
-                all(eq in room.equipment for eq in course.equipment_needed) and
+                equipment_satisfies(room.equipment, course.equipment_needed) and
                 self.room_available(room, timeslot)
             ):
                 suitable_rooms.append(room)
@@ -0,0 +1,130 @@
+"""
+Keep the timetable entry read table (see entries.py), the cached timetable
+grids, the week index, the room occupancy matrix and the dashboard
+statistics in sync with in-place edits of the published timetable (a new
+published version changes the cache keys anyway, and rebuilds the entries).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import entries, grid, stats, week_index
+from .models import (
+    AcademicTerm, Course, Filiere, Room, ScheduledSession, ReservationRequest, StudentGroup,
+    TeacherUnavailability, TimetableEntry, TimetableVersion, User
+)
+
+
+# ============= TIMETABLE ENTRIES =============
+
+@receiver(post_save, sender=TimetableVersion)
+def version_saved(sender, instance, **kwargs):
+    # publish() saves inside its transaction: the entries switch with the version
+    if instance.is_published:
+        entries.rebuild()
+
+
+@receiver(post_save, sender=ScheduledSession)
+def scheduled_session_saved(sender, instance, **kwargs):
+    entries.refresh_sessions(pk=instance.pk)
+
+
+@receiver(post_save, sender=ReservationRequest)
+def reservation_saved(sender, instance, **kwargs):
+    entries.refresh_reservations(pk=instance.pk)
+
+
+def _drop_cached(**lookups):
+    """After a rename: drop the grids showing the entries matching `lookups`, and the week index"""
+    course_ids, teacher_ids = set(), set()
+    for course_id, teacher_id in TimetableEntry.objects.filter(**lookups).values_list('course_id', 'teacher_id'):
+        if course_id:
+            course_ids.add(course_id)
+        teacher_ids.add(teacher_id)
+    grid.invalidate_courses(course_ids)
+    for teacher_id in teacher_ids:
+        grid.invalidate('teacher', teacher_id)
+    week_index.invalidate()
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    # New courses have no session yet
+    if not created:
+        entries.refresh_sessions(course_id=instance.pk)
+        _drop_cached(course_id=instance.pk)
+
+
+@receiver(post_save, sender=User)
+def teacher_saved(sender, instance, created, **kwargs):
+    if created or instance.role != 'T' or kwargs.get('update_fields') == frozenset({'last_login'}):
+        return
+    entries.refresh_sessions(course__teacher_id=instance.pk)
+    entries.refresh_reservations(teacher_id=instance.pk)
+    _drop_cached(teacher_id=instance.pk)
+
+
+@receiver(post_save, sender=Room)
+def room_saved(sender, instance, created, **kwargs):
+    if not created:
+        entries.refresh_sessions(room_id=instance.pk)
+        entries.refresh_reservations(room_id=instance.pk)
+        _drop_cached(room_id=instance.pk)
+
+
+@receiver(post_save, sender=Filiere)
+def filiere_saved(sender, instance, created, **kwargs):
+    if not created:
+        entries.refresh_sessions(course__filiere_id=instance.pk)
+        _drop_cached(filiere_id=instance.pk)
+
+
+@receiver(post_save, sender=StudentGroup)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        entries.refresh_sessions(course__group_id=instance.pk)
+        _drop_cached(group_id=instance.pk)
+
+
+# ============= CACHES =============
+
+@receiver([post_save, post_delete], sender=ScheduledSession)
+def scheduled_session_changed(sender, instance, **kwargs):
+    # Deleting a whole version (pruning) leaves nothing to invalidate: nobody reads its grids
+    origin = kwargs.get('origin')
+    if getattr(origin, 'model', type(origin)) is TimetableVersion:
+        return
+    grid.invalidate_courses([instance.course_id], instance.version_id)
+    week_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=ReservationRequest)
+def reservation_changed(sender, instance, **kwargs):
+    # Cheaper than tracking the previous status: any change drops the teacher grid
+    grid.invalidate('teacher', instance.teacher_id)
+    week_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Room)
+def room_changed(sender, instance, **kwargs):
+    # The occupancy matrix keeps the room list (capacity, name) in memory
+    week_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=AcademicTerm)
+def term_changed(sender, instance, **kwargs):
+    # Another active term: other sessions, reservations and unavailabilities in view
+    if kwargs['signal'] is post_save:
+        entries.rebuild()
+    week_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Filiere)
+@receiver([post_save, post_delete], sender=StudentGroup)
+@receiver([post_save, post_delete], sender=TeacherUnavailability)
+def dashboard_data_changed(sender, instance, **kwargs):
+    # Sessions, reservations and rooms bump the week index revision, which the stats check
+    if kwargs.get('update_fields') == frozenset({'last_login'}):
+        return
+    stats.invalidate()
@@ -0,0 +1,418 @@
+"""
+Pluggable solver backends for timetable generation.
+
+Every solver takes a ProblemSnapshot and returns (placements, unscheduled).
+solve() also accepts progress(done, total), called regularly (it may raise to cancel).
+Pick one by name with get_solver('greedy' | 'backtracking' | 'multistart', **options).
+"""
+import heapq
+import multiprocessing
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .engine import Occupancy, Placement, greedy_place, iter_bits
+
+
+class GreedySolver:
+    """Original first-fit placement (courses in snapshot order)"""
+    name = 'greedy'
+
+    def __init__(self, **options):
+        self.options = options
+
+    def solve(self, snapshot, progress=None):
+        return greedy_place(snapshot, progress=progress)
+
+
+# ============= BACKTRACKING SOLVER =============
+
+class _SearchState:
+    """
+    Occupancy plus the per-slot free room masks used for domain reduction.
+    Domains are cached for the courses not placed yet, and only recomputed for
+    the courses a placement can affect (same teacher, filière or group, or
+    same room class when its last free room at that slot is taken or released).
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.occupancy = Occupancy(snapshot)
+        self.room_index = {room.id: i for i, room in enumerate(snapshot.rooms)}
+        slot_count = len(snapshot.timeslots)
+
+        # slot -> mask of free rooms (bit i = snapshot.rooms[i])
+        all_rooms = (1 << len(snapshot.rooms)) - 1
+        self.slot_rooms = [all_rooms] * slot_count
+        for room_id, blocked in snapshot.room_blocked.items():
+            if room_id not in self.room_index:
+                continue
+            for slot in iter_bits(blocked):
+                self.slot_rooms[slot] &= ~(1 << self.room_index[room_id])
+
+        # Courses with the same head count share the same candidate rooms ("room class")
+        self.course_rooms = {}
+        self.class_unplaced = defaultdict(set)  # room class -> ids of its courses not placed yet
+        for course in snapshot.courses:
+            mask = 0
+            for room in snapshot.rooms_for(course):
+                mask |= 1 << self.room_index[room.id]
+            self.course_rooms[course.id] = mask
+            self.class_unplaced[mask].add(course.id)
+
+        # room class -> mask of slots where at least one room of the class is free
+        self.class_slots = {}
+        for mask in self.class_unplaced:
+            self.class_slots[mask] = sum(
+                1 << slot for slot in range(slot_count) if self.slot_rooms[slot] & mask
+            )
+
+        self.neighbours = self._neighbours(snapshot.courses)
+        self.placed = set()
+        self.domains = {course.id: self.domain(course) for course in snapshot.courses}
+
+    @staticmethod
+    def _neighbours(courses):
+        """course id -> ids of the courses whose free slots depend on its placement"""
+        by_teacher = defaultdict(list)
+        by_filiere = defaultdict(list)
+        filiere_cms = defaultdict(list)
+        by_group = defaultdict(list)
+        for course in courses:
+            by_teacher[course.teacher_id].append(course.id)
+            by_filiere[course.filiere_id].append(course.id)
+            if course.session_type == 'CM':
+                filiere_cms[course.filiere_id].append(course.id)
+            if course.group_id:
+                by_group[course.group_id].append(course.id)
+
+        neighbours = {}
+        for course in courses:
+            ids = set(by_teacher[course.teacher_id])
+            if course.group_id:
+                # Busy group slot: its own courses, plus the CMs of the filière
+                ids.update(by_group[course.group_id], filiere_cms[course.filiere_id])
+            else:
+                ids.update(by_filiere[course.filiere_id])
+            neighbours[course.id] = tuple(ids)
+        return neighbours
+
+    def domain(self, course):
+        """Mask of the slots where the course still has a teacher, students and a room"""
+        return self.occupancy.free_slots(course) & self.class_slots[self.course_rooms[course.id]]
+
+    def values(self, course):
+        """Candidate placements, in timeslot order, each with the best-fit free room"""
+        rooms_mask = self.course_rooms[course.id]
+        values = []
+        for slot in iter_bits(self.domains[course.id]):
+            free = self.slot_rooms[slot] & rooms_mask
+            room = self.snapshot.rooms[(free & -free).bit_length() - 1]
+            values.append(Placement(course.id, room.id, slot))
+        return values
+
+    def _refresh_slot(self, slot):
+        """Update the room classes at `slot`, return the classes that changed"""
+        bit = 1 << slot
+        changed = []
+        for mask, slots in self.class_slots.items():
+            updated = slots | bit if self.slot_rooms[slot] & mask else slots & ~bit
+            if updated != slots:
+                self.class_slots[mask] = updated
+                changed.append(mask)
+        return changed
+
+    def _update_domains(self, course, slot, changed_classes):
+        """
+        Recompute the affected domains of the courses not placed yet,
+        return {course id: previous domain} for those that changed.
+        """
+        previous = {}
+
+        def update(course_id, domain):
+            if domain != self.domains[course_id]:
+                previous.setdefault(course_id, self.domains[course_id])
+                self.domains[course_id] = domain
+
+        # A room class that filled up at `slot` only loses that bit
+        bit = 1 << slot
+        for mask in changed_classes:
+            if self.class_slots[mask] & bit:
+                continue
+            for course_id in self.class_unplaced[mask]:
+                update(course_id, self.domains[course_id] & ~bit)
+
+        affected = set(self.neighbours[course.id])
+        for mask in changed_classes:
+            if self.class_slots[mask] & bit:
+                affected.update(self.class_unplaced[mask])
+        for course_id in affected - self.placed:
+            update(course_id, self.domain(self.snapshot.courses_by_id[course_id]))
+        return previous
+
+    def place(self, course, placement):
+        self.placed.add(course.id)
+        self.class_unplaced[self.course_rooms[course.id]].discard(course.id)
+        self.occupancy.place(course, placement.room_id, placement.slot)
+        self.slot_rooms[placement.slot] &= ~(1 << self.room_index[placement.room_id])
+        return self._update_domains(course, placement.slot, self._refresh_slot(placement.slot))
+
+    def _unplace(self, course, placement):
+        self.placed.discard(course.id)
+        self.class_unplaced[self.course_rooms[course.id]].add(course.id)
+        self.occupancy.remove(course, placement.room_id, placement.slot)
+        self.slot_rooms[placement.slot] |= 1 << self.room_index[placement.room_id]
+        return self._refresh_slot(placement.slot)
+
+    def remove(self, course, placement):
+        # Not placed any more: its own domain is recomputed with the neighbours
+        return self._update_domains(course, placement.slot, self._unplace(course, placement))
+
+    def undo(self, course, placement, previous):
+        """Cancel the place() that returned `previous` (nothing else changed since)"""
+        self._unplace(course, placement)
+        self.domains.update(previous)
+
+
+class BacktrackingSolver:
+    """
+    Constraint-propagation search:
+    - domain reduction on bitsets (free slots x rooms big enough),
+    - most-constrained-variable first (fewest free slots, then fewest rooms),
+    - forward checking (a value may not wipe out another course's domain),
+    - chronological backtracking bounded by max_backtracks and time_limit.
+    Courses that cannot be placed once the budget is spent are reported as unscheduled.
+    With the same data and max_backtracks the result is deterministic
+    (time_limit is only a safety net).
+    """
+    name = 'backtracking'
+
+    def __init__(self, max_backtracks=5000, time_limit=30, **options):
+        self.max_backtracks = max_backtracks
+        self.time_limit = time_limit
+
+    def solve(self, snapshot, progress=None):
+        state = _SearchState(snapshot)
+        order = {course.id: i for i, course in enumerate(snapshot.courses)}
+        unassigned = {course.id: course for course in snapshot.courses}
+        deadline = time.monotonic() + self.time_limit
+        backtracks = 0
+
+        def key(course_id):
+            return (
+                state.domains[course_id].bit_count(),
+                state.course_rooms[course_id].bit_count(),
+                order[course_id],
+            )
+
+        # Priority queue for "most constrained first". Every unassigned course keeps an
+        # entry whose key is <= its real key: entries are only pushed when a domain
+        # shrinks, and an entry found outdated when popped is pushed back with its real key.
+        heap = [(key(course_id), course_id) for course_id in unassigned]
+        heapq.heapify(heap)
+
+        def requeue(changed):
+            for course_id, before in changed.items():
+                if course_id in unassigned and state.domains[course_id].bit_count() < before.bit_count():
+                    heapq.heappush(heap, (key(course_id), course_id))
+
+        def push(course):
+            heapq.heappush(heap, (key(course.id), course.id))
+
+        stack = []  # [course, values, index of the value in use]
+        unscheduled = []
+
+        while unassigned:
+            if progress:
+                progress(len(snapshot.courses) - len(unassigned), len(snapshot.courses))
+
+            # 1. Most constrained variable first
+            while True:
+                course_key, course_id = heapq.heappop(heap)
+                if course_id not in unassigned:
+                    continue
+                current = key(course_id)
+                if course_key == current:
+                    break
+                if course_key < current:
+                    heapq.heappush(heap, (current, course_id))
+            course = unassigned[course_id]
+
+            candidates = state.values(course)
+            if not candidates:
+                # Nothing left for this course: undoing recent choices rarely helps, skip it
+                unscheduled.append(course)
+                del unassigned[course.id]
+                continue
+
+            # 2. Forward checking: drop values that empty another course's domain,
+            #    try the least constraining values first
+            scored = []
+            for value in candidates:
+                wiped, lost = self._forward_check(state, course, value, unassigned)
+                if not wiped:
+                    scored.append((lost, value.slot, value))
+            values = [value for _, _, value in sorted(scored)]
+            if values:
+                del unassigned[course.id]
+                requeue(state.place(course, values[0]))
+                stack.append([course, values, 0])
+                continue
+
+            # 3. Dead end: backtrack while the budget allows it
+            in_budget = backtracks < self.max_backtracks and time.monotonic() < deadline
+            if in_budget and stack:
+                backtracks += 1
+                push(course)
+                while stack:
+                    frame = stack[-1]
+                    previous, previous_values, index = frame
+                    changed = state.remove(previous, previous_values[index])
+                    if index + 1 < len(previous_values):
+                        frame[2] = index + 1
+                        for course_id, before in state.place(previous, previous_values[index + 1]).items():
+                            changed.setdefault(course_id, before)
+                        requeue(changed)
+                        break
+                    stack.pop()
+                    unassigned[previous.id] = previous
+                    requeue(changed)
+                    push(previous)
+                continue
+
+            # 4. Out of budget: take the first value even if it starves another course
+            del unassigned[course.id]
+            requeue(state.place(course, candidates[0]))
+            stack.append([course, candidates, 0])
+
+        placements = [frame[1][frame[2]] for frame in stack]
+        unscheduled.sort(key=lambda c: order[c.id])
+        return placements, unscheduled
+
+    @staticmethod
+    def _forward_check(state, course, value, unassigned):
+        """Return (a domain was wiped out, number of slots lost by the other courses)"""
+        changed = state.place(course, value)
+        try:
+            lost = 0
+            for other_id, before in changed.items():
+                if other_id == course.id or other_id not in unassigned or not before:
+                    continue
+                remaining = state.domains[other_id]
+                if not remaining:
+                    return True, lost
+                lost += before.bit_count() - remaining.bit_count()
+            return False, lost
+        finally:
+            state.undo(course, value, changed)
+
+
+# ============= MULTI-START SOLVER =============
+
+# Snapshot and stop flag shared by the tasks of one worker process (set by _init_worker)
+_worker_snapshot = None
+_worker_stop = None
+
+
+class _StartStopped(Exception):
+    """The solve ended (timeout, cancellation or failure) while this start was running"""
+
+
+def _init_worker(snapshot, stop):
+    global _worker_snapshot, _worker_stop
+    _worker_snapshot, _worker_stop = snapshot, stop
+
+
+def _check_stop(done, total):
+    if _worker_stop.is_set():
+        raise _StartStopped()
+
+
+def _run_start(seed):
+    """One randomized greedy run. Returns plain data: (score, placements, unscheduled ids)"""
+    snapshot = _worker_snapshot
+    courses = list(snapshot.courses)
+    if seed is not None:
+        random.Random(seed).shuffle(courses)
+    placements, unscheduled = greedy_place(snapshot, courses, progress=_check_stop)
+    return score_result(snapshot, placements, unscheduled), placements, [c.id for c in unscheduled]
+
+
+def score_result(snapshot, placements, unscheduled):
+    """Lower is better: (courses not placed, empty seats in the rooms used)"""
+    wasted_seats = sum(
+        snapshot.rooms_by_id[p.room_id].capacity - snapshot.courses_by_id[p.course_id].student_count
+        for p in placements
+    )
+    return len(unscheduled), wasted_seats
+
+
+class MultiStartSolver:
+    """
+    Runs `starts` randomized course orderings of the greedy placement in a
+    process pool and keeps the best one (fewest unscheduled, then best room fit).
+    Start 0 always uses the original order, so the result is never worse than greedy.
+    Workers only receive the plain-data snapshot, never ORM objects, and
+    abandon their running start as soon as the solve ends.
+    """
+    name = 'multistart'
+
+    def __init__(self, workers=None, starts=None, seed=0, time_limit=30, **options):
+        self.workers = workers or os.cpu_count() or 1
+        self.starts = starts or self.workers * 4
+        self.seed = seed
+        self.time_limit = time_limit
+
+    def solve(self, snapshot, progress=None):
+        seeds = [None] + [self.seed + i for i in range(1, self.starts)]
+        deadline = time.monotonic() + self.time_limit
+        best = None
+
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(snapshot, stop),
+        )
+        try:
+            pending = {pool.submit(_run_start, seed): i for i, seed in enumerate(seeds)}
+            while pending:
+                done, _ = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    # Wall-clock limit reached: keep what we have
+                    break
+                if progress:
+                    # Progress here is in finished starts, not placed courses
+                    progress(len(seeds) - len(pending), len(seeds))
+                for future in done:
+                    index = pending.pop(future)
+                    score, placements, unscheduled_ids = future.result()
+                    # Tie on score: the lowest start index wins, so the result does not depend on timing
+                    if best is None or (score, index) < (best[0], best[1]):
+                        best = (score, index, placements, unscheduled_ids)
+        finally:
+            # Also on timeout, cancellation (progress raising) or a failed start:
+            # drop the queued starts, stop the running ones and never wait for them
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if best is None:
+            return greedy_place(snapshot)
+
+        _, _, placements, unscheduled_ids = best
+        return placements, [snapshot.courses_by_id[cid] for cid in unscheduled_ids]
+
+
+SOLVERS = {
+    GreedySolver.name: GreedySolver,
+    BacktrackingSolver.name: BacktrackingSolver,
+    MultiStartSolver.name: MultiStartSolver,
+}
+
+
+def get_solver(name='greedy', **options):
+    try:
+        return SOLVERS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown solver '{name}'. Choices: {', '.join(SOLVERS)}")
@@ -0,0 +1,123 @@
+"""
+Admin dashboard statistics, computed with a fixed number of queries
+(sessions are read once from the TimetableEntry table, without joins) and
+cached: counts, sessions per day and per filière, room utilisation per
+building, teacher load distribution and the timetable quality score.
+
+The cached entry is tagged with the published version and the in-place
+edit revision (bulk writes bump it, see week_index.invalidate()); the
+signal handlers in signals.py drop it when users, rooms, courses,
+filières, sessions, reservations or versions change.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import week_index
+from .grid import DAYS, HOURS
+from .models import Filiere, ReservationRequest, TimetableEntry, TimetableVersion, User
+from .scoring import score_current_timetable
+from .utils import TimetableAlgorithm
+
+
+STATS_KEY = 'stats:dashboard'
+STATS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Teacher weekly hours histogram: [0, 4), [4, 8), ... and LOAD_BUCKETS[-1]+
+LOAD_BUCKETS = [0, 4, 8, 12, 16]
+
+# Hours a room can be booked per week
+WEEKLY_ROOM_HOURS = len(DAYS) * (HOURS[-1] - HOURS[0])
+
+
+def _load_distribution(hours_by_teacher, teachers):
+    """Teachers per weekly-hours bucket (teachers without sessions are in the first one)"""
+    counts = [0] * len(LOAD_BUCKETS)
+    for hours in hours_by_teacher:
+        bucket = sum(1 for lower in LOAD_BUCKETS if hours >= lower) - 1
+        counts[bucket] += 1
+    counts[0] += max(0, teachers - len(hours_by_teacher))
+    labels = [f"{lower}-{upper}h" for lower, upper in zip(LOAD_BUCKETS, LOAD_BUCKETS[1:])]
+    labels.append(f"{LOAD_BUCKETS[-1]}h+")
+    return {'labels': labels, 'counts': counts}
+
+
+def compute_stats():
+    """
+    Every dashboard aggregate, in eight queries whatever the data size: the
+    session entries are read once and feed the per-day, per-filière, per-building
+    and per-teacher totals and the quality score, which reuses the rooms of
+    the snapshot.
+    """
+    users = User.objects.aggregate(
+        students=Count('id', filter=Q(role='S')),
+        teachers=Count('id', filter=Q(role='T')),
+    )
+    reservations = ReservationRequest.objects.aggregate(
+        pending=Count('id', filter=Q(status='PENDING')),
+        approved=Count('id', filter=Q(status='APPROVED')),
+    )
+    filiere_codes = sorted(Filiere.objects.order_by().values_list('code', flat=True))
+    algorithm = TimetableAlgorithm()
+    snapshot = algorithm.load_snapshot(blocked=False)
+
+    sessions = list(TimetableEntry.objects.filter(kind='session').order_by().values_list(
+        'course_id', 'room_id', 'day', 'start_hour', 'end_hour', 'teacher_id', 'filiere_code',
+    ))
+    per_day = Counter()
+    per_filiere = Counter()
+    hours_per_filiere = Counter()
+    hours_per_room = Counter()
+    hours_per_teacher = Counter()
+    for _, room_id, day, start, end, teacher_id, filiere_code in sessions:
+        per_day[day] += 1
+        per_filiere[filiere_code] += 1
+        hours_per_filiere[filiere_code] += end - start
+        hours_per_room[room_id] += end - start
+        hours_per_teacher[teacher_id] += end - start
+
+    rooms_per_building = Counter(room.building for room in snapshot.rooms)
+    hours_per_building = Counter()
+    for room in snapshot.rooms:
+        hours_per_building[room.building] += hours_per_room[room.id]
+    buildings = sorted(rooms_per_building, key=lambda b: b or '')
+    utilisation = [
+        round(100 * hours_per_building[b] / (rooms_per_building[b] * WEEKLY_ROOM_HOURS), 1)
+        for b in buildings
+    ]
+
+    return {
+        'total_students': users['students'],
+        'total_teachers': users['teachers'],
+        'total_rooms': sum(rooms_per_building.values()),
+        'pending_requests': reservations['pending'],
+        'approved_reservations': reservations['approved'],
+        'sessions_per_day': {'labels': DAYS, 'counts': [per_day[day] for day in DAYS]},
+        'sessions_per_filiere': {
+            'labels': filiere_codes,
+            'counts': [per_filiere[code] for code in filiere_codes],
+            'hours': [hours_per_filiere[code] for code in filiere_codes],
+        },
+        'building_utilisation': {
+            'labels': [b or 'Main Building' for b in buildings],
+            'percent': utilisation,
+        },
+        'teacher_load': _load_distribution(list(hours_per_teacher.values()), users['teachers']),
+        'quality': score_current_timetable(algorithm, snapshot, [row[:5] for row in sessions]),
+    }
+
+
+def get_stats():
+    """Cached dashboard statistics of the published timetable"""
+    token = (TimetableVersion.current_id(), week_index.revision())
+    cached = cache.get(STATS_KEY)
+    if cached is not None and cached['token'] == token:
+        return cached['stats']
+    stats = compute_stats()
+    cache.set(STATS_KEY, {'token': token, 'stats': stats}, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate():
+    cache.delete(STATS_KEY)
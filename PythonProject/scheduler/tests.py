@@ -1,3 +1,1069 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import random
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import combinations
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import entries, ical, jobs, occupancy, solvers, stats, week_index
+from .approvals import approve_pending
+from .archive import archive_term, closed_terms
+from .benchmark import build_synthetic_university, run_mode
+from .engine import Occupancy, Placement, greedy_place, iter_bits
+from .exports import CSV_HEADER
+from .grid import get_grid
+from .imports import run_import
+from .jobs import (
+    GenerationCancelled, claim_next_job, enqueue_generation, fail_stale_jobs, request_cancel, run_job,
+)
+from .management.commands.benchmark_scheduler import MODES
+from .models import (
+    AcademicTerm, ArchivedReservation, ArchivedSession, ArchivedUnavailability, Course, Filiere, Level,
+    ReservationRequest, Room, ScheduledSession, StudentGroup, TeacherUnavailability, TimetableEntry,
+    TimetableVersion, User,
+)
+from .pdf import get_timetable_pdf
+from .scoring import TimetableScore, improve
+from .utils import TimetableAlgorithm
+from .week_index import get_week_index
+
+
+# ============= FIXTURE =============
+
+def make_university():
+    """
+    Small faculty: filière AD with groups G1 (32) and G2 (30), an amphi and
+    two rooms, one CM for the filière and one TD per group, each with its teacher.
+    """
+    Level.objects.create(code='L')
+    filiere = Filiere.objects.create(code='AD')
+    g1 = StudentGroup.objects.create(filiere=filiere, name='G1')
+    g2 = StudentGroup.objects.create(filiere=filiere, name='G2')
+    rooms = [
+        Room.objects.create(name='Amphi 1', capacity=100, building='A'),
+        Room.objects.create(name='Salle 1', capacity=40, building='B'),
+        Room.objects.create(name='Salle 2', capacity=40, building='B'),
+    ]
+    teachers = [
+        User.objects.create_user(f"prof{i}", password='x', role='T', first_name=f"Prof {i}")
+        for i in range(1, 4)
+    ]
+    courses = [
+        Course.objects.create(name='Analyse', session_type='CM', teacher=teachers[0], filiere=filiere),
+        Course.objects.create(name='Analyse TD', session_type='TD', teacher=teachers[1], filiere=filiere, group=g1),
+        Course.objects.create(name='Analyse TD', session_type='TD', teacher=teachers[2], filiere=filiere, group=g2),
+    ]
+    return {'filiere': filiere, 'groups': [g1, g2], 'rooms': rooms, 'teachers': teachers, 'courses': courses}
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'revisions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'revisions'},
+    },
+    EXPORT_CACHE_DIR=os.path.join(tempfile.gettempdir(), 'fstt_scheduler_test_exports'),
+    # Salted like the real hasher, much faster
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class SchedulerTestCase(TestCase):
+    """The fixture above, an empty cache and no process-wide index left by another test"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.university = make_university()
+
+    def setUp(self):
+        cache.clear()
+        caches['revisions'].clear()
+        week_index._index = None
+        occupancy._occupancy = None
+
+
+# ============= SOLVERS =============
+
+class SolverTests(SchedulerTestCase):
+    """Every generation mode must give a valid timetable of the fixture, with every course placed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # More sessions competing for the amphi, prof1 and prof2
+        filiere, (g1, g2) = cls.university['filiere'], cls.university['groups']
+        teachers = cls.university['teachers']
+        Course.objects.create(name='Algèbre', session_type='CM', teacher=teachers[0], filiere=filiere)
+        Course.objects.create(name='Algèbre TD', session_type='TD', teacher=teachers[1], filiere=filiere, group=g1)
+        Course.objects.create(name='Algèbre TD', session_type='TD', teacher=teachers[1], filiere=filiere, group=g2)
+
+    def assertValidTimetable(self, unscheduled):
+        self.assertEqual(unscheduled, [])
+        courses = {course.id: course for course in Course.objects.with_student_count()}
+        sessions = list(ScheduledSession.objects.select_related('room'))
+        self.assertCountEqual([s.course_id for s in sessions], courses)
+
+        for session in sessions:
+            self.assertGreaterEqual(session.room.capacity, courses[session.course_id].student_count)
+
+        for a, b in combinations(sessions, 2):
+            if a.day != b.day or a.end_hour <= b.start_hour or b.end_hour <= a.start_hour:
+                continue
+            first, second = courses[a.course_id], courses[b.course_id]
+            self.assertNotEqual(a.room_id, b.room_id)
+            self.assertNotEqual(first.teacher_id, second.teacher_id)
+            if first.filiere_id == second.filiere_id:
+                # Only TD/TP of two different groups may run at the same time
+                self.assertTrue(first.group_id and second.group_id and first.group_id != second.group_id)
+
+    def test_memory_engine(self):
+        self.assertValidTimetable(TimetableAlgorithm().generate_timetable())
+
+    def test_db_mode(self):
+        self.assertValidTimetable(TimetableAlgorithm().generate_timetable(mode='db'))
+
+    def test_backtracking_solver(self):
+        self.assertValidTimetable(TimetableAlgorithm().generate_timetable(solver='backtracking'))
+
+    def test_multistart_solver(self):
+        self.assertValidTimetable(TimetableAlgorithm().generate_timetable(solver='multistart', workers=2, starts=4))
+
+    def test_incremental_reschedule_only_moves_invalid_sessions(self):
+        algorithm = TimetableAlgorithm()
+        algorithm.generate_timetable()
+        salle = self.university['rooms'][1]
+        before = dict(ScheduledSession.objects.values_list('id', 'room_id'))
+        moved = sorted(ScheduledSession.objects.filter(room=salle).values_list('course__name', flat=True))
+        self.assertTrue(moved)
+
+        # Too small for any group now
+        Room.objects.filter(pk=salle.pk).update(capacity=10)
+        diff = algorithm.reschedule_incremental()
+
+        self.assertEqual(diff['kept'], len(before) - len(moved))
+        self.assertEqual(sorted(line.split(' - ')[0] for line in diff['removed']), moved)
+        self.assertEqual(sorted(line.split(' - ')[0] for line in diff['added']), moved)
+        self.assertEqual(diff['unscheduled'], [])
+        # The other sessions are the same rows, untouched
+        kept_ids = {pk for pk, room_id in before.items() if room_id != salle.pk}
+        self.assertEqual(set(ScheduledSession.objects.values_list('id', flat=True)) & set(before), kept_ids)
+        self.assertValidTimetable(diff['unscheduled'])
+
+    def test_rooms_have_the_needed_equipment(self):
+        teacher, group = self.university['teachers'][2], self.university['groups'][0]
+        labo = Room.objects.create(name='Labo 1', capacity=40, building='B', equipment='Projector, Computers')
+        tp = Course.objects.create(
+            name='Analyse TP', session_type='TP', teacher=teacher, filiere=group.filiere, group=group,
+            equipment_needed='computers',
+        )
+        for mode in ('memory', 'db'):
+            with self.subTest(mode=mode):
+                self.assertValidTimetable(TimetableAlgorithm().generate_timetable(mode=mode))
+                self.assertEqual(ScheduledSession.objects.get(course=tp).room, labo)
+
+    def test_incremental_score_matches_a_full_recompute(self):
+        snapshot = TimetableAlgorithm().load_snapshot()
+        placements, _ = greedy_place(snapshot)
+        occupancy = Occupancy(snapshot)
+        for p in placements:
+            occupancy.place(snapshot.courses_by_id[p.course_id], p.room_id, p.slot)
+        score = TimetableScore(snapshot, placements)
+        current = {p.course_id: p for p in placements}
+        rng = random.Random(0)
+
+        for _ in range(200):
+            # Move one session, or swap the timeslots of two
+            courses = rng.sample(snapshot.courses, rng.choice([1, 2]))
+            olds = [current[course.id] for course in courses]
+            for course, old in zip(courses, olds):
+                occupancy.remove(course, old.room_id, old.slot)
+                score.remove(old)
+            if len(olds) == 2:
+                slots = [olds[1].slot, olds[0].slot]
+            else:
+                slots = [rng.randrange(len(snapshot.timeslots))]
+            for course, slot in zip(courses, slots):
+                free = occupancy.free_slots(course)
+                if not (free >> slot) & 1:
+                    # Teacher or group already busy there: the first free slot
+                    slot = next(iter_bits(free))
+                new = Placement(course.id, rng.choice(snapshot.rooms).id, slot)
+                occupancy.place(course, new.room_id, new.slot)
+                score.add(new)
+                current[course.id] = new
+
+            full = TimetableScore(snapshot, current.values())
+            self.assertEqual(score.totals, full.totals)
+            self.assertEqual(score.summary(), full.summary())
+
+    def test_local_search_never_makes_the_timetable_worse(self):
+        algorithm = TimetableAlgorithm()
+        snapshot = algorithm.load_snapshot()
+        placements, _ = greedy_place(snapshot)
+        before = TimetableScore(snapshot, placements).penalty()
+
+        improved, score = improve(snapshot, placements, time_limit=60, max_iterations=2000)
+        self.assertLessEqual(score.penalty(), before)
+        self.assertEqual(score.totals, TimetableScore(snapshot, improved).totals)
+        # Still every course once, without a hard conflict
+        algorithm.save_placements(snapshot, improved)
+        self.assertValidTimetable([])
+
+    def test_multistart_cancel_drops_the_queued_starts(self):
+        def cancel(done, total):
+            raise GenerationCancelled()
+
+        shutdown = ProcessPoolExecutor.shutdown
+        with mock.patch.object(solvers, 'ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool, \
+                mock.patch.object(ProcessPoolExecutor, 'shutdown', autospec=True, side_effect=shutdown) as spy:
+            with self.assertRaises(GenerationCancelled):
+                TimetableAlgorithm().generate_timetable(solver='multistart', workers=1, starts=50, progress=cancel)
+        spy.assert_called_once_with(mock.ANY, wait=False, cancel_futures=True)
+        # The running start is told to stop too
+        snapshot, stop = pool.call_args.kwargs['initargs']
+        self.assertTrue(stop.is_set())
+        self.assertFalse(ScheduledSession.objects.exists())
+
+    def test_multistart_start_stops_with_the_solve(self):
+        stop = threading.Event()
+        solvers._init_worker(TimetableAlgorithm().load_snapshot(), stop)
+        self.addCleanup(solvers._init_worker, None, None)
+        score, placements, unscheduled = solvers._run_start(None)
+        self.assertEqual(unscheduled, [])
+
+        stop.set()
+        with self.assertRaises(solvers._StartStopped):
+            solvers._run_start(1)
+
+
+# ============= COURSES =============
+
+class CourseTests(SchedulerTestCase):
+
+    def test_student_count_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = [
+                (course.name, course.student_count)
+                for course in Course.objects.with_student_count().order_by('name', 'group__name')
+            ]
+        # The CM has the whole filière, a TD its group
+        self.assertEqual(counts, [('Analyse', 62), ('Analyse TD', 32), ('Analyse TD', 30)])
+
+
+# ============= GENERATION JOBS =============
+
+@override_settings(PDF_PRERENDER_WORKERS=0)
+class GenerationJobTests(SchedulerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_user('admin', password='x', role='A', is_staff=True)
+
+    def test_queued_job_runs_to_the_end(self):
+        job, created = enqueue_generation(self.admin, solver='greedy')
+        self.assertTrue(created)
+        self.assertEqual(job.status, 'QUEUED')
+        # One generation at a time
+        self.assertEqual(enqueue_generation(self.admin), (job, False))
+
+        claimed = claim_next_job()
+        self.assertEqual((claimed.pk, claimed.status), (job.pk, 'RUNNING'))
+        self.assertIsNone(claim_next_job())
+
+        with mock.patch.object(jobs, 'PROGRESS_INTERVAL', 0):
+            job = run_job(claimed)
+        self.assertEqual(job.status, 'DONE')
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.progress_total, 3)
+        self.assertGreater(job.progress_done, 0)
+        self.assertEqual(ScheduledSession.objects.count(), 3)
+
+    def test_failed_job(self):
+        enqueue_generation(self.admin, solver='unknown')
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn("Unknown solver 'unknown'", job.message)
+
+    def test_cancel_queued_job(self):
+        job, _ = enqueue_generation(self.admin)
+        request_cancel(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'CANCELLED')
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_next_job())
+        self.assertTrue(enqueue_generation(self.admin)[1])
+
+    def test_cancel_running_job(self):
+        enqueue_generation(self.admin)
+        job = claim_next_job()
+        request_cancel(job)
+        job.refresh_from_db()
+        # Stops at its next progress report
+        self.assertEqual(job.status, 'RUNNING')
+        self.assertTrue(job.cancel_requested)
+
+        job = run_job(job)
+        self.assertEqual(job.status, 'CANCELLED')
+        self.assertFalse(ScheduledSession.objects.exists())
+
+    def test_stale_running_job_is_failed(self):
+        enqueue_generation(self.admin)
+        job = claim_next_job()
+        self.assertEqual(fail_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        # The queue is free again
+        self.assertTrue(enqueue_generation(self.admin)[1])
+        self.assertIsNotNone(claim_next_job())
+
+
+# ============= TIMETABLE VERSIONS =============
+
+class TimetableVersionTests(SchedulerTestCase):
+
+    def published_versions(self):
+        return set(ScheduledSession.objects.values_list('version', flat=True))
+
+    def test_readers_only_see_the_published_version(self):
+        algorithm = TimetableAlgorithm()
+        algorithm.generate_timetable()
+        first = TimetableVersion.current()
+        algorithm.generate_timetable(solver='backtracking')
+        second = TimetableVersion.current()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(TimetableVersion.objects.filter(is_published=True).get(), second)
+        self.assertEqual(ScheduledSession.all_versions.count(), 6)
+        self.assertEqual(self.published_versions(), {second.id})
+
+        # Rollback
+        first.publish()
+        second.refresh_from_db()
+        self.assertFalse(second.is_published)
+        self.assertEqual(self.published_versions(), {first.id})
+
+    def test_failed_generation_keeps_the_published_version(self):
+        algorithm = TimetableAlgorithm()
+        algorithm.generate_timetable()
+        published = TimetableVersion.current()
+
+        with mock.patch.object(ScheduledSession.all_versions, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                algorithm.generate_timetable()
+        self.assertEqual(list(TimetableVersion.objects.all()), [published])
+        self.assertEqual(ScheduledSession.objects.count(), 3)
+
+    def test_single_published_version(self):
+        TimetableAlgorithm().generate_timetable()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimetableVersion.objects.create(label='Manual', is_published=True)
+
+    def test_prune_keeps_the_published_version(self):
+        algorithm = TimetableAlgorithm()
+        for _ in range(3):
+            algorithm.generate_timetable()
+        oldest = TimetableVersion.objects.last()
+        oldest.publish()
+
+        TimetableVersion.prune(keep=0)
+        self.assertEqual(list(TimetableVersion.objects.all()), [oldest])
+        self.assertEqual(ScheduledSession.all_versions.count(), 3)
+
+
+# ============= BENCHMARK =============
+
+class BenchmarkTests(SchedulerTestCase):
+    """Scale 1 of benchmark_scheduler: one synthetic FSTT instead of the fixture"""
+    # The memory path reads everything once and writes in bulk: 24 queries at scale 1
+    # when written, growing with the insert batches only, never per course
+    MEMORY_PATH_QUERIES = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = build_synthetic_university(scale=1)
+
+    def test_every_mode_places_every_session(self):
+        for mode in MODES:
+            with self.subTest(mode=mode):
+                result = run_mode(mode, measure_memory=False)
+                self.assertEqual(result['courses'], self.counts['courses'])
+                self.assertEqual(result['placement_rate'], 1.0)
+                if mode != 'db':
+                    self.assertLessEqual(result['queries'], self.MEMORY_PATH_QUERIES)
+
+
+# ============= GRID / PDF =============
+
+class GridTests(SchedulerTestCase):
+
+    def test_cached_until_the_timetable_changes(self):
+        TimetableAlgorithm().generate_timetable()
+        teacher = self.university['teachers'][0]
+        entries = get_grid('teacher', teacher.id)['entries']
+        self.assertEqual([(e['day'], e['start_hour']) for e in entries], [('Monday', 8)])
+        # Only the published version id is read
+        with self.assertNumQueries(1):
+            self.assertEqual(get_grid('teacher', teacher.id)['entries'], entries)
+
+        session = ScheduledSession.objects.get(course__teacher=teacher)
+        session.day = 'Saturday'
+        session.save()
+        entries = get_grid('teacher', teacher.id)['entries']
+        self.assertEqual([(e['day'], e['start_hour']) for e in entries], [('Saturday', 8)])
+
+    def test_session_ending_after_the_last_hour(self):
+        teacher = self.university['teachers'][1]
+        ScheduledSession.objects.create(
+            course=self.university['courses'][1], room=self.university['rooms'][1],
+            day='Friday', start_hour=17, end_hour=20,
+        )
+        rows = get_grid('teacher', teacher.id)['rows']
+        friday = 4
+        self.assertEqual(rows[-2]['slots'][friday]['rowspan'], 2)
+        self.assertEqual(rows[-1]['slots'][friday]['type'], 'skipped')
+        self.assertTrue(os.path.getsize(get_timetable_pdf('teacher', teacher.id)))
+
+
+# ============= QUERY BUDGETS =============
+
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(SchedulerTestCase):
+    """Pages load within settings.QUERY_BUDGETS (QueryBudgetExceeded fails the test otherwise)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        TimetableAlgorithm().generate_timetable()
+        cls.admin = User.objects.create_user('admin', password='x', role='A', is_staff=True)
+        cls.student = User.objects.create_user(
+            'student', password='x', role='S', student_group=cls.university['groups'][0],
+        )
+
+    def assertPagesWithinBudget(self, user, urls):
+        self.client.force_login(user)
+        for url in urls:
+            # Cold, then served from the caches
+            for attempt in ('cold', 'warm'):
+                with self.subTest(url=url, attempt=attempt):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_admin_dashboard_cold_cache(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_teachers'], 3)
+        self.assertEqual(sum(response.context['sessions_per_day']['counts']), ScheduledSession.objects.count())
+
+    def test_admin_pages(self):
+        filiere = self.university['filiere']
+        self.assertPagesWithinBudget(self.admin, [
+            reverse('admin_dashboard'),
+            reverse('timetable'),
+            f"{reverse('timetable')}?filiere={filiere.id}",
+        ])
+
+    def test_teacher_pages(self):
+        self.assertPagesWithinBudget(self.university['teachers'][0], [
+            reverse('teacher_dashboard'),
+            reverse('teacher_timetable'),
+        ])
+
+    def test_student_pages(self):
+        self.assertPagesWithinBudget(self.student, [
+            reverse('student_dashboard'),
+            reverse('student_timetable'),
+        ])
+
+
+# ============= WEEK INDEX =============
+
+class WeekIndexTests(SchedulerTestCase):
+
+    def test_today_and_next_class(self):
+        # Monday: Analyse 8-10, then the TD of each group 10-12
+        TimetableAlgorithm().generate_timetable()
+        group = self.university['groups'][0].id
+        index = get_week_index()
+
+        def at(entry):
+            return entry['day'], entry['start_hour']
+
+        self.assertEqual([at(e) for e in index.week('group', group)], [('Monday', 8), ('Monday', 10)])
+        self.assertEqual(index.today('group', group, 'Monday'), index.week('group', group))
+        self.assertEqual(index.today('group', group, 'Tuesday'), [])
+        self.assertEqual(at(index.next_class('group', group, 'Monday', 9)), ('Monday', 10))
+        self.assertEqual(at(index.next_class('group', group, 'Monday', 9, include_ongoing=True)), ('Monday', 8))
+        # After the last class of the week: Monday's first one
+        self.assertEqual(at(index.next_class('group', group, 'Saturday', 12)), ('Monday', 8))
+        self.assertIsNone(index.next_class('group', 0, 'Monday', 9))
+
+        # An in-place edit rebuilds the index
+        session = ScheduledSession.objects.get(course=self.university['courses'][1])
+        session.day = 'Tuesday'
+        session.save()
+        self.assertEqual([at(e) for e in get_week_index().today('group', group, 'Tuesday')], [('Tuesday', 10)])
+
+
+# ============= EXPORTS =============
+
+class ExportTests(SchedulerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        TimetableAlgorithm().generate_timetable()
+        cls.admin = User.objects.create_user('admin', password='x', role='A', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        # No export left on disk by another test
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_dir = override_settings(EXPORT_CACHE_DIR=directory.name)
+        export_dir.enable()
+        self.addCleanup(export_dir.disable)
+
+    def csv_rows(self, user):
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_timetable_csv'))
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(response.getvalue().decode('utf-8-sig'))))
+
+    def test_csv(self):
+        rows = self.csv_rows(self.admin)
+        self.assertEqual(rows[0], CSV_HEADER)
+        self.assertCountEqual([row[:2] for row in rows[1:]], [
+            ['Analyse', 'Cours Magistral'], ['Analyse TD', 'Travaux Dirigés'], ['Analyse TD', 'Travaux Dirigés'],
+        ])
+        # A teacher only gets their own courses
+        rows = self.csv_rows(self.university['teachers'][1])
+        self.assertEqual([row[2:5] for row in rows[1:]], [['Prof 2', 'AD - G1', 'Salle 1']])
+
+    def test_excel_is_built_once_per_version(self):
+        self.client.force_login(self.admin)
+        content = self.client.get(reverse('export_excel')).getvalue()
+        rows = load_workbook(io.BytesIO(content), read_only=True).active.iter_rows(values_only=True)
+        self.assertEqual([row[0] for row in rows if row].count('Analyse TD'), 2)
+        files = os.listdir(settings.EXPORT_CACHE_DIR)
+        self.assertEqual(len(files), 1)
+
+        # Same file until another version is published
+        self.assertEqual(self.client.get(reverse('export_excel')).getvalue(), content)
+        self.assertEqual(os.listdir(settings.EXPORT_CACHE_DIR), files)
+        TimetableAlgorithm().generate_timetable()
+        self.client.get(reverse('export_excel')).getvalue()
+        self.assertEqual(len(os.listdir(settings.EXPORT_CACHE_DIR)), 1)
+        self.assertNotEqual(os.listdir(settings.EXPORT_CACHE_DIR), files)
+
+    def test_excel_is_rebuilt_if_the_revision_is_lost(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('export_excel')).getvalue()
+        files = os.listdir(settings.EXPORT_CACHE_DIR)
+
+        # Culling the default cache keeps the revision
+        cache.clear()
+        self.client.get(reverse('export_excel')).getvalue()
+        self.assertEqual(os.listdir(settings.EXPORT_CACHE_DIR), files)
+
+        # A lost revision never falls back to the one the file was built for
+        caches['revisions'].clear()
+        self.client.get(reverse('export_excel')).getvalue()
+        self.assertNotEqual(os.listdir(settings.EXPORT_CACHE_DIR), files)
+
+    def test_pdf(self):
+        self.client.force_login(self.university['teachers'][1])
+        response = self.client.get(reverse('export_pdf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.getvalue().startswith(b'%PDF'))
+
+
+# ============= CALENDAR FEED =============
+
+class CalendarFeedTests(SchedulerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        TimetableAlgorithm().generate_timetable()
+        teacher = self.university['teachers'][1]
+        self.url = reverse('calendar_feed', args=['teacher', teacher.id, ical.feed_token('teacher', teacher.id)])
+
+    def test_feed_then_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(response.content.decode().count('BEGIN:VEVENT'), 1)
+
+        # Unchanged timetable: nothing is sent again
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        # Another published version changes the ETag
+        TimetableAlgorithm().generate_timetable()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_etag_survives_a_cache_clear(self):
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        caches['revisions'].clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_token(self):
+        teacher = self.university['teachers'][1]
+        url = reverse('calendar_feed', args=['teacher', teacher.id, ical.feed_token('teacher', teacher.id + 1)])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+# ============= FREE ROOMS =============
+
+class FreeRoomTests(SchedulerTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Monday: Analyse 8-10 in Amphi 1, the two TDs 10-12 in Salle 1 and Salle 2
+        TimetableAlgorithm().generate_timetable()
+
+    def search(self, **params):
+        self.client.force_login(self.university['teachers'][0])
+        response = self.client.get(reverse('find_rooms'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def free_rooms(self, **params):
+        return sorted(room.name for room in self.search(**params)['available_rooms'])
+
+    def test_free_rooms(self):
+        self.assertEqual(self.free_rooms(day='Monday', start_hour=8, end_hour=12), [])
+        self.assertEqual(self.free_rooms(day='Monday', start_hour=8, end_hour=10), ['Salle 1', 'Salle 2'])
+        self.assertEqual(self.free_rooms(day='Monday', start_hour=10, end_hour=12, min_capacity=50), ['Amphi 1'])
+
+        # Approved reservations count
+        ReservationRequest.objects.create(
+            teacher=self.university['teachers'][0], room=self.university['rooms'][0],
+            day='Tuesday', start_hour=9, end_hour=11, status='APPROVED',
+        )
+        self.assertEqual(self.free_rooms(day='Tuesday', start_hour=10, end_hour=12), ['Salle 1', 'Salle 2'])
+
+    def test_first_free_slot(self):
+        day, start, rooms = self.search(day='Saturday', duration=2)['first_slot']
+        self.assertEqual(day, 'Saturday')
+        self.assertEqual(len(rooms), 3)
+
+    def test_invalid_hours_find_nothing(self):
+        for params in [
+            {'start_hour': -1, 'end_hour': 10},
+            {'start_hour': 16, 'end_hour': 30},
+            {'start_hour': 12, 'end_hour': 12},
+            {'start_hour': 12, 'end_hour': 10},
+            {'start_hour': 'x', 'end_hour': 10},
+        ]:
+            with self.subTest(**params):
+                context = self.search(day='Monday', **params)
+                self.assertEqual(context['available_rooms'], [])
+                self.assertTrue(context['form'].errors)
+
+
+# ============= RESERVATIONS =============
+
+class ApprovalTests(SchedulerTestCase):
+
+    def test_batch_rejects_requests_that_conflict(self):
+        amphi, salle1, salle2 = self.university['rooms']
+        prof1, prof2, prof3 = self.university['teachers']
+        ScheduledSession.objects.create(
+            course=self.university['courses'][1], room=salle1, day='Monday', start_hour=8, end_hour=10,
+        )
+
+        def request(teacher, room, day, start, end):
+            return ReservationRequest.objects.create(
+                teacher=teacher, room=room, day=day, start_hour=start, end_hour=end,
+            ).id
+
+        expected = {
+            request(prof1, salle1, 'Monday', 9, 10): "La salle Salle 1 a cours à ce créneau.",
+            request(prof2, salle2, 'Monday', 8, 9): "L'enseignant a cours à ce créneau.",
+            request(prof1, salle2, 'Tuesday', 10, 12): None,
+            # Conflicts with the request approved just before, in the same batch
+            request(prof3, salle2, 'Tuesday', 11, 12): "La salle Salle 2 est déjà réservée à ce créneau.",
+            request(prof1, amphi, 'Tuesday', 11, 12): "L'enseignant a déjà une réservation à ce créneau.",
+            request(prof3, amphi, 'Tuesday', 11, 12): None,
+        }
+
+        decisions = approve_pending()
+        self.assertEqual({d.reservation.id: d.reason for d in decisions}, expected)
+
+        approved = [pk for pk, reason in expected.items() if reason is None]
+        self.assertCountEqual(ReservationRequest.objects.filter(status='APPROVED').values_list('id', flat=True), approved)
+        self.assertCountEqual(TimetableEntry.objects.filter(kind='reservation').values_list('reservation_id', flat=True), approved)
+        self.assertEqual(
+            dict(ReservationRequest.objects.filter(status='REJECTED').values_list('id', 'decision_note')),
+            {pk: reason for pk, reason in expected.items() if reason},
+        )
+        # Nothing left to decide
+        self.assertEqual(approve_pending(), [])
+
+    def test_overlapping_bookings_do_not_validate(self):
+        amphi, salle1, _ = self.university['rooms']
+        prof1 = self.university['teachers'][0]
+        analyse, td1, td2 = self.university['courses']
+        ScheduledSession.objects.create(course=td1, room=salle1, day='Monday', start_hour=8, end_hour=10)
+        ReservationRequest.objects.create(
+            teacher=prof1, room=amphi, day='Friday', start_hour=8, end_hour=10, status='APPROVED',
+        )
+
+        def errors(instance):
+            with self.assertRaises(ValidationError) as raised:
+                instance.clean()
+            return raised.exception.messages
+
+        self.assertEqual(
+            errors(ScheduledSession(course=td2, room=salle1, day='Monday', start_hour=9, end_hour=11)),
+            ["La salle est déjà occupée à ce créneau."],
+        )
+        self.assertEqual(
+            errors(ScheduledSession(course=td1, room=amphi, day='Monday', start_hour=9, end_hour=11)),
+            ["L'enseignant a déjà cours à ce créneau."],
+        )
+        prof2 = self.university['teachers'][1]
+        self.assertEqual(
+            errors(ReservationRequest(teacher=prof2, room=amphi, day='Friday', start_hour=9, end_hour=10, status='APPROVED')),
+            ["La salle est déjà réservée à ce créneau."],
+        )
+        self.assertEqual(
+            errors(ReservationRequest(teacher=prof1, room=salle1, day='Friday', start_hour=9, end_hour=10, status='APPROVED')),
+            ["L'enseignant a déjà une réservation à ce créneau."],
+        )
+        # Back to back, or a request that is only pending, is fine
+        ScheduledSession(course=td2, room=salle1, day='Monday', start_hour=10, end_hour=12).clean()
+        ReservationRequest(teacher=prof1, room=amphi, day='Friday', start_hour=9, end_hour=10).clean()
+
+
+# ============= DASHBOARD STATISTICS =============
+
+class StatsTests(SchedulerTestCase):
+
+    def test_cached_until_the_data_changes(self):
+        TimetableAlgorithm().generate_timetable()
+        data = stats.get_stats()
+        self.assertEqual((data['total_teachers'], data['total_rooms']), (3, 3))
+        self.assertEqual(sum(data['sessions_per_day']['counts']), 3)
+        # Only the published version id is read
+        with self.assertNumQueries(1):
+            self.assertEqual(stats.get_stats(), data)
+
+        Room.objects.create(name='Salle 3', capacity=40, building='B')
+        self.assertEqual(stats.get_stats()['total_rooms'], 4)
+
+
+# ============= DAY FIELD =============
+
+class DayFieldTests(SchedulerTestCase):
+
+    def test_round_trip(self):
+        course, room = self.university['courses'][0], self.university['rooms'][0]
+        for day in ['Friday', 'Lundi', 'Wednesday']:
+            ScheduledSession.objects.create(course=course, room=room, day=day, start_hour=8, end_hour=10)
+
+        # Names in Python, indexes in the column, week order
+        self.assertEqual(
+            list(ScheduledSession.objects.order_by('day').values_list('day', flat=True)),
+            ['Monday', 'Wednesday', 'Friday'],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT day FROM {ScheduledSession._meta.db_table} ORDER BY day")
+            self.assertEqual([row[0] for row in cursor.fetchall()], [0, 2, 4])
+        self.assertEqual(ScheduledSession.objects.filter(day='Lundi').get().day, 'Monday')
+
+        session = ScheduledSession(course=course, room=room, day='Sunday', start_hour=8, end_hour=10)
+        with self.assertRaises(ValidationError):
+            session.full_clean()
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs the scheduler migrations back and forth on the test database"""
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class DayMigrationTests(MigrationTestCase):
+    """0006_day_index converts the stored day names to indexes, and back when reversed"""
+    before = [('scheduler', '0005_reservationrequest_decision_note')]
+    after = [('scheduler', '0006_day_index')]
+
+    def test_day_names_to_index_and_back(self):
+        apps = self.migrate(self.before)
+        teacher = apps.get_model('scheduler', 'User').objects.create(username='prof', role='T')
+        Unavailability = apps.get_model('scheduler', 'TeacherUnavailability')
+        for day in ['Monday', 'lundi', ' Mercredi', 'SAMEDI']:
+            Unavailability.objects.create(teacher=teacher, day=day, start_hour=8, end_hour=10)
+
+        apps = self.migrate(self.after)
+        Unavailability = apps.get_model('scheduler', 'TeacherUnavailability')
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT day FROM {Unavailability._meta.db_table} ORDER BY id")
+            self.assertEqual([row[0] for row in cursor.fetchall()], [0, 0, 2, 5])
+        self.assertEqual(
+            list(Unavailability.objects.order_by('id').values_list('day', flat=True)),
+            ['Monday', 'Monday', 'Wednesday', 'Saturday'],
+        )
+
+        apps = self.migrate(self.before)
+        Unavailability = apps.get_model('scheduler', 'TeacherUnavailability')
+        self.assertEqual(
+            list(Unavailability.objects.order_by('id').values_list('day', flat=True)),
+            ['Monday', 'Monday', 'Wednesday', 'Saturday'],
+        )
+
+
+# ============= ACADEMIC TERMS =============
+
+class TermTests(SchedulerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        TimetableAlgorithm().generate_timetable()
+        self.autumn = AcademicTerm.current()
+
+    def test_activate(self):
+        spring = AcademicTerm.objects.create(name='Spring')
+        spring.activate()
+        self.assertEqual(AcademicTerm.current(), spring)
+        # Nothing generated for spring yet
+        self.assertIsNone(TimetableVersion.current())
+        self.assertFalse(ScheduledSession.objects.exists())
+
+        self.autumn.activate()
+        self.assertEqual(AcademicTerm.current(), self.autumn)
+        self.assertEqual(ScheduledSession.objects.count(), 3)
+
+    def test_single_active_term(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AcademicTerm.objects.create(name='Spring', is_active=True)
+
+    def test_archive_closed_term(self):
+        amphi, prof1 = self.university['rooms'][0], self.university['teachers'][0]
+        ReservationRequest.objects.create(
+            teacher=prof1, room=amphi, day='Friday', start_hour=8, end_hour=10, status='APPROVED', reason='Examen',
+        )
+        TeacherUnavailability.objects.create(teacher=prof1, day='Saturday', start_hour=8, end_hour=12)
+        self.assertEqual(list(closed_terms()), [])
+        with self.assertRaises(ValueError):
+            archive_term(self.autumn)
+
+        AcademicTerm.objects.create(name='Spring').activate()
+        self.autumn.refresh_from_db()
+        self.autumn.end_date = timezone.localdate() - timedelta(days=1)
+        self.autumn.save()
+        self.assertEqual(list(closed_terms()), [self.autumn])
+
+        self.assertEqual(archive_term(self.autumn), (3, 1, 1))
+        self.assertCountEqual(
+            ArchivedSession.objects.filter(term=self.autumn).values_list('course_name', 'teacher_name', 'room_name'),
+            [('Analyse', 'Prof 1', 'Amphi 1'), ('Analyse TD', 'Prof 2', 'Salle 1'), ('Analyse TD', 'Prof 3', 'Salle 2')],
+        )
+        self.assertEqual(
+            list(ArchivedReservation.objects.values_list('teacher_name', 'room_name', 'day', 'status', 'reason')),
+            [('Prof 1', 'Amphi 1', 'Friday', 'APPROVED', 'Examen')],
+        )
+        self.assertEqual(
+            list(ArchivedUnavailability.objects.values_list('teacher_name', 'day', 'start_hour', 'end_hour')),
+            [('Prof 1', 'Saturday', 8, 12)],
+        )
+        self.assertFalse(ScheduledSession.all_versions.filter(term=self.autumn).exists())
+        self.assertFalse(ReservationRequest.all_terms.filter(term=self.autumn).exists())
+        self.assertFalse(TeacherUnavailability.all_terms.filter(term=self.autumn).exists())
+        self.assertFalse(TimetableVersion.objects.exists())
+        self.assertEqual(list(closed_terms()), [])
+        with self.assertRaises(ValueError):
+            self.autumn.activate()
+
+
+# ============= IMPORTS =============
+
+class ImportTests(SchedulerTestCase):
+
+    def import_rooms(self, text, dry_run=False):
+        return run_import('rooms', io.BytesIO(text.encode()), 'rooms.csv', dry_run=dry_run)
+
+    def test_rooms(self):
+        report = self.import_rooms("name,capacity,building\nSalle 1,45,C\nSalle 3,30,C\n")
+        self.assertTrue(report.committed)
+        self.assertEqual((report.rows, report.created, report.updated), (2, 1, 1))
+        self.assertCountEqual(
+            Room.objects.values_list('name', 'capacity', 'building'),
+            [('Amphi 1', 100, 'A'), ('Salle 1', 45, 'C'), ('Salle 2', 40, 'B'), ('Salle 3', 30, 'C')],
+        )
+
+    def test_dry_run_and_errors_write_nothing(self):
+        report = self.import_rooms("name,capacity\nSalle 3,30\n", dry_run=True)
+        self.assertTrue(report.ok)
+        self.assertFalse(report.committed)
+        self.assertEqual(report.created, 1)
+
+        report = self.import_rooms("name,capacity\nSalle 3,30\nSalle 4,\nSalle 3,20\n")
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertFalse(report.committed)
+        self.assertEqual(Room.objects.count(), 3)
+
+        report = self.import_rooms("name\nSalle 3\n")
+        self.assertEqual(report.errors, [(1, "Missing column(s): capacity")])
+
+    def test_students_sharing_the_default_password_get_their_own_hash(self):
+        csv_file = io.BytesIO(
+            "username,first_name,last_name,filiere,group\n"
+            "s1,A,One,AD,G1\ns2,B,Two,AD,G1\ns3,C,Three,AD,G2\n".encode()
+        )
+        report = run_import('students', csv_file, 'students.csv', default_password='Welcome1')
+        self.assertTrue(report.committed)
+        self.assertEqual(report.created, 3)
+
+        students = User.objects.filter(role='S')
+        self.assertEqual(len({s.password for s in students}), 3)
+        self.assertTrue(all(s.check_password('Welcome1') for s in students))
+        self.assertEqual(students.get(username='s3').student_group, self.university['groups'][1])
+
+
+# ============= TIMETABLE ENTRIES =============
+
+ENTRY_FIELDS = [
+    'kind', 'session_id', 'reservation_id', 'course_id', 'course_name', 'session_type', 'teacher_id',
+    'teacher_name', 'filiere_id', 'filiere_code', 'group_id', 'group_name', 'room_id', 'room_name',
+    'day', 'start_hour', 'end_hour',
+]
+
+
+class TimetableEntryTests(SchedulerTestCase):
+    """The entry table must always hold what a rebuild from the source tables gives"""
+
+    def setUp(self):
+        super().setUp()
+        TimetableAlgorithm().generate_timetable()
+
+    def entries(self):
+        return sorted(TimetableEntry.objects.values_list(*ENTRY_FIELDS), key=repr)
+
+    def assertEntriesUpToDate(self):
+        current = self.entries()
+        entries.rebuild()
+        self.assertEqual(current, self.entries())
+
+    def test_rebuild(self):
+        TimetableEntry.objects.all().delete()
+        entries.rebuild()
+        analyse, td1, _ = self.university['courses']
+        self.assertEqual(
+            sorted(TimetableEntry.objects.values_list('course_name', 'teacher_name', 'filiere_code', 'group_name', 'room_name')),
+            [('Analyse', 'Prof 1', 'AD', '', 'Amphi 1'), ('Analyse TD', 'Prof 2', 'AD', 'G1', 'Salle 1'),
+             ('Analyse TD', 'Prof 3', 'AD', 'G2', 'Salle 2')],
+        )
+        # A new version replaces every entry
+        TimetableAlgorithm().generate_timetable()
+        self.assertEqual(
+            set(TimetableEntry.objects.values_list('session_id', flat=True)),
+            set(ScheduledSession.objects.values_list('id', flat=True)),
+        )
+        self.assertEntriesUpToDate()
+
+    def test_edits_refresh_the_entries(self):
+        analyse, td1, td2 = self.university['courses']
+        amphi, salle1, salle2 = self.university['rooms']
+        prof1 = self.university['teachers'][0]
+
+        analyse.name = 'Analyse 1'
+        analyse.save()
+        amphi.name = 'Amphi A'
+        amphi.save()
+        prof1.first_name, prof1.last_name = 'Marie', 'Curie'
+        prof1.save()
+        session = ScheduledSession.objects.get(course=td1)
+        session.day, session.room = 'Friday', salle2
+        session.save()
+        ScheduledSession.objects.get(course=td2).delete()
+        reservation = ReservationRequest.objects.create(
+            teacher=prof1, room=salle1, day='Saturday', start_hour=8, end_hour=10, reason='Soutenance',
+        )
+        self.assertFalse(TimetableEntry.objects.filter(kind='reservation').exists())
+        reservation.status = 'APPROVED'
+        reservation.save()
+
+        self.assertEqual(
+            sorted(TimetableEntry.objects.values_list('course_name', 'teacher_name', 'room_name', 'day')),
+            [('Analyse 1', 'Marie Curie', 'Amphi A', 'Monday'), ('Analyse TD', 'Prof 2', 'Salle 2', 'Friday'),
+             ('Soutenance', 'Marie Curie', 'Salle 1', 'Saturday')],
+        )
+        self.assertEntriesUpToDate()
+
+    def test_bulk_edits_refresh_the_entries(self):
+        # Bulk writes send no signal: the writer refreshes the entries
+        salle1 = self.university['rooms'][1]
+        Room.objects.filter(pk=salle1.pk).update(name='Salle B1')
+        entries.refresh_sessions(room_id=salle1.pk)
+        self.assertEqual(TimetableEntry.objects.get(room_id=salle1.pk).room_name, 'Salle B1')
+
+        reservation = ReservationRequest.objects.create(
+            teacher=self.university['teachers'][0], room=salle1, day='Saturday', start_hour=8, end_hour=10,
+        )
+        ReservationRequest.objects.filter(pk=reservation.pk).update(status='APPROVED')
+        entries.refresh_reservations(pk=reservation.pk)
+        self.assertEqual(TimetableEntry.objects.get(kind='reservation').reservation_id, reservation.pk)
+        self.assertEntriesUpToDate()
+
+
+class EntryMigrationTests(MigrationTestCase):
+    """0009_timetableentry fills the table from the published sessions and approved reservations"""
+    before = [('scheduler', '0008_overlap_exclusion_constraints')]
+    after = [('scheduler', '0009_timetableentry')]
+
+    def test_fill(self):
+        apps = self.migrate(self.before)
+
+        def model(name):
+            return apps.get_model('scheduler', name).objects
+
+        teacher = model('User').create(username='prof', role='T', first_name='Prof', last_name='One')
+        filiere = model('Filiere').create(code='AD', name='AD', level=model('Level').create(code='L', name='Licence'))
+        course = model('Course').create(name='Analyse', teacher=teacher, filiere=filiere, session_type='CM')
+        room = model('Room').create(name='Amphi 1', capacity=100)
+        term = model('AcademicTerm').create(name='Autumn', is_active=True)
+        for published in (True, False):
+            version = model('TimetableVersion').create(is_published=published)
+            model('ScheduledSession').create(
+                version=version, term=term, course=course, room=room, day='Monday', start_hour=8, end_hour=10,
+            )
+        for status in ('APPROVED', 'PENDING'):
+            model('ReservationRequest').create(
+                term=term, teacher=teacher, room=room, day='Friday', start_hour=8, end_hour=10,
+                status=status, reason='Examen',
+            )
+
+        apps = self.migrate(self.after)
+        self.assertEqual(
+            sorted(model('TimetableEntry').values_list('kind', 'course_name', 'teacher_name', 'room_name', 'day')),
+            [('reservation', 'Examen', 'Prof One', 'Amphi 1', 'Friday'),
+             ('session', 'Analyse', 'Prof One', 'Amphi 1', 'Monday')],
+        )
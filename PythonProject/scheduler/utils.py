@@ -1,4 +1,12 @@
-from .models import ScheduledSession, TeacherUnavailability, Room, Course, Filiere, ReservationRequest
+from django.db import transaction
+
+from .models import (
+    AcademicTerm, ScheduledSession, TeacherUnavailability, Room, Course, Filiere, ReservationRequest, TimetableVersion
+)
+from .engine import Occupancy, ProblemSnapshot, equipment_satisfies, greedy_place, iter_bits
+from .solvers import get_solver
+from .scoring import improve
+from . import entries, grid, week_index
 
 class TimetableAlgorithm:
     def __init__(self):
@@ -8,26 +16,25 @@ class TimetableAlgorithm:
         self.timeslots = [(d, h[0], h[1]) for d in days for h in hours]
 
     def check_conflict(self, day, start, end, room=None, teacher=None, filiere=None, group=None):
-        # 1. Base query: sessions overlapping this time
-        conflicts = ScheduledSession.objects.filter(
-            day=day,
-            start_hour__lt=end,
-            end_hour__gt=start
-        )
+        # 1. Base query: sessions overlapping this time.
+        # Equality columns come first so every lookup below is a range scan of one
+        # composite index: (room, day, start_hour), (day, start_hour) or (teacher, day)
+        overlapping = {'day': day, 'start_hour__lt': end, 'end_hour__gt': start}
+        conflicts = ScheduledSession.objects.filter(**overlapping)
 
         # 2. Check Room
         if room:
-            if conflicts.filter(room=room).exists():
+            if ScheduledSession.objects.filter(room=room, **overlapping).exists():
                 return True
             # Check if room is reserved manually
-            if ReservationRequest.objects.filter(room=room, day=day, start_hour__lt=end, end_hour__gt=start, status='APPROVED').exists():
+            if ReservationRequest.objects.filter(room=room, status='APPROVED', **overlapping).exists():
                 return True
 
         # 3. Check Teacher
         if teacher:
             if conflicts.filter(course__teacher=teacher).exists():
                 return True
-            if TeacherUnavailability.objects.filter(teacher=teacher, day=day, start_hour__lt=end, end_hour__gt=start).exists():
+            if TeacherUnavailability.objects.filter(teacher=teacher, **overlapping).exists():
                 return True
 
         # 4. Check Filière (Prevent stacking CMs)
@@ -46,19 +53,33 @@ class TimetableAlgorithm:
 
         return False
 
-    def generate_timetable(self):
+    def generate_timetable(self, mode='memory', solver='greedy', optimise_seconds=0, progress=None, **solver_options):
+        """
+        mode='memory': load everything once, check conflicts on in-memory bitsets
+        and write the result with a single bulk_create.
+        solver picks the placement backend (see scheduler.solvers.SOLVERS),
+        optimise_seconds > 0 runs the soft-constraint local search afterwards.
+        progress(done, total) is called while placing (it may raise to cancel).
+        mode='db': original version, one ORM query per conflict check.
+        """
+        if mode == 'memory':
+            return self.generate_timetable_in_memory(solver, optimise_seconds, progress, **solver_options)
+
         ScheduledSession.objects.all().delete()
         
         # Prioritize Master courses, then Licence
-        courses = Course.objects.all().order_by('-filiere__level', 'name')
+        courses = Course.objects.with_student_count().order_by('-filiere__level', 'name')
         
         unscheduled = []
 
         for course in courses:
             placed = False
             
-            # Smart Room Selection: Filter rooms big enough
-            rooms = Room.objects.filter(capacity__gte=course.student_count).order_by('capacity')
+            # Smart Room Selection: Filter rooms big enough and equipped
+            rooms = [
+                room for room in Room.objects.filter(capacity__gte=course.student_count).order_by('capacity')
+                if equipment_satisfies(room.equipment, course.equipment_needed)
+            ]
             
             for day, start, end in self.timeslots:
                 # CHECK CONFLICTS
@@ -83,4 +104,110 @@ class TimetableAlgorithm:
             if not placed:
                 unscheduled.append(course.name)
         
-        return unscheduled
\ No newline at end of file
+        return unscheduled
+
+    def load_snapshot(self, blocked=True):
+        return ProblemSnapshot.load(self.timeslots, blocked)
+
+    def generate_timetable_in_memory(self, solver='greedy', optimise_seconds=0, progress=None, **solver_options):
+        snapshot = self.load_snapshot()
+        placements, unscheduled = get_solver(solver, **solver_options).solve(snapshot, progress)
+        if optimise_seconds:
+            placements, _ = improve(snapshot, placements, time_limit=optimise_seconds, progress=progress)
+        self.save_placements(snapshot, placements, label=solver, unscheduled=unscheduled)
+        return [course.name for course in unscheduled]
+
+    def build_sessions(self, snapshot, placements, version):
+        """Unsaved ScheduledSession objects for the placements, in the active term"""
+        term = AcademicTerm.current_or_create()
+        sessions = []
+        for placement in placements:
+            day, start, end = snapshot.timeslots[placement.slot]
+            sessions.append(ScheduledSession(
+                version=version, term=term, course_id=placement.course_id, room_id=placement.room_id,
+                day=day, start_hour=start, end_hour=end
+            ))
+        return sessions
+
+    def save_placements(self, snapshot, placements, label='', unscheduled=()):
+        """
+        Write the placements as a NEW timetable version (one bulk insert) and
+        publish it in the same transaction: readers keep seeing the previous
+        version until the commit, never a half-written one.
+        """
+        with transaction.atomic():
+            version = TimetableVersion.objects.create(
+                label=label, stats={'placed': len(placements), 'unscheduled': len(unscheduled)}
+            )
+            ScheduledSession.all_versions.bulk_create(self.build_sessions(snapshot, placements, version))
+            version.publish()
+
+        TimetableVersion.prune()
+        return version
+
+    def reschedule_incremental(self, progress=None):
+        """
+        Keep every session that is still valid and only re-place the others.
+        A session is invalid when its room is gone, too small or missing equipment, or when it now
+        clashes with an approved reservation, a teacher unavailability or an
+        earlier session (e.g. after a course edit). Courses without a valid
+        session are placed greedily around the kept ones.
+        Returns the diff: {'kept', 'removed', 'added', 'unscheduled'}.
+        """
+        snapshot = self.load_snapshot()
+        occupancy = Occupancy(snapshot)
+
+        existing = ScheduledSession.objects.order_by('id').values_list(
+            'id', 'course_id', 'room_id', 'day', 'start_hour', 'end_hour'
+        )
+
+        kept = 0
+        removed = []  # (session id, course id, day, start, end)
+        placed_courses = set()
+
+        for session_id, course_id, room_id, day, start, end in existing:
+            course = snapshot.courses_by_id.get(course_id)
+            room = snapshot.rooms_by_id.get(room_id)
+            mask = snapshot.slot_mask(day, start, end)
+
+            valid = (
+                course is not None and room is not None
+                and snapshot.room_fits(room, course)
+                and not occupancy.course_busy(course) & mask
+                and not occupancy.room[room_id] & mask
+            )
+            if not valid:
+                removed.append((session_id, course_id, day, start, end))
+                continue
+
+            # Sessions added by hand may span several timeslots
+            for slot in iter_bits(mask):
+                occupancy.place(course, room_id, slot)
+            placed_courses.add(course_id)
+            kept += 1
+
+        missing = [c for c in snapshot.courses if c.id not in placed_courses]
+        placements, unscheduled = greedy_place(snapshot, missing, occupancy, progress)
+        # Small edits are applied in place to the published version (one transaction)
+        with transaction.atomic():
+            version = TimetableVersion.current_or_create()
+            new_sessions = self.build_sessions(snapshot, placements, version)
+            ScheduledSession.objects.filter(id__in=[r[0] for r in removed]).delete()
+            ScheduledSession.all_versions.bulk_create(new_sessions)
+            # bulk_create sends no signal: write the entries of the added courses here
+            entries.refresh_sessions(version=version, course_id__in=[p.course_id for p in placements])
+        # ... and drop the cached grids of the added courses and the week index
+        grid.invalidate_courses([p.course_id for p in placements])
+        week_index.invalidate()
+
+        def describe(course_id, day, start, end):
+            course = snapshot.courses_by_id.get(course_id)
+            name = course.name if course else f"Course #{course_id}"
+            return f"{name} - {day} ({start}:00-{end}:00)"
+
+        return {
+            'kept': kept,
+            'removed': [describe(*r[1:]) for r in removed],
+            'added': [describe(s.course_id, s.day, s.start_hour, s.end_hour) for s in new_sessions],
+            'unscheduled': [course.name for course in unscheduled],
+        }
@@ -5,40 +5,46 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout, update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_POST
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q
 from django.utils import timezone
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 
 # Python Standard Library
-import csv
 import json
 from datetime import datetime, timedelta
 
-# Excel/PDF Libraries
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import landscape, letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-
 # Local Imports
 from .models import (
-    Room, Course, ReservationRequest, User, ScheduledSession, 
-    Filiere, TeacherUnavailability
+    Room, Course, ReservationRequest, User,
+    Filiere, TeacherUnavailability, GenerationJob
 )
 from .forms import (
     ReservationForm, CourseForm, TeacherForm, TeacherEditForm,
-    RoomSearchForm, SessionForm, TeacherUnavailabilityForm, ProfileForm
+    RoomSearchForm, SessionForm, TeacherUnavailabilityForm, ProfileForm, ImportForm
 )
-from .utils import TimetableAlgorithm
+from .solvers import SOLVERS
+from .jobs import enqueue_generation, request_cancel
+from .exports import cached_export, scoped_sessions, stream_csv, timetable_rows, write_timetable_workbook
+from .grid import ALL as ALL_FILIERES, DAYS as GRID_DAYS, HOURS, get_grid
+from .week_index import get_week_index
+from .approvals import approve_pending
+from .imports import IMPORTERS, run_import
+from .instrumentation import get_stats, reset_stats
+from .occupancy import get_occupancy
+from .stats import get_stats as get_dashboard_stats
+from .pdf import KINDS as PDF_KINDS, get_timetable_pdf
+from . import ical
 
 
 # ============= VIEWS =============
 
+# Rejection reasons listed after a batch approval (the rest are counted)
+MAX_REJECTION_MESSAGES = 20
+
 @login_required
 def dashboard_router(request):
     """The 'Home' page that redirects users based on their role"""
@@ -54,34 +60,22 @@ def dashboard_router(request):
 
 
 def admin_dashboard(request):
-    # 1. Fetch Real Data from Database
-    total_students = User.objects.filter(role='S').count()
-    total_teachers = User.objects.filter(role='T').count()
-    total_rooms = Room.objects.count()
-    
-    # Get the actual reservation objects (not just the count)
-    pending_reservations = ReservationRequest.objects.filter(status='PENDING')
-    pending_requests = pending_reservations.count()
+    # 1. Counts, charts and timetable quality: cached until the data changes
+    stats = get_dashboard_stats()
 
-    # 2. Data for the Chart
-    sessions_per_day = ScheduledSession.objects.values('day').annotate(count=Count('id'))
-    
-    if not sessions_per_day:
-        chart_labels = ["Mon", "Tue", "Wed", "Thu", "Fri"]
-        chart_data = [0, 0, 0, 0, 0]
-    else:
-        chart_labels = [item['day'] for item in sessions_per_day]
-        chart_data = [item['count'] for item in sessions_per_day]
+    # 2. Latest pending requests for the table (the total is in the stats)
+    pending_reservations = list(
+        ReservationRequest.objects.filter(status='PENDING').select_related('teacher', 'room')[:5]
+    )
 
     # 3. Pack everything into context
     context = {
-        'total_students': total_students,
-        'total_teachers': total_teachers,
-        'total_rooms': total_rooms,
-        'pending_requests': pending_requests,
+        **stats,
         'pending_reservations': pending_reservations,
-        'chart_labels': chart_labels,
-        'chart_data': chart_data,
+        'chart_labels': stats['sessions_per_day']['labels'],
+        'chart_data': stats['sessions_per_day']['counts'],
+        'solvers': list(SOLVERS),
+        'generation_job': GenerationJob.objects.first(),
     }
 
     return render(request, 'scheduler/dashboard.html', context)
@@ -90,108 +84,29 @@ def admin_dashboard(request):
 @login_required
 def teacher_timetable(request):
     """Dedicated timetable page for teachers with Rowspan logic"""
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    hours = range(8, 19)
-    
-    # 1. Get official classes (ScheduledSession)
-    sessions = ScheduledSession.objects.filter(
-        course__teacher=request.user
-    ).select_related('course', 'room', 'course__filiere')
-
-    # --- Fetch Approved Reservations ---
-    reservations = ReservationRequest.objects.filter(
-        teacher=request.user,
-        status='APPROVED'
-    )
-    
-    # 2. Calculate stats
-    total_sessions = sessions.count() + reservations.count() # Update count
-    
-    # Calculate weekly hours (Sessions + Reservations)
-    session_hours = sum([(s.end_hour - s.start_hour) for s in sessions])
-    reservation_hours = sum([(r.end_hour - r.start_hour) for r in reservations])
-    weekly_hours = session_hours + reservation_hours
-    
+    # Sessions + approved reservations, cached until the timetable changes
+    timetable = get_grid('teacher', request.user.id)
+    entries = timetable['entries']
+
     now = timezone.localtime()
     today_name = now.strftime('%A')
-    
-    today_sessions_count = sessions.filter(day=today_name).count() + reservations.filter(day=today_name).count()
-    
-    # Next class logic (Check both sessions and reservations)
-    next_class = sessions.filter(day=today_name, start_hour__gte=now.hour).order_by('start_hour').first()
-    if not next_class:
-        # If no official class, check if there is a reservation
-        next_class = reservations.filter(day=today_name, start_hour__gte=now.hour).order_by('start_hour').first()
-        # If found, we need to hack it slightly so the template can read 'course.name'
-        if next_class:
-            class TempCourse:
-                name = next_class.reason
-                get_session_type_display = "Reservation"
-            next_class.course = TempCourse()
-
-    # 3. Build a quick lookup dictionary
-    session_map = {}
-    
-    # Add Official Sessions
-    for s in sessions:
-        session_map[(s.day, s.start_hour)] = s
-        
-    for r in reservations:
-        # We need to make the Reservation look like a Session for the HTML template
-        # The template expects: session.course.name, session.course.get_session_type_display, etc.
-        class PlaceholderCourse:
-            name = r.reason  # Use the 'Reason' as the Course Name
-            session_type = "RES" 
-            get_session_type_display = "Reservation" # Label for the badge
-            group = None     # No group
-            filiere = None   # No filiere
-            
-            # Helper to prevent template errors
-            class FilierePlaceHolder:
-                code = "PERSO"
-            filiere = FilierePlaceHolder()
-
-        r.course = PlaceholderCourse() # Attach this fake course to the reservation
-        
-        # Add to the map (It will appear in the grid)
-        session_map[(r.day, r.start_hour)] = r
-
-    # 4. Build the Grid Matrix
-    timetable_data = []
-    skip_slots = set()
-
-    for h in hours:
-        row = {'hour': h, 'slots': []}
-        for d in days:
-            if (d, h) in skip_slots:
-                row['slots'].append({'type': 'skipped'})
-                continue
-
-            session = session_map.get((d, h))
-            
-            if session:
-                duration = session.end_hour - session.start_hour
-                for i in range(1, duration):
-                    skip_slots.add((d, h + i))
-                
-                row['slots'].append({
-                    'type': 'session',
-                    'session': session,
-                    'rowspan': duration
-                })
-            else:
-                row['slots'].append({'type': 'empty'})
-        
-        timetable_data.append(row)
+    today_entries = get_week_index(timetable['version']).today('teacher', request.user.id, today_name)
+
+    # Next class today: official sessions first, then reservations
+    upcoming = sorted(
+        (e for e in today_entries if e['start_hour'] >= now.hour),
+        key=lambda e: (e['kind'] != 'session', e['start_hour'])
+    )
 
     context = {
-        'timetable_data': timetable_data,
-        'days': days,
-        'next_class': next_class,
-        'today_sessions_count': today_sessions_count,
-        'sessions_count': total_sessions,
-        'weekly_hours': weekly_hours,
+        'timetable_data': timetable['rows'],
+        'days': timetable['days'],
+        'next_class': upcoming[0] if upcoming else None,
+        'today_sessions_count': len(today_entries),
+        'sessions_count': len(entries),
+        'weekly_hours': sum(e['end_hour'] - e['start_hour'] for e in entries),
         'user_name': request.user.get_full_name() or request.user.username,
+        'calendar_url': ical.feed_url(request, 'teacher', request.user.id),
     }
     return render(request, 'scheduler/teacher_timetable.html', context)
 
@@ -206,100 +121,117 @@ def student_timetable(request):
             'error': 'You are not assigned to any group.'
         })
 
-    # Get sessions
-    sessions = ScheduledSession.objects.filter(
-        Q(course__group=student_group) | 
-        Q(course__filiere=student_group.filiere, course__group__isnull=True)
-    ).select_related('course', 'room', 'course__teacher', 'course__filiere').order_by('day', 'start_hour')
+    # Group sessions + CMs of the filière, cached until the timetable changes
+    timetable = get_grid('group', student_group.id)
+    entries = timetable['entries']
+    days = timetable['days']
 
-    # Prepare data structure
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    hours = range(8, 19)
-    
-    session_map = {}
-    for s in sessions:
-        session_map[(s.day, s.start_hour)] = s
-    
-    skip_slots = set()
-    timetable_data = []
-    
-    for h in hours:
-        row = {'hour': h, 'slots': []}
-        for d in days:
-            if (d, h) in skip_slots:
-                row['slots'].append({'type': 'skipped'})
-                continue
-
-            session = session_map.get((d, h))
-            
-            if session:
-                duration = session.end_hour - session.start_hour
-                for i in range(1, duration):
-                    skip_slots.add((d, h + i))
-                
-                row['slots'].append({
-                    'type': 'session',
-                    'session': session,
-                    'rowspan': duration
-                })
-            else:
-                row['slots'].append({'type': 'empty'})
-        
-        timetable_data.append(row)
-    
-    # Calculate stats
-    total_sessions = sessions.count()
-    weekly_hours = sum([(s.end_hour - s.start_hour) for s in sessions])
-    
-    # Find next class
-    today_name = datetime.now().strftime('%A')
-    current_hour = datetime.now().hour
-    
-    next_class = sessions.filter(day=today_name, start_hour__gte=current_hour).order_by('start_hour').first()
-    if not next_class:
-        next_day_index = (days.index(today_name) + 1) % len(days) if today_name in days else 0
-        next_class = sessions.filter(day=days[next_day_index]).order_by('start_hour').first()
-    
-    today_sessions_count = sessions.filter(day=today_name).count()
+    # Next class from the week index (wraps to next week after the last class)
+    now = datetime.now()
+    today_name = now.strftime('%A')
+    index = get_week_index(timetable['version'])
+    next_class = index.next_class('group', student_group.id, today_name, now.hour)
 
     context = {
-        'timetable_data': timetable_data,
+        'timetable_data': timetable['rows'],
         'days': days,
-        'hours': hours,
+        'hours': HOURS,
         'next_class': next_class,
-        'today_sessions_count': today_sessions_count,
-        'total_sessions': total_sessions,
-        'weekly_hours': weekly_hours,
+        'today_sessions_count': len(index.today('group', student_group.id, today_name)),
+        'total_sessions': len(entries),
+        'weekly_hours': sum(e['end_hour'] - e['start_hour'] for e in entries),
         'student_group': student_group,
         'student_name': request.user.get_full_name() or request.user.username,
+        'calendar_url': ical.feed_url(request, 'group', student_group.id),
     }
     
     return render(request, 'scheduler/student_timetable.html', context)
 
 
+# Time budget of the optimisation pass started from the dashboard
+OPTIMISE_SECONDS = 5
+
+
 @login_required
 def generate_timetable(request):
+    """Queue a generation job; the run_generation_worker command runs it in the background"""
     # Security: Ensure only Admins can do this
     if not request.user.is_authenticated or request.user.role != 'A': 
         messages.error(request, "Accès refusé.")
         return redirect('login')
 
-    # 1. Clear existing schedule
-    ScheduledSession.objects.all().delete()
+    # Solver picked on the dashboard, greedy by default
+    solver = request.GET.get('solver', 'greedy')
+    if solver not in SOLVERS:
+        messages.error(request, f"Solveur inconnu : {solver}")
+        return redirect('admin_dashboard')
 
-    # 2. Trigger the Algorithm
-    algo = TimetableAlgorithm()
-    unscheduled = algo.generate_timetable()
+    # Incremental mode: only re-place the sessions invalidated by recent changes
+    if request.GET.get('mode') == 'incremental':
+        options = {'mode': 'incremental'}
+    else:
+        # Optional soft-constraint optimisation pass
+        optimise_seconds = OPTIMISE_SECONDS if request.GET.get('optimise') else 0
+        options = {'solver': solver, 'optimise_seconds': optimise_seconds}
 
-    # 3. Success/Warning message
-    if not unscheduled:
-        messages.success(request, "L'emploi du temps a été généré avec succès !")
+    job, created = enqueue_generation(request.user, **options)
+    if created:
+        messages.success(request, "Génération lancée en arrière-plan.")
     else:
-        messages.warning(request, f"Généré, mais impossible de placer : {', '.join(unscheduled)}")
+        messages.warning(request, "Une génération est déjà en cours.")
 
     return redirect('admin_dashboard')
 
 
+@login_required
+def generation_status(request, job_id):
+    """Lightweight JSON progress of a generation job (polled by the dashboard)"""
+    if request.user.role != 'A':
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    job = get_object_or_404(GenerationJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'done': job.progress_done,
+        'total': job.progress_total,
+        'percent': job.progress_percent,
+        'message': job.message,
+    })
+
+
+@require_POST
+@login_required
+def cancel_generation(request, job_id):
+    if request.user.role != 'A':
+        messages.error(request, "Accès refusé.")
+        return redirect('login')
+
+    job = get_object_or_404(GenerationJob, id=job_id)
+    request_cancel(job)
+    messages.warning(request, "Annulation demandée.")
+    return redirect('admin_dashboard')
+
+
+@login_required
+def query_stats(request):
+    """SQL instrumentation aggregates per view (QueryBudgetMiddleware)"""
+    if request.user.role != 'A':
+        messages.error(request, "Accès refusé.")
+        return redirect('login')
+
+    if request.method == 'POST':
+        reset_stats()
+        messages.success(request, "Statistiques réinitialisées.")
+        return redirect('query_stats')
+
+    return render(request, 'scheduler/query_stats.html', {
+        'rows': get_stats(),
+        'enabled': settings.QUERY_INSTRUMENTATION,
+    })
+
+
 @login_required
 def make_reservation(request):
     """Permet à un prof de faire une demande"""
@@ -323,19 +255,28 @@ def make_reservation(request):
 @login_required
 def approve_reservations(request):
     """Liste les demandes en attente pour l'admin"""
-    requests = ReservationRequest.objects.filter(status='PENDING')
+    requests = ReservationRequest.objects.filter(status='PENDING').select_related('teacher', 'room')
     return render(request, 'scheduler/approve_reservations.html', {'requests': requests})
 
 
 @login_required
+@require_POST
 def process_request(request, req_id, action):
-    """Traite l'action Accepter ou Refuser"""
+    """Traite l'action Accepter ou Refuser (l'acceptation vérifie les conflits)"""
+    if request.user.role != 'A':
+        messages.error(request, "Accès refusé.")
+        return redirect('dashboard')
+
     reservation = get_object_or_404(ReservationRequest, id=req_id)
-    
+
     if action == 'approve':
-        reservation.status = 'APPROVED'
-        reservation.save()
-        messages.success(request, "Réservation approuvée.")
+        decisions = approve_pending([reservation.id])
+        if not decisions:
+            messages.warning(request, "Cette demande a déjà été traitée.")
+        elif decisions[0].approved:
+            messages.success(request, "Réservation approuvée.")
+        else:
+            messages.error(request, f"Réservation rejetée : {decisions[0].reason}")
     elif action == 'reject':
         reservation.status = 'REJECTED'
         reservation.save()
@@ -344,6 +285,25 @@ def process_request(request, req_id, action):
     return redirect('approve_reservations')
 
 
+@login_required
+@require_POST
+def approve_all_reservations(request):
+    """Approuve en une fois toutes les demandes compatibles, rejette les autres avec leur motif"""
+    if request.user.role != 'A':
+        messages.error(request, "Accès refusé.")
+        return redirect('dashboard')
+
+    decisions = approve_pending()
+    rejected = [d for d in decisions if not d.approved]
+    messages.success(request, f"{len(decisions) - len(rejected)} réservation(s) approuvée(s), {len(rejected)} rejetée(s).")
+    for decision in rejected[:MAX_REJECTION_MESSAGES]:
+        r = decision.reservation
+        messages.warning(request, f"#{r.id} {r.room.name} {r.day} {r.start_hour}h-{r.end_hour}h : {decision.reason}")
+    if len(rejected) > MAX_REJECTION_MESSAGES:
+        messages.warning(request, f"... et {len(rejected) - MAX_REJECTION_MESSAGES} autre(s) rejet(s).")
+    return redirect('approve_reservations')
+
+
 def teacher_list(request):
     teachers = User.objects.filter(role='T')
     return render(request, 'scheduler/teacher_list.html', {'teachers': teachers})
@@ -367,81 +327,70 @@ def timetable_view(request):
     filieres = Filiere.objects.all().order_by('level', 'code')
     
     # 2. Get selected filière or show all
-    selected_filiere_id = request.GET.get('filiere')
     selected_filiere = None
-    
+    selected_filiere_id = request.GET.get('filiere')
     if selected_filiere_id:
-        try:
-            selected_filiere = Filiere.objects.get(id=selected_filiere_id)
-            sessions = ScheduledSession.objects.filter(
-                course__filiere=selected_filiere
-            ).select_related('course', 'room', 'course__teacher', 'course__filiere', 'course__group')
-        except Filiere.DoesNotExist:
-            sessions = ScheduledSession.objects.all().select_related(
-                'course', 'room', 'course__teacher', 'course__filiere', 'course__group'
-            )
-    else:
-        sessions = ScheduledSession.objects.all().select_related(
-            'course', 'room', 'course__teacher', 'course__filiere', 'course__group'
-        )
-    
-    # 3. Days and hours
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-    hours = range(8, 19)
-    
-    # 4. Create session map
-    session_map = {}
-    skip_slots = set()
-    
-    for session in sessions:
-        session_map[(session.day, session.start_hour)] = session
-    
-    # 5. Build timetable grid
-    timetable_data = []
-    for h in hours:
-        row = {'hour': h, 'slots': []}
-        for d in days:
-            if (d, h) in skip_slots:
-                row['slots'].append({'type': 'skipped'})
-                continue
-            
-            session = session_map.get((d, h))
-            
-            if session:
-                duration = session.end_hour - session.start_hour
-                for i in range(1, duration):
-                    skip_slots.add((d, h + i))
-                
-                row['slots'].append({
-                    'type': 'session',
-                    'session': session,
-                    'rowspan': duration
-                })
-            else:
-                row['slots'].append({'type': 'empty'})
-        
-        timetable_data.append(row)
-    
-    # 6. Calculate stats
-    total_sessions = sessions.count()
-    weekly_hours = sum([(s.end_hour - s.start_hour) for s in sessions])
+        selected_filiere = Filiere.objects.filter(id=selected_filiere_id).first()
+
+    # 3. Shared grid, cached until the timetable changes
+    timetable = get_grid('filiere', selected_filiere.id if selected_filiere else ALL_FILIERES)
+    entries = timetable['entries']
+
+    # 4. Calculate stats
     today_name = datetime.now().strftime('%A')
-    today_sessions_count = sessions.filter(day=today_name).count()
-    
+
     context = {
         'filieres': filieres,
         'selected_filiere': selected_filiere,
-        'timetable_data': timetable_data,
-        'days': days,
-        'hours': hours,
-        'total_sessions': total_sessions,
-        'weekly_hours': weekly_hours,
-        'today_sessions_count': today_sessions_count,
+        'timetable_data': timetable['rows'],
+        'days': timetable['days'],
+        'hours': HOURS,
+        'total_sessions': len(entries),
+        'weekly_hours': sum(e['end_hour'] - e['start_hour'] for e in entries),
+        'today_sessions_count': sum(1 for e in entries if e['day'] == today_name),
     }
     
     return render(request, 'scheduler/timetable.html', context)
 
 
+# Invalid rows listed on the import page (the count is always shown)
+MAX_IMPORT_ERRORS = 50
+
+
+@login_required
+def import_data(request):
+    """Import en masse (CSV / Excel) des salles, groupes, enseignants, étudiants et cours"""
+    if request.user.role != 'A':
+        messages.error(request, "Accès refusé.")
+        return redirect('dashboard')
+
+    report = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            report = run_import(
+                form.cleaned_data['kind'], upload, upload.name,
+                dry_run=form.cleaned_data['dry_run'],
+                default_password=form.cleaned_data['default_password'],
+            )
+            if report.committed:
+                messages.success(request, f"Import terminé : {report.created} créé(s), {report.updated} mis à jour.")
+            elif report.ok:
+                messages.info(request, "Simulation terminée : aucune erreur, rien n'a été écrit.")
+            else:
+                messages.error(request, f"{len(report.errors)} ligne(s) invalide(s) : rien n'a été importé.")
+    else:
+        form = ImportForm()
+
+    return render(request, 'scheduler/import_data.html', {
+        'form': form,
+        'report': report,
+        'errors': report.errors[:MAX_IMPORT_ERRORS] if report else [],
+        'importers': IMPORTERS.values(),
+    })
+
+
 def add_teacher(request):
     if request.method == 'POST':
         form = TeacherForm(request.POST)
@@ -456,28 +405,28 @@ def add_teacher(request):
 
 @login_required
 def teacher_dashboard(request):
-    # Get teacher's sessions
-    sessions = ScheduledSession.objects.filter(course__teacher=request.user).select_related('course', 'room')
+    # Get teacher's sessions (from the cached grid, everything below is computed in Python)
+    sessions = [e for e in get_grid('teacher', request.user.id)['entries'] if e['kind'] == 'session']
     
     # Get today's sessions (In English, to match the database)
     now = timezone.localtime()
     today_name = now.strftime('%A') # e.g., "Wednesday"
     
-    todays_sessions = sessions.filter(day=today_name).order_by('start_hour')
+    todays_sessions = [s for s in sessions if s['day'] == today_name]  # already by hour
     # --------------------------
     
     # Get reservation requests
-    my_reqs = ReservationRequest.objects.filter(teacher=request.user).order_by('-id')
+    my_reqs = list(ReservationRequest.objects.filter(teacher=request.user).select_related('room').order_by('-id'))
     
     # Calculate stats
-    total_courses = sessions.values('course').distinct().count()
-    weekly_hours = sum([(s.end_hour - s.start_hour) for s in sessions])
-    pending_requests_count = my_reqs.filter(status='PENDING').count()
+    total_courses = len({s['course_id'] for s in sessions})
+    weekly_hours = sum(s['duration'] for s in sessions)
+    pending_requests_count = sum(1 for r in my_reqs if r.status == 'PENDING')
     
     context = {
         'sessions': sessions,
         'todays_sessions': todays_sessions,
-        'todays_sessions_count': todays_sessions.count(),
+        'todays_sessions_count': len(todays_sessions),
         'my_reqs': my_reqs,
         'total_courses': total_courses,
         'weekly_hours': weekly_hours,
@@ -504,46 +453,18 @@ def student_dashboard(request):
             'error_message': 'No group assigned.'
         })
 
-    # Get sessions (Both TD/TP for the group and CM for the whole filiere)
-    sessions = ScheduledSession.objects.filter(
-        Q(course__group=student_group) | 
-        Q(course__filiere=student_group.filiere, course__session_type='CM')
-    ).select_related('course', 'room', 'course__teacher')
-    for session in sessions:
-    # Calculate how many hours the session lasts
-        session.duration = session.end_hour - session.start_hour
-    # --- ENHANCED NEXT CLASS LOGIC ---
+    # Group sessions + CMs of the filière, from the in-memory week index (no query)
+    index = get_week_index()
+    sessions = index.week('group', student_group.id)
+
+    # --- NEXT CLASS: ongoing or next one, today first then the following days ---
     now = timezone.localtime()
     today_name = now.strftime('%A')
-    current_hour = now.hour
-    
-    # We create an ordered list starting from Today
-    day_sequence = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    # If it's Sunday, we want to start looking from Monday
-    if today_name in day_sequence:
-        start_index = day_sequence.index(today_name)
-        # Reorder list so it starts with today (e.g., [Mon, Tue, Wed...] or [Wed, Thu, Fri... Mon, Tue])
-        ordered_days = day_sequence[start_index:] + day_sequence[:start_index]
-    else:
-        ordered_days = day_sequence # It's Sunday, look from Monday onwards
+    next_class = index.next_class('group', student_group.id, today_name, now.hour, include_ongoing=True)
 
-    next_class = None
     status_label = "NEXT UP"
-
-    for day in ordered_days:
-        if day == today_name:
-            # If checking today, only look for classes that haven't ended yet
-            found = sessions.filter(day=day, end_hour__gt=current_hour).order_by('start_hour').first()
-        else:
-            # If checking a future day, just take the first class of that day
-            found = sessions.filter(day=day).order_by('start_hour').first()
-        
-        if found:
-            next_class = found
-            # Update label if the class is not today
-            if day != today_name:
-                status_label = f"NEXT CLASS: {day.upper()}"
-            break
+    if next_class and next_class['day'] != today_name:
+        status_label = f"NEXT CLASS: {next_class['day'].upper()}"
 
     context = {
         'student_group': student_group,
@@ -553,45 +474,23 @@ def student_dashboard(request):
         'days': days,
         'hours': hours,
         'today_name': today_name,
-        'course_count': sessions.values('course').distinct().count(),
+        'course_count': len({s['course_id'] for s in sessions}),
     }
     return render(request, 'scheduler/student_dashboard.html', context)
 
 @login_required
 def export_timetable_csv(request):
-    """Generates a CSV file of the timetable for Excel export"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="university_timetable.xl"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Course Name', 'Teacher', 'Room', 'Day', 'Start Time', 'End Time'])
-
-    # Determine data based on user role
-    if request.user.role == 'A':
-        sessions = ScheduledSession.objects.all().select_related('course', 'room', 'course__teacher')
-    elif request.user.role == 'T':
-        sessions = ScheduledSession.objects.filter(course__teacher=request.user).select_related('course', 'room')
-    else:
-        sessions = ScheduledSession.objects.filter(course__group_name=request.user.student_group).select_related('course', 'room')
-
-    # Fill CSV
-    for session in sessions:
-        writer.writerow([
-            session.course.name,
-            session.course.teacher.username,
-            session.room.name,
-            session.day,
-            f"{session.start_hour}:00",
-            f"{session.end_hour}:00"
-        ])
-
+    """Streams the timetable as CSV (constant memory, whatever the number of sessions)"""
+    rows = timetable_rows(request.user, request.GET.get('filiere'))
+    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="university_timetable.csv"'
     return response
 
 
 @login_required
 def my_reservations(request):
     """Teacher views their own reservation history"""
-    my_reqs = ReservationRequest.objects.filter(teacher=request.user).order_by('-id')
+    my_reqs = ReservationRequest.objects.filter(teacher=request.user).select_related('room').order_by('-id')
     return render(request, 'scheduler/my_reservations.html', {'my_reqs': my_reqs})
 
 
@@ -627,8 +526,14 @@ def add_session(request):
     if request.method == 'POST':
         form = SessionForm(request.POST)
         if form.is_valid():
-            form.save()
-            return redirect('timetable') 
+            try:
+                with transaction.atomic():
+                    form.save()
+            except IntegrityError:
+                # PostgreSQL exclusion constraint: booked by someone else since the form was validated
+                form.add_error(None, "La salle vient d'être occupée à ce créneau.")
+            else:
+                return redirect('timetable')
     else:
         form = SessionForm()
     
@@ -661,46 +566,53 @@ def delete_teacher(request, teacher_id):
 
 @login_required
 def find_rooms(request):
-    """Search for available rooms"""
+    """
+    Search for available rooms, from the in-memory occupancy matrix:
+    free rooms for a day and time range, or with a duration only, the
+    first slot of the week (from now) where a room is free that long.
+    """
     available_rooms = []
+    first_slot = None
     search_performed = False
-    
+    form = RoomSearchForm(request.GET or None)
+    day = start_hour = end_hour = None
+
     if request.method == 'GET' and any(request.GET.values()):
         search_performed = True
-        day = request.GET.get('day')
-        start_hour = request.GET.get('start_hour')
-        end_hour = request.GET.get('end_hour')
-        min_capacity = request.GET.get('min_capacity')
-        
-        rooms = Room.objects.all()
-        
-        if min_capacity:
-            rooms = rooms.filter(capacity__gte=int(min_capacity))
-        
-        if day and start_hour and end_hour:
-            occupied_by_sessions = ScheduledSession.objects.filter(
-                day=day,
-                start_hour__lt=int(end_hour),
-                end_hour__gt=int(start_hour)
-            ).values_list('room_id', flat=True)
-            
-            occupied_by_reservations = ReservationRequest.objects.filter(
-                day=day,
-                status='APPROVED',
-                start_hour__lt=int(end_hour),
-                end_hour__gt=int(start_hour)
-            ).values_list('room_id', flat=True)
-            
-            occupied_room_ids = set(occupied_by_sessions) | set(occupied_by_reservations)
-            available_rooms = rooms.exclude(id__in=occupied_room_ids)
-        else:
-            available_rooms = rooms
-    
+        # An invalid search (hours out of range, end before start) finds nothing
+        if form.is_valid():
+            day = form.cleaned_data['day']
+            start_hour = form.cleaned_data['start_hour']
+            end_hour = form.cleaned_data['end_hour']
+            duration = form.cleaned_data['duration']
+            min_capacity = form.cleaned_data['min_capacity'] or 0
+
+            occupancy = get_occupancy()
+            if day and start_hour is not None and end_hour is not None:
+                available_rooms = occupancy.free_rooms([(day, start_hour, end_hour)], min_capacity)
+            elif duration:
+                # From the next hour if today is searched, else from next week
+                now = datetime.now()
+                today = now.strftime('%A')
+                days = [day] if day else GRID_DAYS
+                after = (today, now.hour + 1) if today in days else None
+                first_slot = occupancy.first_available(duration, min_capacity, days, after)
+                if first_slot is None and after:
+                    first_slot = occupancy.first_available(duration, min_capacity, days)
+                if first_slot:
+                    day, start_hour, available_rooms = first_slot
+                    end_hour = start_hour + duration
+            else:
+                available_rooms = occupancy.free_rooms([], min_capacity)
+
     context = {
         'available_rooms': available_rooms,
+        'first_slot': first_slot,
+        'slot': {'day': day, 'start_hour': start_hour, 'end_hour': end_hour} if search_performed else None,
         'search_performed': search_performed,
-        'days': ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
-        'hours': range(8, 19),
+        'form': form,
+        'days': GRID_DAYS,
+        'hours': HOURS,
     }
     return render(request, 'scheduler/find_rooms.html', context)
 
@@ -773,7 +685,7 @@ def settings_view(request):
 
 
 def course_list(request):
-    courses = Course.objects.all()
+    courses = Course.objects.with_student_count().select_related('teacher', 'filiere', 'group__filiere')
     return render(request, 'scheduler/course_list.html', {'courses': courses})
 
 
@@ -803,119 +715,77 @@ def delete_course(request, course_id):
 
 # ============= EXPORT HELPERS =============
 
-def get_filtered_sessions_simple(request):
-    """Simplified version to get sessions"""
+@login_required
+def export_excel(request):
+    """
+    Export timetable as Excel (write-only workbook, served from disk while
+    the published timetable is unchanged). Admins can ask for one sheet
+    per filière with ?per_filiere=1.
+    """
     user = request.user
     selected_filiere_id = request.GET.get('filiere')
-    
-    if user.role == 'A':
-        queryset = ScheduledSession.objects.all()
-        
-        if selected_filiere_id and selected_filiere_id != 'None':
-            queryset = queryset.filter(course__filiere_id=selected_filiere_id)
-            
-    elif user.role == 'T':
-        queryset = ScheduledSession.objects.filter(course__teacher=user)
-        
-        if selected_filiere_id and selected_filiere_id != 'None':
-            queryset = queryset.filter(course__filiere_id=selected_filiere_id)
-            
-    else:
-        if not user.student_group:
-            return ScheduledSession.objects.none()
-        
-        queryset = ScheduledSession.objects.filter(
-            Q(course__group=user.student_group) | 
-            Q(course__filiere=user.student_group.filiere, course__group__isnull=True)
+    filiere = None
+    if selected_filiere_id and selected_filiere_id.isdigit():
+        filiere = Filiere.objects.filter(id=selected_filiere_id).first()
+
+    if user.role == 'A' and request.GET.get('per_filiere'):
+        scope = 'filieres'
+        sheets = (
+            (f.code, scoped_sessions(user, f.id), [f"Filière: {f.name} ({f.code})"])
+            for f in Filiere.objects.order_by('code')
         )
-    
-    return queryset.select_related('course', 'room', 'course__teacher', 'course__filiere', 'course__group')
+    elif user.role in ('A', 'T'):
+        scope = 'all' if user.role == 'A' else f"teacher-{user.id}"
+        info = [f"Enseignant: {user.get_full_name() or user.username}"] if user.role == 'T' else []
+        if filiere:
+            scope += f"-filiere-{filiere.id}"
+            info.append(f"Filière: {filiere.name} ({filiere.code})")
+        sheets = [("Emploi du Temps", scoped_sessions(user, filiere.id if filiere else None), info)]
+    else:
+        scope = f"group-{user.student_group_id}"
+        sheets = [("Emploi du Temps", scoped_sessions(user), [f"Groupe: {user.student_group}"])]
+
+    path = cached_export(scope, 'xlsx', lambda tmp: write_timetable_workbook(tmp, sheets))
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename="emploi_du_temps.xlsx")
 
 
 @login_required
-def export_excel(request):
-    """Export timetable as Excel"""
-    sessions = get_filtered_sessions_simple(request)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Emploi du Temps"
-    
-    # Title
-    ws['A1'] = "EMPLOI DU TEMPS UNIVERSITAIRE"
-    ws['A1'].font = Font(bold=True, size=16, color="366092")
-    
-    # Info
-    ws['A2'] = f"Généré le: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    ws['A3'] = f"Généré par: {request.user.get_full_name() or request.user.username}"
-    ws['A4'] = f"Rôle: {request.user.get_role_display()}"
-    
-    # Add filter info
-    selected_filiere_id = request.GET.get('filiere')
-    if selected_filiere_id and selected_filiere_id != 'None':
-        try:
-            filiere = Filiere.objects.get(id=selected_filiere_id)
-            ws['A5'] = f"Filière: {filiere.name} ({filiere.code})"
-        except:
-            pass
-    
-    # Headers
-    ws['A7'] = "LISTE DES SÉANCES"
-    ws['A7'].font = Font(bold=True, size=14)
-    
-    headers = ["Cours", "Type", "Enseignant", "Salle", "Jour", "Heure début", "Heure fin", "Groupe/Filière"]
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=8, column=col)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="5B9BD5", end_color="5B9BD5", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data rows
-    row = 9
-    for session in sessions:
-        if session.course.group:
-            group_info = f"Groupe: {session.course.group.name}"
-        else:
-            group_info = f"Filière: {session.course.filiere.code}"
-        
-        ws.cell(row=row, column=1, value=session.course.name)
-        ws.cell(row=row, column=2, value=session.course.get_session_type_display())
-        ws.cell(row=row, column=3, value=session.course.teacher.get_full_name() or session.course.teacher.username)
-        ws.cell(row=row, column=4, value=session.room.name)
-        ws.cell(row=row, column=5, value=session.day)
-        ws.cell(row=row, column=6, value=f"{session.start_hour}:00")
-        ws.cell(row=row, column=7, value=f"{session.end_hour}:00")
-        ws.cell(row=row, column=8, value=group_info)
-        
-        # Color by session type
-        fill_color = "FFFFFF"
-        
-        if session.course.session_type == 'CM':
-            fill_color = "E2EFDA"
-        elif session.course.session_type == 'TD':
-            fill_color = "FFF2CC"
-        elif session.course.session_type == 'TP':
-            fill_color = "DDEBF7"
-        
-        for col in range(1, 9):
-            ws.cell(row=row, column=col).fill = PatternFill(
-                start_color=fill_color, end_color=fill_color, fill_type="solid"
-            )
-        
-        row += 1
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        adjusted_width = min(max_length + 2, 30)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="emploi_du_temps.xlsx"'
-    wb.save(response)
-    return response
\ No newline at end of file
+def export_pdf(request):
+    """
+    Weekly timetable grid as PDF: a teacher gets theirs, a student their
+    group's, an admin any ?teacher=, ?group= or ?filiere= (default: every filière).
+    Usually pre-rendered right after the generation, so this is a file read.
+    """
+    user = request.user
+    if user.role == 'T':
+        kind, entity_id = 'teacher', user.id
+    elif user.role == 'S':
+        if not user.student_group_id:
+            messages.error(request, "Vous n'êtes affecté à aucun groupe.")
+            return redirect('student_dashboard')
+        kind, entity_id = 'group', user.student_group_id
+    else:
+        kind = next((k for k in PDF_KINDS if request.GET.get(k) not in (None, '', 'None')), None)
+        entity_id = request.GET.get(kind) if kind else ALL_FILIERES
+        kind = kind or 'filiere'
+        if entity_id != ALL_FILIERES:
+            if not entity_id.isdigit():
+                raise Http404
+            entity_id = int(entity_id)
+
+    try:
+        path = get_timetable_pdf(kind, entity_id)
+    except ObjectDoesNotExist:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f"emploi_du_temps_{kind}.pdf")
+
+
+@condition(etag_func=ical.feed_etag, last_modified_func=ical.feed_last_modified)
+def calendar_feed(request, kind, entity_id, token):
+    """
+    iCalendar feed of a teacher or a group. No login: calendar clients
+    can't log in, the signed token in the URL is the credential.
+    """
+    if not ical.valid_token(kind, entity_id, token):
+        raise Http404
+    return HttpResponse(ical.get_feed(request, kind, entity_id), content_type='text/calendar; charset=utf-8')
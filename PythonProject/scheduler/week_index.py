@@ -0,0 +1,133 @@
+"""
+Week index: every group's and teacher's sessions of the published timetable,
+held in memory and sorted by (day, start hour), so "today's sessions" and
+"next class after now" are a bisect instead of one query per day.
+
+The index is rebuilt (2 queries, on the TimetableEntry table) when the published
+version changes, or when invalidate() bumps the revision stored in the
+'revisions' cache (in-place edits, see signals.py).
+"""
+import threading
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import caches
+from django.utils import timezone
+
+from .grid import DAYS, entry_dicts
+from .models import StudentGroup, TimetableEntry, TimetableVersion
+
+
+REVISION_KEY = 'week_index:revision'
+REVISED_AT_KEY = 'week_index:revised_at'
+
+
+def _position(day, hour):
+    return DAYS.index(day) * 24 + hour if day in DAYS else len(DAYS) * 24 + hour
+
+
+class WeekIndex:
+    """(kind, id) -> entries sorted by (day, start hour), kind is 'group' or 'teacher'"""
+
+    def __init__(self, entries_by_entity):
+        self._entries = {}
+        self._positions = {}
+        for key, entries in entries_by_entity.items():
+            # Stable sort: a reservation stays after a session starting at the same time
+            entries = sorted(entries, key=lambda e: _position(e['day'], e['start_hour']))
+            self._entries[key] = entries
+            self._positions[key] = [_position(e['day'], e['start_hour']) for e in entries]
+
+    def week(self, kind, entity_id):
+        return self._entries.get((kind, entity_id), [])
+
+    def today(self, kind, entity_id, day):
+        """Sessions of `day`, by start hour"""
+        if day not in DAYS:
+            return []
+        positions = self._positions.get((kind, entity_id), [])
+        start = bisect_left(positions, _position(day, 0))
+        end = bisect_left(positions, _position(day, 24))
+        return self.week(kind, entity_id)[start:end]
+
+    def next_class(self, kind, entity_id, day, hour, include_ongoing=False):
+        """
+        First session starting at or after day/hour, wrapping to the start of
+        the week (on Sunday: Monday's first class). With include_ongoing, a
+        session that started but has not ended yet counts as the next one.
+        """
+        entries = self.week(kind, entity_id)
+        if not entries:
+            return None
+
+        if include_ongoing:
+            for entry in self.today(kind, entity_id, day):
+                if entry['start_hour'] < hour < entry['end_hour']:
+                    return entry
+
+        positions = self._positions[(kind, entity_id)]
+        now = _position(day, hour) if day in DAYS else 0
+        i = bisect_left(positions, now)
+        return entries[i] if i < len(entries) else entries[0]
+
+    @classmethod
+    def build(cls):
+        """Index of the published timetable (sessions + approved reservations)"""
+        entries = defaultdict(list)
+        group_ids = defaultdict(list)
+        for group_id, filiere_id in StudentGroup.objects.values_list('id', 'filiere_id'):
+            group_ids[filiere_id].append(group_id)
+
+        for entry in entry_dicts(TimetableEntry.objects.all()):
+            entries[('teacher', entry['teacher_id'])].append(entry)
+            if entry['kind'] != 'session':
+                continue
+            # A session without group (CM) is attended by every group of the filière
+            for group_id in [entry['group_id']] if entry['group_id'] else group_ids[entry['filiere_id']]:
+                entries[('group', group_id)].append(entry)
+
+        return cls(entries)
+
+
+# ============= PROCESS-WIDE INSTANCE =============
+
+_index = None
+_token = None
+_lock = threading.Lock()
+
+
+def get_week_index(version_id=None):
+    """
+    The index of the published timetable, rebuilt if it changed since the last call.
+    Pass the published version id if the caller already knows it (saves a query).
+    """
+    global _index, _token
+    if version_id is None:
+        version_id = TimetableVersion.current_id()
+    token = (version_id, revision())
+    with _lock:
+        if _index is None or token != _token:
+            _index, _token = WeekIndex.build(), token
+        return _index
+
+
+def revision():
+    """Changes on every in-place edit of the published timetable"""
+    value = caches['revisions'].get(REVISION_KEY)
+    if value is None:
+        # First use, or the cache files were removed: a new revision, never
+        # one that exports or feeds cached before may already be keyed on
+        invalidate()
+        value = caches['revisions'].get(REVISION_KEY)
+    return value
+
+
+def revised_at():
+    """When the revision last changed"""
+    return caches['revisions'].get(REVISED_AT_KEY)
+
+
+def invalidate():
+    """Make every process rebuild its index on next use (in-place timetable edits)"""
+    caches['revisions'].set_many({REVISION_KEY: uuid.uuid4().hex, REVISED_AT_KEY: timezone.now()}, None)